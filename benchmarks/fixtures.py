@@ -0,0 +1,85 @@
+"""Synthetic audio, video and transcript fixtures for the benchmarks."""
+import shutil
+import subprocess
+import wave
+from pathlib import Path
+import numpy as np
+from .stub_server import synthetic_text
+
+def speech_like_wav(path: Path, seconds: float, sample_rate: int = 16000, channels: int = 1,
+                    phrase_seconds: float = 6.0, pause_seconds: float = 0.8, long_pause_every: int = 10) -> Path:
+    """
+    Write a 16-bit WAV file of noise bursts separated by pauses, like recorded speech.
+
+    Every `long_pause_every` phrases the pause is five seconds long, which gives the
+    silence-aware splitter something to skip. The file is written in one-second blocks
+    so long fixtures do not need much memory.
+
+    Args:
+        path (Path): Where to write the file.
+        seconds (float): Length of the recording.
+        sample_rate (int): Sample rate in Hz.
+        channels (int): Number of channels.
+        phrase_seconds (float): Length of each burst.
+        pause_seconds (float): Length of the short pauses.
+        long_pause_every (int): How many phrases come between long pauses.
+
+    Returns:
+        Path: The path of the written file.
+    """
+    rng = np.random.default_rng(0)
+    period = phrase_seconds + pause_seconds
+    with wave.open(str(path), 'wb') as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        for start in range(int(np.ceil(seconds))):
+            n = int(min(1.0, seconds - start) * sample_rate)
+            t = start + np.arange(n) / sample_rate
+            phrase = (t // period).astype(int)
+            in_phrase = (t % period) < phrase_seconds
+            long_pause = (phrase % long_pause_every == long_pause_every - 1) & ((t % period) > phrase_seconds * 0.2)
+            loud = in_phrase & ~long_pause
+            samples = rng.normal(0, 0.2, n) * loud + rng.normal(0, 0.001, n)
+            pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+            out.writeframes(np.repeat(pcm, channels).tobytes())
+    return path
+
+def has_ffmpeg() -> bool:
+    """Return whether FFmpeg and FFprobe are on the PATH."""
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+def video_fixture(path: Path, seconds: float) -> Path:
+    """
+    Generate a small test video with a tone as its audio track, using FFmpeg.
+
+    Args:
+        path (Path): Where to write the video (e.g. an .mp4 file).
+        seconds (float): Length of the video.
+
+    Returns:
+        Path: The path of the written file.
+    """
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc=size=160x120:rate=5:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-b:a', '96k', '-shortest', str(path),
+    ], check=True)
+    return path
+
+def transcript_fixture(path: Path, words: int, paragraph_words: int = 250) -> Path:
+    """
+    Write a synthetic markdown transcript of about `words` words in paragraphs.
+
+    Args:
+        path (Path): Where to write the transcript.
+        words (int): Number of words.
+        paragraph_words (int): Words per paragraph.
+
+    Returns:
+        Path: The path of the written file.
+    """
+    paragraphs = [synthetic_text(min(paragraph_words, words - i)) for i in range(0, words, paragraph_words)]
+    path.write_text(f"# Transcription: {path.stem}\n\n" + "\n\n".join(paragraphs))
+    return path
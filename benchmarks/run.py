@@ -0,0 +1,324 @@
+"""
+Benchmark the transcriber end to end against local stub API servers.
+
+Run from the repository root:
+
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Each benchmark runs in its own process so its peak RSS is measured on its own. A
+benchmark whose requirements are missing (FFmpeg for extraction, the tiktoken encoding
+for chunking) is reported as skipped instead of failing the run.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+import click
+from .fixtures import has_ffmpeg, speech_like_wav, transcript_fixture, video_fixture
+from .stub_server import StubServer, StubSettings
+
+# (quick, full) sizes of the generated fixtures
+SIZES = {
+    'audio_seconds': (600, 3600),
+    'transcript_words': (50000, 400000),
+    'videos': (4, 16),
+    'video_seconds': (30, 120),
+    'pipeline_files': (3, 12),
+    'pipeline_seconds': (180, 600),
+}
+
+HIGHER_IS_BETTER = ('_per_second', '_per_hour', 'x_realtime')
+
+def _size(name: str, quick: bool) -> int:
+    return SIZES[name][0 if quick else 1]
+
+def _benchmark_config(workdir: Path, **overrides):
+    """A configuration for benchmark runs: stub keys, no daily limits, a private cache."""
+    from transcriber.config import Config
+    options = dict(
+        openai_api_key='stub-key', anthropic_api_key='stub-key', openrouter_api_key='stub-key',
+        use_openrouter=False, output_dir=workdir / 'output', instructions_dir=workdir,
+        claude_model='claude-sonnet-4-5', openrouter_claude_model='anthropic/claude-sonnet-4.5',
+        max_tokens=4000, temperature=0.0,
+        requests_per_minute=100000, tokens_per_minute=100000000,
+        daily_limits={}, cache_dir=workdir / 'cache',
+    )
+    options.update(overrides)
+    return Config(**options)
+
+def bench_split_audio(workdir: Path, quick: bool, silence: bool = False) -> dict:
+    """Split a long WAV recording into one-minute chunks."""
+    from transcriber.audio_processing import split_audio
+    from transcriber.silence import split_audio_on_silence
+
+    seconds = _size('audio_seconds', quick)
+    audio = speech_like_wav(workdir / 'speech.wav', seconds)
+    split = split_audio_on_silence if silence else split_audio
+    chunks = 0
+    start = time.perf_counter()
+    for chunk in split(audio, 60000):
+        chunks += 1
+        os.remove(chunk)
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'chunks': chunks,
+        'chunks_per_second': chunks / elapsed,
+        'x_realtime': seconds / elapsed,
+    }
+
+def bench_split_audio_on_silence(workdir: Path, quick: bool) -> dict:
+    """Split a long WAV recording at pauses, leaving out long silences."""
+    return bench_split_audio(workdir, quick, silence=True)
+
+def bench_split_into_chunks(workdir: Path, quick: bool) -> dict:
+    """Tokenize a long transcript and cut it into refinement chunks, cold and memoized."""
+    from transcriber.token_utils import Tokenizer
+
+    words = _size('transcript_words', quick)
+    text = transcript_fixture(workdir / 'transcript.md', words).read_text()
+    tokenizer = Tokenizer()
+    try:
+        tokenizer.encoding
+    except Exception as e:
+        return {'skipped': f"tiktoken encoding unavailable ({str(e)})"}
+    start = time.perf_counter()
+    chunks = tokenizer.chunk(text, 4000, overlap=100)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    tokenizer.chunk(text, 4000, overlap=100)
+    warm = time.perf_counter() - start
+    return {
+        'seconds': cold,
+        'warm_seconds': warm,
+        'chunks': len(chunks),
+        'chunks_per_second': len(chunks) / cold,
+        'tokens_per_second': chunks[-1].end_token / cold,
+    }
+
+def bench_extraction(workdir: Path, quick: bool) -> dict:
+    """Extract WAV audio from several videos at once with the FFmpeg pool."""
+    if not has_ffmpeg():
+        return {'skipped': 'ffmpeg not found'}
+    from transcriber.audio_processing import FFmpegPool
+
+    seconds = _size('video_seconds', quick)
+    videos = [video_fixture(workdir / f'video_{i}.mp4', seconds) for i in range(_size('videos', quick))]
+    pool = FFmpegPool()
+
+    async def extract_all():
+        await asyncio.gather(*(pool.convert(video, video.with_suffix('.wav'), 16000, 1) for video in videos))
+
+    start = time.perf_counter()
+    asyncio.run(extract_all())
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'files': len(videos),
+        'files_per_hour': len(videos) * 3600 / elapsed,
+        'x_realtime': len(videos) * seconds / elapsed,
+        'processes': pool.processes,
+    }
+
+def bench_pipeline(workdir: Path, quick: bool, settings: StubSettings = None) -> dict:
+    """Run the full directory pipeline on WAV recordings against the stub servers."""
+    from transcriber import pipeline
+
+    files = _size('pipeline_files', quick)
+    seconds = _size('pipeline_seconds', quick)
+    source = workdir / 'media'
+    source.mkdir()
+    inputs = [speech_like_wav(source / f'lecture_{i}.wav', seconds) for i in range(files)]
+    instructions = workdir / 'instructions.md'
+    instructions.write_text('Fix punctuation and split the text into paragraphs.')
+    config = _benchmark_config(workdir, audio_extraction='wav', chunk_seconds=60)
+    config.output_dir.mkdir()
+
+    stage_seconds = {'extract': 0.0, 'transcribe': 0.0, 'refine': 0.0}
+
+    def timed(stage: str, function):
+        if asyncio.iscoroutinefunction(function):
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    stage_seconds[stage] += time.perf_counter() - start
+        else:
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    stage_seconds[stage] += time.perf_counter() - start
+        return wrapper
+
+    pipeline.extract_media_audio_async = timed('extract', pipeline.extract_media_audio_async)
+    pipeline.process_audio_file = timed('transcribe', pipeline.process_audio_file)
+    pipeline.process_with_refinement = timed('refine', pipeline.process_with_refinement)
+
+    with StubServer(settings) as server:
+        os.environ.update(server.environment())
+        start = time.perf_counter()
+        asyncio.run(pipeline.run_pipeline(inputs, config.output_dir, instructions, config))
+        elapsed = time.perf_counter() - start
+        stats = server.stats.as_dict()
+
+    chunks = stats['requests'].get('/v1/audio/transcriptions', 0)
+    completed = len(list(config.output_dir.glob('*_refined.md')))  # Failed files do not count towards throughput
+    result = {
+        'seconds': elapsed,
+        'files': files,
+        'failed': files - completed,
+        'files_per_hour': completed * 3600 / elapsed,
+        'chunks': chunks,
+        'chunks_per_second': chunks / elapsed,
+        'x_realtime': completed * seconds / elapsed,
+        'requests': stats['requests'],
+        'throttled': stats['throttled'],
+    }
+    result.update({f'{stage}_stage_seconds': value for stage, value in stage_seconds.items()})
+    return result
+
+BENCHMARKS = {
+    'split_audio': bench_split_audio,
+    'split_audio_on_silence': bench_split_audio_on_silence,
+    'split_into_chunks': bench_split_into_chunks,
+    'extraction': bench_extraction,
+    'pipeline': bench_pipeline,
+}
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, KiB elsewhere
+
+def _child(name: str, quick: bool, settings: StubSettings, results) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix=f'bench_{name}_') as workdir:
+        function = BENCHMARKS[name]
+        try:
+            if name == 'pipeline':
+                result = function(Path(workdir), quick, settings)
+            else:
+                result = function(Path(workdir), quick)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {str(e)}"}
+    if 'skipped' not in result and 'error' not in result:
+        result['peak_rss_mb'] = _peak_rss_mb()
+    results.put(result)
+
+def run_benchmark(name: str, quick: bool, settings: StubSettings) -> dict:
+    """
+    Run one benchmark in a fresh process and return its metrics.
+
+    Args:
+        name (str): A key of BENCHMARKS.
+        quick (bool): Use the small fixture sizes.
+        settings (StubSettings): Behavior of the stub servers for the pipeline benchmark.
+
+    Returns:
+        dict: The metrics, or a 'skipped' or 'error' entry.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_child, args=(name, quick, settings, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {'error': f'benchmark process exited with code {process.exitcode}'}
+    return results.get()
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compare results with a baseline and describe every metric that got worse.
+
+    Metrics ending in '_per_second', '_per_hour' or 'x_realtime' are better when higher;
+    'seconds' and 'peak_rss_mb' metrics are better when lower. Other metrics are not
+    compared.
+
+    Args:
+        results (dict): Metrics per benchmark of this run.
+        baseline (dict): Metrics per benchmark of the saved run.
+        tolerance (float): Allowed relative change before a metric counts as a regression.
+
+    Returns:
+        list[str]: One line per regression.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        saved = baseline.get(name, {})
+        for metric, value in metrics.items():
+            old = saved.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = (old - value) / old
+            elif metric.endswith('seconds') or metric == 'peak_rss_mb':
+                change = (value - old) / old
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f"{name}.{metric}: {old:.3f} -> {value:.3f} ({change:.0%} worse)")
+    return regressions
+
+def _format(value) -> str:
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+@click.command()
+@click.option('--quick', is_flag=True, help='Use small fixtures for a fast run.')
+@click.option('--only', multiple=True, type=click.Choice(list(BENCHMARKS)), help='Run only these benchmarks.')
+@click.option('--latency', type=float, default=0.05, show_default=True, help='Stub API latency in seconds.')
+@click.option('--rate-limit-every', type=int, default=0, help='Answer every Nth stub request with HTTP 429.')
+@click.option('--transcript-words', type=int, default=150, show_default=True, help='Words per stub Whisper response.')
+@click.option('--completion-words', type=int, default=400, show_default=True, help='Words per stub completion.')
+@click.option('--output', type=click.Path(path_type=Path), help='Write the results as JSON to this file.')
+@click.option('--save-baseline', type=click.Path(path_type=Path), help='Save the results as the new baseline.')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, path_type=Path), help='Compare with a saved baseline.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True, help='Allowed relative regression.')
+def main(quick, only, latency, rate_limit_every, transcript_words, completion_words, output, save_baseline,
+         baseline_path, tolerance):
+    """Run the benchmarks and print their metrics."""
+    settings = StubSettings(latency, rate_limit_every, transcript_words, completion_words)
+    results = {}
+    for name in only or BENCHMARKS:
+        click.echo(f"Running {name}...")
+        results[name] = run_benchmark(name, quick, settings)
+        for metric, value in results[name].items():
+            click.echo(f"  {metric}: {_format(value)}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'quick': quick,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cores': os.cpu_count(),
+        'stub': settings.__dict__,
+        'results': results,
+    }
+    for path in (output, save_baseline):
+        if path:
+            path.write_text(json.dumps(report, indent=2))
+            click.echo(f"Results written to {path}")
+
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('quick') != quick:
+            click.echo("Warning: the baseline was recorded with different fixture sizes", err=True)
+        regressions = compare(results, baseline['results'], tolerance)
+        for line in regressions:
+            click.echo(f"Regression: {line}", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo("No regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Local stand-ins for the OpenAI, OpenRouter and Anthropic HTTP APIs.
+
+The server answers the endpoints the transcriber calls with synthetic responses after a
+configurable latency, and can reject every Nth request with HTTP 429 to exercise retry
+and rate-limit handling. Point the clients at it with OPENAI_BASE_URL,
+ANTHROPIC_BASE_URL and OPENROUTER_BASE_URL.
+
+The Anthropic Message Batches and OpenAI Batch APIs are emulated too: a job ends after a
+configurable number of status checks, and its results are synthetic completions. Message
+requests with a `cache_control` system prompt report a cache write the first time the
+prompt is seen and cache reads afterwards, as Anthropic's prompt cache does.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "the quick brown fox jumps over the lazy dog while the lecture goes on about transcription".split()
+
+def synthetic_text(words: int) -> str:
+    """Return `words` words of filler text split into sentences."""
+    out = []
+    for i in range(words):
+        out.append(WORDS[i % len(WORDS)] + ('.' if i % 12 == 11 else ''))
+    return ' '.join(out)
+
+@dataclass
+class StubSettings:
+    """How the stub server behaves."""
+    latency: float = 0.05  # Seconds before each response
+    rate_limit_every: int = 0  # Answer every Nth request with 429; 0 never does
+    transcript_words: int = 150  # Words per Whisper response
+    completion_words: int = 400  # Words per chat or Anthropic completion
+    batch_polls: int = 1  # Status checks a batch job stays in progress for
+
+@dataclass
+class StubStats:
+    """Requests the stub server has seen, per endpoint."""
+    requests: dict = field(default_factory=dict)
+    throttled: int = 0
+    bytes_received: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {'requests': dict(self.requests), 'throttled': self.throttled, 'bytes_received': self.bytes_received}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the real APIs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        self._send_bytes(status, json.dumps(body).encode(), 'application/json', headers)
+
+    def _send_lines(self, entries: list):
+        self._send_bytes(200, '\n'.join(json.dumps(entry) for entry in entries).encode(), 'application/jsonl')
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _admit(self):
+        """Read the request body; return it, or None if the request was answered with 429."""
+        settings, stats = self.server.settings, self.server.stats
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length) if length else b''
+        with stats.lock:
+            stats.bytes_received += length
+            total = sum(stats.requests.values()) + stats.throttled + 1
+            throttle = settings.rate_limit_every and total % settings.rate_limit_every == 0
+            if throttle:
+                stats.throttled += 1
+            else:
+                stats.requests[self.path] = stats.requests.get(self.path, 0) + 1
+        time.sleep(settings.latency)
+        if throttle:
+            error = {'type': 'rate_limit_error', 'message': 'Rate limit reached (stub)'}
+            body = {'type': 'error', 'error': error} if self.path.endswith(('/complete', '/messages')) else {'error': error}
+            self._send(429, body, {'retry-after': '0'})
+            return None
+        return data
+
+    def _completion(self) -> tuple:
+        settings = self.server.settings
+        return synthetic_text(settings.completion_words), 1000, settings.completion_words * 4 // 3
+
+    def _chat_completion(self) -> dict:
+        text, usage_in, usage_out = self._completion()
+        return {
+            'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'stub',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': usage_in, 'completion_tokens': usage_out, 'total_tokens': usage_in + usage_out},
+        }
+
+    def _message(self, request: dict = None) -> dict:
+        text, usage_in, usage_out = self._completion()
+        system = (request or {}).get('system')
+        written = read = 0
+        if isinstance(system, list) and any('cache_control' in block for block in system):
+            prefix = ''.join(block.get('text', '') for block in system)
+            with self.server.stats.lock:
+                if prefix in self.server.prompt_cache:
+                    read = len(prefix) // 4
+                else:
+                    self.server.prompt_cache.add(prefix)
+                    written = len(prefix) // 4
+        return {
+            'id': 'msg-stub', 'type': 'message', 'role': 'assistant', 'model': 'stub',
+            'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {
+                'input_tokens': usage_in, 'output_tokens': usage_out,
+                'cache_creation_input_tokens': written, 'cache_read_input_tokens': read,
+            },
+        }
+
+    def _create_batch(self, custom_ids: list) -> str:
+        with self.server.stats.lock:
+            batch_id = f"batch_{next(self.server.ids)}"
+            self.server.batches[batch_id] = {'custom_ids': custom_ids, 'polls': 0}
+        return batch_id
+
+    def _batch_ended(self, batch_id: str) -> bool:
+        with self.server.stats.lock:
+            batch = self.server.batches[batch_id]
+            batch['polls'] += 1
+            return batch['polls'] > self.server.settings.batch_polls
+
+    def do_GET(self):
+        if self._admit() is None:
+            return
+        host, port = self.server.server_address[:2]
+        anthropic_batch = re.fullmatch(r'/v1/messages/batches/(\w+)(/results)?', self.path)
+        openai_batch = re.fullmatch(r'/v1/batches/(\w+)', self.path)
+        openai_results = re.fullmatch(r'/v1/files/file-out-(\w+)/content', self.path)
+        if self.path.endswith('/models'):
+            self._send(200, {'object': 'list', 'data': [{'id': 'whisper-1', 'object': 'model', 'created': 0, 'owned_by': 'stub'}]})
+        elif anthropic_batch and anthropic_batch.group(1) in self.server.batches:
+            batch_id = anthropic_batch.group(1)
+            if anthropic_batch.group(2):
+                self._send_lines([
+                    {'custom_id': custom_id, 'result': {'type': 'succeeded', 'message': self._message()}}
+                    for custom_id in self.server.batches[batch_id]['custom_ids']
+                ])
+            else:
+                self._send(200, {
+                    'id': batch_id, 'type': 'message_batch',
+                    'processing_status': 'ended' if self._batch_ended(batch_id) else 'in_progress',
+                    'results_url': f"http://{host}:{port}/v1/messages/batches/{batch_id}/results",
+                })
+        elif openai_batch and openai_batch.group(1) in self.server.batches:
+            batch_id = openai_batch.group(1)
+            self._send(200, {
+                'id': batch_id, 'object': 'batch',
+                'status': 'completed' if self._batch_ended(batch_id) else 'in_progress',
+                'output_file_id': f"file-out-{batch_id}", 'error_file_id': None,
+            })
+        elif openai_results and openai_results.group(1) in self.server.batches:
+            self._send_lines([
+                {'custom_id': custom_id, 'response': {'status_code': 200, 'body': self._chat_completion()}, 'error': None}
+                for custom_id in self.server.batches[openai_results.group(1)]['custom_ids']
+            ])
+        else:
+            self._send(404, {'error': {'message': f'Unknown endpoint {self.path}'}})
+
+    def do_POST(self):
+        data = self._admit()
+        if data is None:
+            return
+        settings = self.server.settings
+        if self.path.endswith('/messages/batches'):
+            custom_ids = [request['custom_id'] for request in json.loads(data)['requests']]
+            self._send(200, {'id': self._create_batch(custom_ids), 'type': 'message_batch', 'processing_status': 'in_progress'})
+        elif self.path.endswith('/files'):
+            # The multipart upload is not parsed properly; its JSONL lines are easy to spot
+            lines = [json.loads(line) for line in data.decode().splitlines() if line.startswith('{')]
+            with self.server.stats.lock:
+                file_id = f"file-{next(self.server.ids)}"
+                self.server.files[file_id] = [line['custom_id'] for line in lines]
+            self._send(200, {'id': file_id, 'object': 'file', 'purpose': 'batch'})
+        elif self.path.endswith('/batches'):
+            custom_ids = self.server.files[json.loads(data)['input_file_id']]
+            self._send(200, {'id': self._create_batch(custom_ids), 'object': 'batch', 'status': 'validating'})
+        elif self.path.endswith('/audio/transcriptions'):
+            self._send(200, {'text': synthetic_text(settings.transcript_words)})
+        elif self.path.endswith('/chat/completions'):
+            self._send(200, self._chat_completion())
+        elif self.path.endswith('/complete'):
+            text, _, _ = self._completion()
+            self._send(200, {'id': 'compl-stub', 'type': 'completion', 'completion': text, 'stop_reason': 'stop_sequence', 'model': 'stub'})
+        elif self.path.endswith('/messages'):
+            self._send(200, self._message(json.loads(data or b'{}')))
+        else:
+            self._send(404, {'error': {'message': f'Unknown endpoint {self.path}'}})
+
+class StubServer:
+    """A threaded stub API server running in the background."""
+
+    def __init__(self, settings: StubSettings = None, host: str = '127.0.0.1', port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = settings or StubSettings()
+        self.httpd.stats = StubStats()
+        self.httpd.ids = itertools.count(1)
+        self.httpd.batches = {}
+        self.httpd.files = {}
+        self.httpd.prompt_cache = set()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self) -> StubStats:
+        return self.httpd.stats
+
+    def environment(self) -> dict:
+        """Environment variables that point the API clients at this server."""
+        return {
+            'OPENAI_BASE_URL': f"{self.url}/v1",
+            'OPENROUTER_BASE_URL': f"{self.url}/v1",
+            'ANTHROPIC_BASE_URL': self.url,
+            'OPENAI_API_KEY': 'stub-key',
+            'ANTHROPIC_API_KEY': 'stub-key',
+            'OPENROUTER_API_KEY': 'stub-key',
+        }
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
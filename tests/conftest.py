@@ -0,0 +1,16 @@
+import pytest
+from transcriber.config import Config
+
+@pytest.fixture
+def make_config():
+    """Return a factory for test configurations without API keys, limits or waits, writing under `tmp_path`."""
+    def make(tmp_path, **overrides):
+        values = dict(
+            openai_api_key="", anthropic_api_key="", openrouter_api_key="", use_openrouter=False,
+            output_dir=tmp_path, instructions_dir=tmp_path, claude_model="claude-test",
+            openrouter_claude_model="anthropic/claude-test", max_tokens=1000, temperature=0.5,
+            requests_per_minute=6000, tokens_per_minute=10_000_000, batch_poll_seconds=0, cache_dir=tmp_path,
+        )
+        values.update(overrides)
+        return Config(**values)
+    return make
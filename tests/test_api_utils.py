@@ -0,0 +1,50 @@
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from transcriber.api_utils import validate_api_keys
+from transcriber.exceptions import APIKeyError
+
+@pytest.fixture
+def checks():
+    openai_check, anthropic_check = MagicMock(), MagicMock()
+    with patch.dict('transcriber.api_utils.KEY_CHECKS', {
+        'openai': ('OPENAI_API_KEY', openai_check),
+        'anthropic': ('ANTHROPIC_API_KEY', anthropic_check),
+    }):
+        yield openai_check, anthropic_check
+
+def test_only_requested_providers_are_checked(checks, monkeypatch):
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'key')
+    openai_check, anthropic_check = checks
+
+    validate_api_keys({'anthropic'})
+
+    anthropic_check.assert_called_once()
+    openai_check.assert_not_called()
+
+def test_successful_checks_are_cached_until_the_ttl(checks, monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'key')
+    openai_check, _ = checks
+    cache_path = tmp_path / "api_keys.json"
+
+    validate_api_keys({'openai'}, cache_path, ttl_seconds=100, clock=lambda: 1000)
+    validate_api_keys({'openai'}, cache_path, ttl_seconds=100, clock=lambda: 1050)
+    assert openai_check.call_count == 1
+    assert json.loads(cache_path.read_text())['openai']['key'] != 'key'  # Only a hash of the key is stored
+
+    validate_api_keys({'openai'}, cache_path, ttl_seconds=100, clock=lambda: 1200)
+    assert openai_check.call_count == 2
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'new-key')
+    validate_api_keys({'openai'}, cache_path, ttl_seconds=100, clock=lambda: 1210)
+    assert openai_check.call_count == 3
+
+def test_failed_checks_are_not_cached(checks, monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'key')
+    openai_check, _ = checks
+    openai_check.side_effect = APIKeyError("rejected")
+    cache_path = tmp_path / "api_keys.json"
+
+    with pytest.raises(APIKeyError):
+        validate_api_keys({'openai'}, cache_path)
+    assert not cache_path.exists()
@@ -0,0 +1,212 @@
+import asyncio
+import pytest
+from pathlib import Path
+from unittest.mock import patch, MagicMock, AsyncMock
+from transcriber.audio_processing import (
+    _parse_progress, _read_segment_list, FFmpegPool, extract_audio_chunks, split_audio, audio_duration,
+    process_audio_file,
+)
+from transcriber.exceptions import VideoProcessingError
+
+class FakeSegmenter:
+    """Stands in for an FFmpeg segment process that finishes one chunk per progress report."""
+
+    def __init__(self, command, names, fail=False):
+        self.command = command
+        self.list_path = Path(command[command.index('-segment_list') + 1])
+        self.names = list(names)
+        self.returncode = None
+        self.killed = False
+        self.fail = fail
+        self.stdout = self._lines()
+        self.stderr = MagicMock(read=AsyncMock(return_value=b"bad input" if fail else b""))
+
+    async def _lines(self):
+        for i, name in enumerate(self.names):
+            with self.list_path.open('a') as f:
+                f.write(name + "\n")
+            yield f"out_time_us={(i + 1) * 1000000}\n".encode()
+            yield b"progress=continue\n"
+            await asyncio.sleep(0)
+        yield b"progress=end\n"
+
+    def kill(self):
+        self.killed = True
+        self.returncode = -9
+
+    async def wait(self):
+        if self.returncode is None:
+            self.returncode = 1 if self.fail else 0
+        return self.returncode
+
+def test_read_segment_list_waits_for_complete_lines(tmp_path):
+    list_path = tmp_path / "chunks.txt"
+    state = {}
+    assert _read_segment_list(list_path, tmp_path, state) == []
+    list_path.write_text("a.flac\nb.fl")
+    assert _read_segment_list(list_path, tmp_path, state) == [str(tmp_path / "a.flac")]
+    with list_path.open('a') as f:
+        f.write("ac")
+    assert _read_segment_list(list_path, tmp_path, state, final=True) == [str(tmp_path / "b.flac")]
+
+def test_extract_audio_chunks_runs_in_the_pool_and_yields_chunks_as_they_finish(tmp_path):
+    names = [f"talk_chunk_{i:05d}.flac" for i in range(3)]
+    processes = []
+
+    async def fake_exec(*command, **kwargs):
+        processes.append(FakeSegmenter(command, names))
+        return processes[-1]
+
+    async def main():
+        pool = FFmpegPool(processes=1, threads=3)
+
+        def consume():
+            seen = []
+            for chunk in extract_audio_chunks(tmp_path / "talk.mp4", tmp_path, chunk_seconds=30, pool=pool):
+                seen.append(chunk)
+            return seen
+
+        return await asyncio.to_thread(consume)
+
+    with patch('transcriber.audio_processing.asyncio.create_subprocess_exec', side_effect=fake_exec):
+        seen = asyncio.run(main())
+
+    assert seen == [str(tmp_path / name) for name in names]
+    command = processes[0].command
+    assert command[command.index('-threads') + 1] == '3' and '-progress' in command
+    assert not (tmp_path / "talk_chunks.txt").exists()
+
+def test_extract_audio_chunks_reencodes_chunks_over_the_upload_limit(tmp_path):
+    names = [f"talk_chunk_{i:05d}.flac" for i in range(3)]
+    for name, size in zip(names, [900, 1500, 400]):
+        (tmp_path / name).write_bytes(b"\0" * size)
+    commands = []
+
+    async def fake_exec(*command, **kwargs):
+        commands.append(command)
+        if '-segment_list' in command:
+            return FakeSegmenter(command, names)
+        Path(command[-1]).write_bytes(b"\0" * 300)  # The re-encoded chunk
+        return FakeSegmenter([*command, '-segment_list', str(tmp_path / "unused.txt")], [])
+
+    with patch('transcriber.audio_processing.asyncio.create_subprocess_exec', side_effect=fake_exec):
+        seen = list(extract_audio_chunks(tmp_path / "talk.mp4", tmp_path, chunk_seconds=10, max_bytes=1000))
+
+    assert seen == [str(tmp_path / names[0]), str(tmp_path / "talk_chunk_00001_small.ogg"), str(tmp_path / names[2])]
+    assert not (tmp_path / names[1]).exists()
+    shrink = commands[1]
+    assert shrink[shrink.index('-i') + 1] == str(tmp_path / names[1])
+    assert shrink[shrink.index('-b:a') + 1] == '6000'  # 1000 bytes for 10 seconds is below the lowest bitrate
+
+def test_extract_audio_chunks_stops_ffmpeg_when_closed_early(tmp_path):
+    processes = []
+
+    async def fake_exec(*command, **kwargs):
+        processes.append(FakeSegmenter(command, [f"talk_chunk_{i:05d}.flac" for i in range(100)]))
+        return processes[-1]
+
+    with patch('transcriber.audio_processing.asyncio.create_subprocess_exec', side_effect=fake_exec):
+        chunks = extract_audio_chunks(tmp_path / "talk.mp4", tmp_path, threads=2)
+        next(chunks)
+        chunks.close()
+
+    assert processes[0].killed
+
+def test_extract_audio_chunks_reports_ffmpeg_errors(tmp_path):
+    async def fake_exec(*command, **kwargs):
+        return FakeSegmenter(command, [], fail=True)
+
+    with patch('transcriber.audio_processing.asyncio.create_subprocess_exec', side_effect=fake_exec):
+        with pytest.raises(VideoProcessingError, match="bad input"):
+            list(extract_audio_chunks(tmp_path / "talk.mp4", tmp_path))
+
+def test_extract_audio_chunks_rejects_unknown_format(tmp_path):
+    with pytest.raises(VideoProcessingError):
+        list(extract_audio_chunks(tmp_path / "talk.mp4", tmp_path, chunk_format="aiff"))
+
+def write_wav(path, seconds, framerate=8000):
+    import wave
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(framerate)
+        wav_file.writeframes(b"\x01\x00\x02\x00" * int(seconds * framerate))
+
+def test_split_audio_streams_chunks(tmp_path):
+    audio_path = tmp_path / "talk.wav"
+    write_wav(audio_path, 2.5)
+
+    chunks = split_audio(audio_path, chunk_length_ms=1000)
+    first = next(chunks)
+    assert audio_duration(first) == pytest.approx(1.0)
+    assert not Path(f"{audio_path}_chunk_1.wav").exists()  # Later chunks are not written yet
+
+    rest = list(chunks)
+    assert [audio_duration(chunk) for chunk in rest] == pytest.approx([1.0, 0.5])
+
+def test_split_audio_rejects_non_wav(tmp_path):
+    audio_path = tmp_path / "talk.wav"
+    audio_path.write_text("not audio")
+    with pytest.raises(VideoProcessingError):
+        list(split_audio(audio_path))
+
+def test_parse_progress():
+    state = {}
+    lines = ["frame=0", "out_time_us=1500000", "out_time=00:00:01.500000", "progress=continue", "out_time_ms=3000000", "progress=end"]
+    reports = [_parse_progress(line, state) for line in lines]
+    assert [r for r in reports if r is not None] == [1.5, 3.0]
+
+def test_ffmpeg_pool_limits_concurrent_conversions(tmp_path):
+    running = 0
+    peak = 0
+
+    class FakeProcess:
+        returncode = None
+        def __init__(self):
+            self.stdout = self._lines()
+            self.stderr = MagicMock(read=AsyncMock(return_value=b""))
+        async def _lines(self):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            yield b"out_time_us=2000000\n"
+            yield b"progress=end\n"
+            running -= 1
+        async def wait(self):
+            self.returncode = 0
+            return 0
+
+    commands = []
+    async def fake_exec(*command, **kwargs):
+        commands.append(command)
+        return FakeProcess()
+
+    progress = []
+    pool = FFmpegPool(processes=2, threads=3)
+    async def convert_all():
+        await asyncio.gather(*(
+            pool.convert(tmp_path / f"v{i}.mp4", tmp_path / f"v{i}.wav", on_progress=progress.append) for i in range(5)
+        ))
+
+    with patch('transcriber.audio_processing.asyncio.create_subprocess_exec', side_effect=fake_exec):
+        asyncio.run(convert_all())
+
+    assert peak == 2
+    assert progress == [2.0] * 5
+    assert all(command[command.index('-threads') + 1] == '3' for command in commands)
+    assert all('-progress' in command for command in commands)
+
+def test_process_audio_file_keeps_the_journal_until_the_transcript_is_written(make_config, tmp_path):
+    config = make_config(tmp_path)
+    journal = MagicMock()
+    with patch('transcriber.audio_processing.transcribe_media', return_value=("text", None, journal)), \
+         patch('transcriber.audio_processing.FileHandler.write_file', side_effect=OSError("disk full")):
+        with pytest.raises(VideoProcessingError):
+            process_audio_file(tmp_path / "talk.mp3", tmp_path, config)
+    journal.discard.assert_not_called()
+
+    with patch('transcriber.audio_processing.transcribe_media', return_value=("text", None, journal)):
+        transcript_path = process_audio_file(tmp_path / "talk.mp3", tmp_path, config)
+    assert transcript_path.read_text() == "# Transcription: talk.mp3\n\ntext"
+    journal.discard.assert_called_once()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+from unittest.mock import patch
+import pytest
+from transcriber.batch_processing import BatchResult, run_batch_refinement
+from transcriber.cache import ResultCache
+from transcriber.exceptions import BatchJobFailedError
+from transcriber.quota import Usage
+from transcriber.token_utils import TextChunk
+
+def split_paragraphs(text, max_tokens):
+    chunks = []
+    for paragraph in text.split("\n\n"):
+        if paragraph.strip():
+            chunks.append(TextChunk(paragraph, 0, 0, 0, 1))
+    return chunks
+
+class FakeBatches:
+    provider = 'anthropic'
+    max_requests = 100
+
+    def __init__(self, fail=(), interrupt_after=None):
+        self.fail = set(fail)
+        self.interrupt_after = interrupt_after
+        self.jobs = {}
+        self.polls = 0
+
+    async def submit(self, requests):
+        if self.interrupt_after is not None and len(self.jobs) == self.interrupt_after:
+            raise KeyboardInterrupt
+        batch_id = f"batch{len(self.jobs)}"
+        self.jobs[batch_id] = requests
+        return batch_id
+
+    async def poll(self, batch_id):
+        self.polls += 1
+        return self.polls % 2 == 0  # Every job is still running at its first check
+
+    async def results(self, batch_id):
+        return [
+            BatchResult(request.custom_id, error="overloaded") if request.custom_id in self.fail else
+            BatchResult(request.custom_id, request.prompt.split("\n\n")[1].upper(), Usage(1, 10, 5))
+            for request in self.jobs[batch_id]
+        ]
+
+def run(api, files, tmp_path, config, cache=None, manifest=None):
+    instructions = tmp_path / "instructions.md"
+    instructions.write_text("instructions")
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    with patch('transcriber.batch_processing.batch_api', return_value=api), \
+         patch('transcriber.batch_processing.get_cache', return_value=cache), \
+         patch('transcriber.batch_processing.count_tokens', return_value=1), \
+         patch('transcriber.batch_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.get_cache', return_value=cache), \
+         patch('transcriber.refinement_processing.chunk_text', side_effect=split_paragraphs):
+        usage = asyncio.run(run_batch_refinement(files, tmp_path / "out", instructions, config, manifest=manifest, sleep=sleep))
+    return usage, sleeps
+
+def test_batch_refinement_writes_outputs_in_jobs(tmp_path, make_config):
+    (tmp_path / "out").mkdir()
+    files = [tmp_path / "a.md", tmp_path / "b.md"]
+    files[0].write_text("one\n\ntwo")
+    files[1].write_text("three")
+    api = FakeBatches(fail={"file0-chunk1"})
+
+    usage, sleeps = run(api, files, tmp_path, make_config(tmp_path, batch_max_requests=2))
+
+    assert [len(requests) for requests in api.jobs.values()] == [2, 1]  # batch_max_requests per job
+    assert sleeps == [0, 0]
+    # A request that failed in the batch keeps its original text
+    assert (tmp_path / "out" / "a_refined.md").read_text() == "ONE\n\ntwo"
+    assert (tmp_path / "out" / "b_refined.md").read_text() == "THREE"
+    assert usage.requests == 2 and usage.input_tokens == 20
+    assert list((tmp_path / "batches").iterdir()) == []
+
+def test_batch_refinement_uses_cached_chunks(tmp_path, make_config):
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=1024 * 1024)
+    (tmp_path / "out").mkdir()
+    transcript = tmp_path / "a.md"
+    transcript.write_text("one\n\ntwo")
+    run(FakeBatches(), [transcript], tmp_path, make_config(tmp_path), cache)
+    (tmp_path / "out" / "a_refined.md").unlink()
+
+    transcript.write_text("one\n\n2")
+    api = FakeBatches()
+    run(api, [transcript], tmp_path, make_config(tmp_path), cache)
+
+    assert [[request.custom_id for request in requests] for requests in api.jobs.values()] == [["file0-chunk1"]]
+    assert (tmp_path / "out" / "a_refined.md").read_text() == "ONE\n\n2"
+
+def test_interrupted_submission_resumes_without_resubmitting(tmp_path, make_config):
+    (tmp_path / "out").mkdir()
+    transcript = tmp_path / "a.md"
+    transcript.write_text("one\n\ntwo\n\nthree")
+    first = FakeBatches(interrupt_after=1)
+    with pytest.raises(KeyboardInterrupt):
+        run(first, [transcript], tmp_path, make_config(tmp_path, batch_max_requests=2))
+
+    second = FakeBatches()
+    second.jobs = dict(first.jobs)  # The provider still has the job submitted before the interruption
+    run(second, [transcript], tmp_path, make_config(tmp_path, batch_max_requests=2))
+
+    assert list(second.jobs) == ["batch0", "batch1"]
+    assert [request.custom_id for request in second.jobs["batch1"]] == ["file0-chunk2"]
+    assert (tmp_path / "out" / "a_refined.md").read_text() == "ONE\n\nTWO\n\nTHREE"
+
+@pytest.mark.parametrize('provider', ['anthropic', 'openai'])
+def test_batch_apis_against_stub_server(tmp_path, provider, make_config):
+    pytest.importorskip('httpx')
+    from benchmarks.stub_server import StubServer
+    from transcriber.clients import get_clients
+
+    (tmp_path / "out").mkdir()
+    transcript = tmp_path / "a.md"
+    transcript.write_text("one\n\ntwo\n\nthree")
+    with StubServer() as server, patch.dict(os.environ, server.environment()):
+        config = make_config(tmp_path, openai_api_key="stub-key", anthropic_api_key="stub-key", batch_provider=provider)
+        instructions = tmp_path / "instructions.md"
+        instructions.write_text("instructions")
+
+        async def main():
+            try:
+                return await run_batch_refinement([transcript], tmp_path / "out", instructions, config, sleep=lambda _: asyncio.sleep(0))
+            finally:
+                await get_clients().aclose()
+
+        with patch('transcriber.batch_processing.get_cache', return_value=None), \
+             patch('transcriber.batch_processing.count_tokens', return_value=1), \
+             patch('transcriber.batch_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+             patch('transcriber.refinement_processing.get_cache', return_value=None), \
+             patch('transcriber.refinement_processing.chunk_text', side_effect=split_paragraphs):
+            usage = asyncio.run(main())
+
+    assert usage.requests == 3
+    assert (tmp_path / "out" / "a_refined.md").read_text().startswith("the quick brown fox")
+
+def test_batch_refinement_reprocesses_changed_files(tmp_path, make_config):
+    from transcriber.manifest import Manifest
+    (tmp_path / "out").mkdir()
+    transcript = tmp_path / "a.md"
+    transcript.write_text("one")
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+
+    run(FakeBatches(), [transcript], tmp_path, make_config(tmp_path), manifest=manifest)
+    unchanged = FakeBatches()
+    run(unchanged, [transcript], tmp_path, make_config(tmp_path), manifest=manifest)
+    assert unchanged.jobs == {}
+
+    transcript.write_text("one\n\nmore")
+    run(FakeBatches(), [transcript], tmp_path, make_config(tmp_path), manifest=manifest)
+    assert (tmp_path / "out" / "a_refined.md").read_text() == "ONE\n\nMORE"
+
+class FailingBatches(FakeBatches):
+    async def poll(self, batch_id):
+        raise BatchJobFailedError(f"Batch {batch_id} expired")
+
+def test_failed_batch_job_is_submitted_again_on_the_next_run(tmp_path, make_config):
+    (tmp_path / "out").mkdir()
+    transcript = tmp_path / "a.md"
+    transcript.write_text("one")
+    with pytest.raises(BatchJobFailedError):
+        run(FailingBatches(), [transcript], tmp_path, make_config(tmp_path))
+    assert list((tmp_path / "batches").iterdir()) == []
+
+    api = FakeBatches()
+    run(api, [transcript], tmp_path, make_config(tmp_path))
+    assert list(api.jobs) == ["batch0"]  # Submitted anew rather than resuming the failed job
+    assert (tmp_path / "out" / "a_refined.md").read_text() == "ONE"
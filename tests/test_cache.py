@@ -0,0 +1,43 @@
+import time
+from transcriber.cache import ResultCache, hash_file
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=1024)
+    assert cache.get('transcription', 'key') is None
+    cache.put('transcription', 'key', "hello")
+    assert cache.get('transcription', 'key') == "hello"
+    assert cache.get('refinement', 'key') is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=25)
+    cache.put('transcription', 'a', "x" * 10)
+    time.sleep(0.01)
+    cache.put('transcription', 'b', "x" * 10)
+    time.sleep(0.01)
+    cache.get('transcription', 'a')  # 'b' is now the least recently used
+    time.sleep(0.01)
+    cache.put('transcription', 'c', "x" * 10)
+
+    assert cache.get('transcription', 'a') is not None
+    assert cache.get('transcription', 'b') is None
+    assert cache.get('transcription', 'c') is not None
+
+def test_stats_and_prune(tmp_path):
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=1024)
+    cache.put('transcription', 'a', "abc")
+    cache.put('refinement', 'b', "defg")
+    stats = cache.stats()
+    assert stats['namespaces']['transcription'] == {**stats['namespaces']['transcription'], 'entries': 1, 'bytes': 3}
+    assert cache.prune(namespace='refinement') == 1
+    assert cache.prune(max_bytes=0) == 1
+    assert cache.stats()['namespaces'] == {}
+
+def test_cache_persists_and_hash_file(tmp_path):
+    chunk = tmp_path / "chunk.flac"
+    chunk.write_bytes(b"audio")
+    other = tmp_path / "copy.flac"
+    other.write_bytes(b"audio")
+    assert hash_file(chunk) == hash_file(other)
+
+    ResultCache(tmp_path / "cache.sqlite", max_bytes=1024).put('transcription', hash_file(chunk), "text")
+    assert ResultCache(tmp_path / "cache.sqlite", max_bytes=1024).get('transcription', hash_file(other)) == "text"
@@ -0,0 +1,33 @@
+import pytest
+from unittest.mock import patch
+from transcriber.chunk_planner import plan_chunks, plan_stream_chunks, max_chunk_seconds, WHISPER_MAX_UPLOAD_BYTES
+
+def test_chunks_fit_under_upload_limit():
+    plan = plan_chunks(3 * 3600, 16000 * 2, 'wav')
+    assert plan.chunk_seconds * 16000 * 2 < WHISPER_MAX_UPLOAD_BYTES
+    assert plan.chunk_count == 15
+    assert plan.baseline_count == 180
+    assert plan.requests_saved == 165
+
+def test_requested_length_is_capped_by_size():
+    assert plan_chunks(3600, 176400, 'wav', chunk_seconds=600).chunk_seconds <= max_chunk_seconds(176400) < 600
+    assert plan_chunks(3600, 3000, 'opus', chunk_seconds=60).chunk_seconds == 60
+
+def test_chunks_are_spread_evenly():
+    plan = plan_chunks(1000, 1_000_000, 'wav', max_bytes=500_000_000)
+    assert plan.chunk_count == 3
+    assert plan.chunk_seconds == 334
+
+@patch('transcriber.chunk_planner.probe_audio')
+def test_acceptable_source_codec_is_stream_copied(mock_probe):
+    mock_probe.return_value = {'codec': 'aac', 'bit_rate': 64000, 'duration': 7200.0}
+    plan = plan_stream_chunks('lecture.mp4', 'flac')
+    assert plan.chunk_format == 'copy-m4a'
+    assert plan.chunk_seconds * 64000 / 8 < WHISPER_MAX_UPLOAD_BYTES
+
+@patch('transcriber.chunk_planner.probe_audio')
+def test_other_source_codecs_are_reencoded(mock_probe):
+    mock_probe.return_value = {'codec': 'pcm_s24le', 'bit_rate': 2304000, 'duration': 7200.0}
+    plan = plan_stream_chunks('session.mov', 'opus')
+    assert plan.chunk_format == 'opus'
+    assert plan.chunk_count == 1
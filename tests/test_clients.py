@@ -0,0 +1,48 @@
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+from transcriber.clients import ClientRegistry
+
+@patch('transcriber.clients._http_client')
+@patch('openai.OpenAI')
+def test_sync_clients_are_shared_per_key(mock_openai, mock_http_client, monkeypatch):
+    mock_openai.side_effect = lambda **kwargs: MagicMock()
+    registry = ClientRegistry()
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'key-1')
+    first = registry.openai()
+    assert registry.openai() is first
+    assert mock_openai.call_count == 1
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'key-2')
+    assert registry.openai() is not first
+    assert registry.openrouter() is not registry.openai()
+
+@patch('transcriber.clients._http_client')
+@patch('anthropic.AsyncAnthropic')
+def test_async_clients_are_shared_within_an_event_loop(mock_anthropic, mock_http_client, monkeypatch):
+    mock_anthropic.side_effect = lambda **kwargs: MagicMock(close=AsyncMock())
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'key')
+    registry = ClientRegistry()
+
+    async def get_twice():
+        return registry.async_anthropic(), registry.async_anthropic()
+
+    first, second = asyncio.run(get_twice())
+    assert first is second
+    third, _ = asyncio.run(get_twice())
+    assert third is not first  # A new event loop gets its own client
+
+    async def close():
+        client = registry.async_anthropic()
+        await registry.aclose()
+        return client
+
+    closed = asyncio.run(close())
+    closed.close.assert_awaited_once()
+
+@patch('transcriber.clients._http_client')
+@patch('openai.OpenAI')
+def test_openrouter_base_url_can_be_overridden(mock_openai, mock_http_client, monkeypatch):
+    monkeypatch.setenv('OPENROUTER_BASE_URL', 'http://127.0.0.1:8000/v1')
+    ClientRegistry().openrouter()
+    assert mock_openai.call_args.kwargs['base_url'] == 'http://127.0.0.1:8000/v1'
@@ -1,6 +1,7 @@
 import pytest
 from pathlib import Path
-from transcriber.file_handler import FileHandler
+import io
+from transcriber.file_handler import FileHandler, ProgressiveWriter
 
 def test_safe_filename():
     unsafe_name = "File with spaces and !@#$%^&*().mp4"
@@ -20,4 +21,37 @@ def test_write_and_read_file(tmp_path):
     FileHandler.write_file(test_file, content)
     assert test_file.exists()
     read_content = FileHandler.read_file(test_file)
-    assert read_content == content
\ No newline at end of file
+    assert read_content == content
+
+
+def test_progressive_writer_writes_parts_in_order(tmp_path):
+    path = tmp_path / "out.md"
+    stream = io.StringIO()
+    with ProgressiveWriter(path, 3, stream=stream) as writer:
+        writer.add_text(1, "se")
+        writer.complete(1, "second")
+        writer.add_text(0, "fi")
+        assert stream.getvalue() == "fi"
+        assert (tmp_path / "out.md.partial").read_text() == ""
+        writer.complete(0, "first")
+        assert (tmp_path / "out.md.partial").read_text() == "first\n\nsecond"
+        assert not path.exists()
+        writer.add_text(2, "thi")
+        writer.complete(2, "fallback")  # Differs from what was streamed
+    assert path.read_text() == "first\n\nsecond\n\nfallback"
+    assert stream.getvalue() == "first\n\nsecond\n\nthi\nfallback"
+    assert not (tmp_path / "out.md.partial").exists()
+
+def test_progressive_writer_removes_partial_file_on_error(tmp_path):
+    path = tmp_path / "out.md"
+    with pytest.raises(RuntimeError):
+        with ProgressiveWriter(path, 2) as writer:
+            writer.complete(0, "first")
+            raise RuntimeError("refinement failed")
+    assert not path.exists()
+    assert not (tmp_path / "out.md.partial").exists()
+
+    with pytest.raises(IOError):
+        with ProgressiveWriter(path, 2) as writer:
+            writer.complete(1, "second")
+    assert not path.exists()
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from transcriber.journal import JobJournal, open_journal, file_identity
+
+def test_record_and_resume(tmp_path):
+    path = tmp_path / "job.jsonl"
+    journal = JobJournal(path)
+    journal.record(0, "first")
+    journal.record(2, "third")
+
+    resumed = JobJournal(path, resume=True)
+    assert resumed.completed == {0: "first", 2: "third"}
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "job.jsonl"
+    JobJournal(path).record(0, "first")
+    with path.open('a') as f:
+        f.write('{"index": 1, "resu')
+
+    assert JobJournal(path, resume=True).completed == {0: "first"}
+
+def test_without_resume_starts_over(tmp_path):
+    path = tmp_path / "job.jsonl"
+    JobJournal(path).record(0, "first")
+
+    assert JobJournal(path).completed == {}
+    assert not path.exists()
+
+def test_discard(tmp_path):
+    path = tmp_path / "job.jsonl"
+    journal = JobJournal(path)
+    journal.record(0, "first")
+    journal.discard()
+
+    assert not path.exists()
+    assert journal.completed == {}
+
+def test_open_journal_depends_on_identity(tmp_path):
+    media = tmp_path / "talk.wav"
+    media.write_bytes(b"audio")
+    config = SimpleNamespace(cache_dir=tmp_path, resume=True)
+
+    journal = open_journal(config, 'transcription', *file_identity(media), 60)
+    journal.record(0, "hello")
+
+    assert open_journal(config, 'transcription', *file_identity(media), 60).completed == {0: "hello"}
+    assert open_journal(config, 'transcription', *file_identity(media), 120).completed == {}
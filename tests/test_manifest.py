@@ -0,0 +1,60 @@
+import os
+from transcriber.manifest import Manifest, scan_media
+
+def make_tree(root):
+    for name in ["a.mp4", "notes.md", "image.png", "sub/b.wav", "sub/deep/c.mp3", "skip/d.mp3", ".hidden/e.mp3"]:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode())
+
+def test_scan_media_recurses_and_filters(tmp_path):
+    make_tree(tmp_path)
+
+    found = [path.relative_to(tmp_path).as_posix() for path, _ in scan_media(tmp_path)]
+    assert found == ["a.mp4", "notes.md", "skip/d.mp3", "sub/b.wav", "sub/deep/c.mp3"]
+
+    found = [path.name for path, _ in scan_media(tmp_path, include=["*.mp3", "*.wav"], exclude=["skip"])]
+    assert found == ["b.wav", "c.mp3"]
+
+def test_discover_skips_finished_and_rehashes_changed_files(tmp_path):
+    library = tmp_path / "library"
+    make_tree(library)
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+
+    first = list(manifest.discover(library))
+    assert len(first) == 5
+    for path in first:
+        manifest.mark(path, 'transcribe', 'done')
+        manifest.mark(path, 'refine', 'done')
+
+    assert list(manifest.discover(library)) == []
+
+    # Touching a file without changing it keeps its status; new content starts over
+    touched, changed = library / "a.mp4", library / "sub" / "b.wav"
+    os.utime(touched, ns=(1, 1))
+    changed.write_bytes(b"new recording")
+    (library / "sub" / "new.mp3").write_bytes(b"new")
+
+    assert sorted(path.name for path in manifest.discover(library)) == ["b.wav", "new.mp3"]
+    assert manifest.get(touched)['stages'] == {'transcribe': 'done', 'refine': 'done'}
+    assert manifest.get(changed)['stages'] == {}
+
+def test_needs_work_checks_single_files(tmp_path):
+    recording = tmp_path / "lecture.mp3"
+    recording.write_bytes(b"audio")
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+
+    assert manifest.needs_work(recording)
+    manifest.mark(recording, 'refine', 'done')
+    assert not manifest.needs_work(recording)
+    recording.write_bytes(b"re-recorded")
+    assert manifest.needs_work(recording)
+
+def test_scan_media_leaves_out_ignored_paths(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "a.md").write_text("transcript")
+
+    ignore = [tmp_path / "out", tmp_path / "sub" / "deep", tmp_path.parent]  # An ancestor of the root is not ignored
+    found = [path.relative_to(tmp_path).as_posix() for path, _ in scan_media(tmp_path, ignore=ignore)]
+    assert found == ["a.mp4", "notes.md", "skip/d.mp3", "sub/b.wav"]
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from transcriber.metrics import Metrics, export_metrics, get_metrics
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_spans_record_count_total_and_max():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock, wall_clock=lambda: 1000.0)
+    for seconds in (1.0, 3.0):
+        with metrics.span('whisper_request'):
+            clock.now += seconds
+    with pytest.raises(RuntimeError):
+        with metrics.span('whisper_request'):
+            clock.now += 2.0
+            raise RuntimeError("upload failed")
+
+    span = metrics.report()['spans']['whisper_request']
+    assert span == {'count': 3, 'total_seconds': 6.0, 'mean_seconds': 2.0, 'max_seconds': 3.0}
+
+def test_timed_decorates_sync_and_async_functions():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock)
+
+    @metrics.timed('convert')
+    def convert():
+        clock.now += 1.0
+        return 'done'
+
+    @metrics.timed('refine')
+    async def refine():
+        clock.now += 2.0
+        return 'refined'
+
+    assert convert() == 'done'
+    assert asyncio.run(refine()) == 'refined'
+    spans = metrics.report()['spans']
+    assert spans['convert']['total_seconds'] == 1.0
+    assert spans['refine']['total_seconds'] == 2.0
+
+def test_counters_sum_over_labels():
+    metrics = Metrics()
+    metrics.count('input_tokens', 100, provider='anthropic')
+    metrics.count('input_tokens', 50, provider='anthropic')
+    metrics.count('input_tokens', 10, provider='openrouter')
+    metrics.count('retries')
+
+    assert metrics.counter('input_tokens', provider='anthropic') == 150
+    assert metrics.counter('input_tokens') == 160
+    counters = metrics.report()['counters']
+    assert counters['retries'] == 1
+    assert {'labels': {'provider': 'openrouter'}, 'value': 10} in counters['input_tokens']
+
+def test_prometheus_textfile_format():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock, wall_clock=lambda: 1000.0)
+    with metrics.span('ffmpeg_convert'):
+        clock.now += 1.5
+    metrics.count('rate_limited', host='api.anthropic.com')
+    metrics.count('http_responses', host='a"b', status=200)
+
+    text = metrics.prometheus()
+    assert 'transcriber_run_start_time_seconds 1000.0\n' in text
+    assert 'transcriber_span_seconds_sum{span="ffmpeg_convert"} 1.5\n' in text
+    assert 'transcriber_span_seconds_count{span="ffmpeg_convert"} 1\n' in text
+    assert '# TYPE transcriber_rate_limited_total counter\n' in text
+    assert 'transcriber_rate_limited_total{host="api.anthropic.com"} 1\n' in text
+    assert 'transcriber_http_responses_total{host="a\\"b",status="200"} 1\n' in text
+    assert text.endswith('\n')
+
+def test_export_metrics_writes_configured_files(tmp_path):
+    get_metrics().reset()
+    get_metrics().count('audio_seconds', 60.0, provider='openai')
+    config = SimpleNamespace(metrics_report=str(tmp_path / 'run.json'), metrics_textfile=str(tmp_path / 'prom' / 'run.prom'))
+
+    export_metrics(config)
+
+    report = json.loads((tmp_path / 'run.json').read_text())
+    assert report['counters']['audio_seconds'] == [{'labels': {'provider': 'openai'}, 'value': 60.0}]
+    assert 'transcriber_audio_seconds_total{provider="openai"} 60.0' in (tmp_path / 'prom' / 'run.prom').read_text()
+
+def test_export_metrics_skips_empty_paths(tmp_path):
+    export_metrics(SimpleNamespace(metrics_report='', metrics_textfile=''))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from unittest.mock import patch
+from transcriber.pipeline import run_pipeline
+from transcriber.quota import Usage
+
+def test_pipeline_overlaps_transcription_and_refinement(tmp_path, make_config):
+    files = [tmp_path / f"lecture{i}.mp3" for i in range(3)]
+    for f in files:
+        f.write_bytes(b"audio")
+    second_transcribed = threading.Event()
+    refined = []
+
+    def fake_transcribe(input_path, output_dir, config, audio_path, ffmpeg):
+        if input_path.name == "lecture1.mp3":
+            second_transcribed.set()
+        transcript_path = output_dir / f"{input_path.stem}.md"
+        transcript_path.write_text(input_path.stem)
+        return transcript_path
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        if input_path.name == "lecture0.md":
+            # File 1 must be able to finish transcription while file 0 is still being refined
+            assert await asyncio.to_thread(second_transcribed.wait, 5)
+        output_path.write_text(input_path.read_text().upper())
+        refined.append(input_path.stem)
+        return Usage(requests=1, input_tokens=10)
+
+    with patch('transcriber.pipeline.process_audio_file', side_effect=fake_transcribe), \
+         patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+        usage = asyncio.run(run_pipeline(files, tmp_path, tmp_path / "instructions.md", make_config(tmp_path)))
+
+    assert sorted(refined) == ["lecture0", "lecture1", "lecture2"]
+    assert (tmp_path / "lecture2_refined.md").read_text() == "LECTURE2"
+    assert usage.requests == 3
+
+def test_pipeline_skips_failed_and_finished_files(tmp_path, make_config):
+    files = [tmp_path / "bad.mp3", tmp_path / "done.mp3", tmp_path / "notes.md", tmp_path / "image.png"]
+    for f in files:
+        f.write_text("notes")
+    (tmp_path / "done_refined.md").write_text("already refined")
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        output_path.write_text("refined")
+        return Usage(requests=1)
+
+    with patch('transcriber.pipeline.process_audio_file', side_effect=RuntimeError("Whisper failed")) as transcribe, \
+         patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+        usage = asyncio.run(run_pipeline(files, tmp_path, tmp_path / "instructions.md", make_config(tmp_path)))
+
+    transcribe.assert_called_once()
+    assert (tmp_path / "notes_refined.md").read_text() == "refined"
+    assert not (tmp_path / "bad_refined.md").exists()
+    assert usage.requests == 1
+
+def test_pipeline_records_stages_in_manifest(tmp_path, make_config):
+    from transcriber.manifest import Manifest
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "good.mp3").write_bytes(b"good")
+    (library / "bad.mp3").write_bytes(b"bad")
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+
+    def fake_transcribe(input_path, output_dir, config, audio_path, ffmpeg):
+        if input_path.name == "bad.mp3":
+            raise RuntimeError("Whisper failed")
+        transcript_path = output_dir / f"{input_path.stem}.md"
+        transcript_path.write_text("text")
+        return transcript_path
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        output_path.write_text("refined")
+        return Usage(requests=1)
+
+    with patch('transcriber.pipeline.process_audio_file', side_effect=fake_transcribe), \
+         patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+        asyncio.run(run_pipeline(manifest.discover(library), tmp_path, tmp_path / "instructions.md",
+                                 make_config(tmp_path), manifest=manifest))
+
+    assert manifest.get(library / "good.mp3")['stages'] == {'extract': 'done', 'transcribe': 'done', 'refine': 'done'}
+    assert manifest.get(library / "bad.mp3")['stages'] == {'extract': 'done', 'transcribe': 'failed'}
+    assert [path.name for path in manifest.discover(library)] == ["bad.mp3"]
+
+def test_pipeline_reprocesses_files_changed_since_the_manifest_run(tmp_path, make_config):
+    from transcriber.manifest import Manifest
+    library = tmp_path / "library"
+    library.mkdir()
+    transcript = library / "lecture.md"
+    transcript.write_text("first take")
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        output_path.write_text(input_path.read_text().upper())
+        return Usage(requests=1)
+
+    def run():
+        with patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+            return asyncio.run(run_pipeline([transcript], tmp_path, tmp_path / "instructions.md",
+                                            make_config(tmp_path), manifest=manifest))
+
+    assert run().requests == 1
+    assert run().requests == 0  # Unchanged, so skipped
+    transcript.write_text("second take")
+
+    assert run().requests == 1
+    assert (tmp_path / "lecture_refined.md").read_text() == "SECOND TAKE"
+    assert manifest.get(transcript)['stages']['refine'] == 'done'
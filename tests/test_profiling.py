@@ -0,0 +1,67 @@
+import asyncio
+import os
+import pstats
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from transcriber.audio_processing import split_audio
+from transcriber.profiling import Profiler, stage_codes
+from transcriber.transcription import transcribe_chunks
+
+def write_wav(path, seconds):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(b'\x00\x00' * 16000 * seconds)
+
+def test_stage_codes_include_nested_functions():
+    codes = stage_codes()
+    nested = [code for code in transcribe_chunks.__code__.co_consts if hasattr(code, 'co_code')]
+    assert codes[transcribe_chunks.__code__] == 'transcription'
+    assert nested and all(codes[code] == 'transcription' for code in nested)
+    assert codes[split_audio.__code__] == 'split'
+
+def test_profiler_attributes_samples_to_stages_and_writes_outputs(tmp_path):
+    audio = tmp_path / 'long.wav'
+    write_wav(audio, 300)
+
+    def work():
+        for _ in range(3):
+            for chunk in split_audio(audio, 1000):
+                os.remove(chunk)
+
+    with Profiler(tmp_path / 'profile', interval=0.001) as profiler:
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    assert profiler.stage_samples()['split'] > 0
+    directory = tmp_path / 'profile'
+    assert {path.name for path in directory.iterdir()} == {'cpu.collapsed', 'cpu.pstats', 'memory_peak.snapshot', 'summary.txt'}
+
+    collapsed = (directory / 'cpu.collapsed').read_text().splitlines()
+    stack, count = collapsed[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert any(line.startswith('split;') and 'split_audio (audio_processing.py:' in line for line in collapsed)
+
+    stats = pstats.Stats(str(directory / 'cpu.pstats'))
+    assert any(function == 'split_audio' for _, _, function in stats.stats)  # Recorded in the worker thread
+    summary = (directory / 'summary.txt').read_text()
+    assert 'Busy time per stage' in summary and 'Peak traced memory' in summary
+
+def test_profiler_runs_worker_threads(tmp_path):
+    def busy():
+        return sum(range(100000))
+
+    async def main():
+        return await asyncio.to_thread(busy)
+
+    with Profiler(tmp_path / 'profile') as profiler:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda _: busy(), range(4)))
+        results.append(asyncio.run(main()))
+
+    assert results == [sum(range(100000))] * 5
+    stats = pstats.Stats(str(tmp_path / 'profile' / 'cpu.pstats'))
+    assert any(function == 'busy' for _, _, function in stats.stats)
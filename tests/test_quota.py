@@ -0,0 +1,56 @@
+import pytest
+from transcriber.quota import QuotaAccountant, WINDOW_SECONDS
+from transcriber.exceptions import QuotaExceededError
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+def test_usage_persists_across_instances(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "usage.jsonl"
+    quota = QuotaAccountant(path, clock=clock)
+    quota.record('anthropic', 'claude-test', input_tokens=100, output_tokens=50)
+    quota.record('openai', 'whisper-1', audio_seconds=60.0)
+
+    reloaded = QuotaAccountant(path, clock=clock)
+    assert reloaded.usage('anthropic').tokens == 150
+    assert reloaded.usage('openai', 'whisper-1').audio_seconds == 60.0
+    assert reloaded.usage().requests == 2
+    assert set(reloaded.summary()) == {'anthropic/claude-test', 'openai/whisper-1'}
+
+def test_usage_outside_window_is_dropped(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "usage.jsonl"
+    QuotaAccountant(path, clock=clock).record('anthropic', 'claude-test', input_tokens=100)
+    clock.now += WINDOW_SECONDS + 1
+
+    quota = QuotaAccountant(path, clock=clock)
+    assert quota.usage('anthropic').tokens == 0
+    assert path.read_text() == ""
+
+def test_reservations_count_against_limits(tmp_path):
+    quota = QuotaAccountant(tmp_path / "usage.jsonl", {'anthropic': {'tokens': 1000}}, clock=FakeClock())
+    quota.record('anthropic', 'claude-test', input_tokens=400)
+
+    with quota.reserve('anthropic', input_tokens=500) as reservation:
+        with pytest.raises(QuotaExceededError):
+            quota.reserve('anthropic', input_tokens=200)
+        quota.record('anthropic', 'claude-test', input_tokens=300, reservation=reservation)
+        assert quota.remaining('anthropic')['tokens'] == 100
+
+    assert quota.remaining('anthropic')['tokens'] == 300
+    quota.reserve('anthropic', input_tokens=300)  # Uses the allowance exactly
+
+def test_records_from_other_processes_are_seen(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "usage.jsonl"
+    first = QuotaAccountant(path, clock=clock)
+    second = QuotaAccountant(path, clock=clock)
+    first.record('anthropic', 'claude-test', output_tokens=10)
+    second.record('anthropic', 'claude-test', output_tokens=5)
+    assert first.usage('anthropic').output_tokens == 15
+    assert second.usage('anthropic').output_tokens == 15
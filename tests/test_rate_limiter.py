@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from transcriber.rate_limiter import TokenBucket, RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now = 10.0
+    assert bucket.wait_time(10) == 0.0
+
+def test_token_bucket_caps_oversized_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(100, clock=clock)
+    assert bucket.wait_time(1000) == 0.0
+    bucket.take(1000)
+    assert bucket.wait_time(1000) == pytest.approx(60 * 1000 / 100)
+
+def test_rate_limiter_enforces_both_limits(monkeypatch):
+    clock = FakeClock()
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        clock.now += delay
+
+    monkeypatch.setattr('transcriber.rate_limiter.asyncio.sleep', fake_sleep)
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000, clock=clock)
+
+    async def run():
+        await limiter.acquire(400)
+        await limiter.acquire(400)
+        await limiter.acquire(400)  # waits for both a request slot and tokens
+        limiter.record(500)
+        await limiter.acquire(100)
+
+    asyncio.run(run())
+    assert sleeps[0] == pytest.approx(30.0)
+    assert sum(sleeps) > 30.0
@@ -1,2 +1,166 @@
-from transcriber.refinement_processing import process_with_refinement, process_multiple_files
-# ... (update test functions to use new names)
\ No newline at end of file
+import io
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, AsyncMock
+from transcriber.refinement_processing import process_with_refinement, process_multiple_files, align_chunks
+from transcriber.cache import ResultCache
+from transcriber.metrics import get_metrics
+from transcriber.token_utils import TextChunk
+
+def as_chunks(texts):
+    return [TextChunk(text, 0, len(text), 0, 1) for text in texts]
+
+def message(text, input_tokens=10, cache_read=0, cache_write=0):
+    usage = SimpleNamespace(input_tokens=input_tokens, output_tokens=5, cache_read_input_tokens=cache_read,
+                            cache_creation_input_tokens=cache_write)
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)], usage=usage)
+
+def prompt_chunk(kwargs):
+    return kwargs['messages'][0]['content'].split("\n\n")[1]
+
+def test_process_with_refinement_keeps_chunk_order(tmp_path, make_config):
+    input_path = tmp_path / "input.md"
+    input_path.write_text("transcript")
+    instructions_path = tmp_path / "instructions.md"
+    instructions_path.write_text("instructions")
+    output_path = tmp_path / "output.md"
+
+    async def fake_create(**kwargs):
+        chunk = prompt_chunk(kwargs)
+        await asyncio.sleep(0.01 if chunk == "chunk 0" else 0)
+        if chunk == "chunk 1":
+            raise RuntimeError("boom")
+        return message(chunk.upper())
+
+    client = MagicMock()
+    client.messages.create = AsyncMock(side_effect=fake_create)
+    with patch('transcriber.refinement_processing.get_clients', return_value=MagicMock(async_anthropic=MagicMock(return_value=client))), \
+         patch('transcriber.refinement_processing.count_tokens', return_value=1), \
+         patch('transcriber.refinement_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.chunk_text', return_value=as_chunks(["chunk 0", "chunk 1", "chunk 2"])):
+        asyncio.run(process_with_refinement(input_path, output_path, instructions_path, make_config(tmp_path)))
+
+    assert output_path.read_text() == "CHUNK 0\n\nchunk 1\n\nCHUNK 2"
+    assert client.messages.create.await_count == 3
+
+def test_align_chunks_only_splits_changed_text():
+    with patch('transcriber.refinement_processing.chunk_text', side_effect=lambda text, max_tokens: as_chunks([text])):
+        chunks = align_chunks("aaa bbb-edited ccc", ["aaa ", "bbb ", "ccc"], 100)
+    assert chunks == ["aaa ", "bbb-edited ", "ccc"]
+
+def test_rerun_only_refines_changed_chunks(tmp_path, make_config):
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=1024 * 1024)
+    input_path = tmp_path / "input.md"
+    instructions_path = tmp_path / "instructions.md"
+    instructions_path.write_text("instructions")
+    output_path = tmp_path / "output.md"
+
+    async def fake_create(**kwargs):
+        return message(prompt_chunk(kwargs).upper())
+
+    client = MagicMock()
+    client.messages.create = AsyncMock(side_effect=fake_create)
+    split_by_sentence = lambda text, max_tokens: as_chunks([s + "." for s in text.split(".") if s])
+    with patch('transcriber.refinement_processing.get_clients', return_value=MagicMock(async_anthropic=MagicMock(return_value=client))), \
+         patch('transcriber.refinement_processing.get_cache', return_value=cache), \
+         patch('transcriber.refinement_processing.count_tokens', return_value=1), \
+         patch('transcriber.refinement_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.chunk_text', side_effect=split_by_sentence):
+        input_path.write_text("one.two.three.")
+        asyncio.run(process_with_refinement(input_path, output_path, instructions_path, make_config(tmp_path)))
+        assert client.messages.create.await_count == 3
+
+        asyncio.run(process_with_refinement(input_path, output_path, instructions_path, make_config(tmp_path)))
+        assert client.messages.create.await_count == 3
+
+        input_path.write_text("one.TWO!.three.")
+        asyncio.run(process_with_refinement(input_path, output_path, instructions_path, make_config(tmp_path)))
+        assert client.messages.create.await_count == 4
+
+    assert output_path.read_text() == "ONE.\n\nTWO!.\n\nTHREE."
+
+def test_streamed_refinement_prints_chunks_in_order(tmp_path, make_config):
+    input_path = tmp_path / "input.md"
+    input_path.write_text("transcript")
+    instructions_path = tmp_path / "instructions.md"
+    instructions_path.write_text("instructions")
+    output_path = tmp_path / "output.md"
+
+    async def fake_create(**kwargs):
+        assert kwargs['stream'] is True
+        chunk = prompt_chunk(kwargs)
+
+        async def events():
+            yield SimpleNamespace(type="message_start", message=message(""))
+            for word in chunk.upper().split(" "):
+                await asyncio.sleep(0.02 if chunk == "chunk 0" else 0)  # The first chunk finishes last
+                yield SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=word + " "))
+            yield SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=2))
+        return events()
+
+    client = MagicMock()
+    client.messages.create = AsyncMock(side_effect=fake_create)
+    stream = io.StringIO()
+    with patch('transcriber.refinement_processing.get_clients', return_value=MagicMock(async_anthropic=MagicMock(return_value=client))), \
+         patch('transcriber.refinement_processing.count_tokens', return_value=1), \
+         patch('transcriber.refinement_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.chunk_text', return_value=as_chunks(["chunk 0", "chunk 1", "chunk 2"])):
+        asyncio.run(process_with_refinement(input_path, output_path, instructions_path, make_config(tmp_path), stream=stream))
+
+    assert output_path.read_text() == "CHUNK 0 \n\nCHUNK 1 \n\nCHUNK 2 "
+    assert stream.getvalue() == "CHUNK 0 \n\nCHUNK 1 \n\nCHUNK 2 \n"
+    assert not (tmp_path / "output.md.partial").exists()
+
+def test_long_instructions_are_cached_after_the_first_chunk(tmp_path, make_config):
+    input_path = tmp_path / "input.md"
+    input_path.write_text("transcript")
+    instructions_path = tmp_path / "instructions.md"
+    instructions_path.write_text("long instructions")
+    output_path = tmp_path / "output.md"
+    in_flight = []
+
+    async def fake_create(**kwargs):
+        assert kwargs['system'][0]['cache_control'] == {'type': 'ephemeral'}
+        in_flight.append(prompt_chunk(kwargs))
+        first = len(in_flight) == 1
+        await asyncio.sleep(0.01)
+        if first:
+            assert in_flight == ["chunk 0"]  # The other chunks wait until the prefix is cached
+            return message("REFINED", cache_write=2000)
+        return message("REFINED", cache_read=2000)
+
+    client = MagicMock()
+    client.messages.create = AsyncMock(side_effect=fake_create)
+    get_metrics().reset()
+    with patch('transcriber.refinement_processing.get_clients', return_value=MagicMock(async_anthropic=MagicMock(return_value=client))), \
+         patch('transcriber.refinement_processing._prompt_cache_used', {}), \
+         patch('transcriber.refinement_processing.count_tokens', return_value=2000), \
+         patch('transcriber.refinement_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.chunk_text', return_value=as_chunks(["chunk 0", "chunk 1", "chunk 2"])):
+        usage = asyncio.run(process_with_refinement(
+            input_path, output_path, instructions_path, make_config(tmp_path, max_tokens_per_request=100000),
+        ))
+
+    assert sorted(in_flight) == ["chunk 0", "chunk 1", "chunk 2"]
+    assert usage.cache_read_tokens == 4000 and usage.cache_write_tokens == 2000
+    assert usage.input_tokens == 3 * 10 + 2000  # Cache reads are not counted as input
+    metrics = get_metrics()
+    assert metrics.counter('prompt_cache_requests', provider='anthropic', result='hit') == 2
+    assert metrics.counter('prompt_cache_requests', provider='anthropic', result='write') == 1
+    assert metrics.counter('prompt_cache_read_tokens', provider='anthropic') == 4000
+
+def test_short_instructions_are_sent_without_cache_control(tmp_path, make_config):
+    input_path = tmp_path / "input.md"
+    input_path.write_text("transcript")
+    instructions_path = tmp_path / "instructions.md"
+    instructions_path.write_text("instructions")
+
+    client = MagicMock()
+    client.messages.create = AsyncMock(side_effect=lambda **kwargs: message(prompt_chunk(kwargs)))
+    with patch('transcriber.refinement_processing.get_clients', return_value=MagicMock(async_anthropic=MagicMock(return_value=client))), \
+         patch('transcriber.refinement_processing.count_tokens', return_value=1), \
+         patch('transcriber.refinement_processing.count_tokens_batch', side_effect=lambda texts: [1] * len(texts)), \
+         patch('transcriber.refinement_processing.chunk_text', return_value=as_chunks(["chunk 0"])):
+        asyncio.run(process_with_refinement(input_path, tmp_path / "output.md", instructions_path, make_config(tmp_path)))
+
+    assert client.messages.create.await_args.kwargs['system'] == "instructions"
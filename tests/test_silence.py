@@ -0,0 +1,52 @@
+import wave
+import numpy as np
+import pytest
+from transcriber.silence import frame_energy, plan_chunks, split_audio_on_silence
+from transcriber.audio_processing import audio_duration
+
+FRAME = 0.1  # Seconds per energy frame in the synthetic plans below
+
+def energies(pattern):
+    """Build an energy array from (seconds, is_speech) pairs."""
+    return np.concatenate([np.full(round(seconds / FRAME), -10.0 if speech else -80.0) for seconds, speech in pattern])
+
+def test_frame_energy_is_vectorized_per_frame():
+    samples = np.concatenate([np.zeros(100), np.full(100, 0.5), np.full(50, 0.5)])
+    result = frame_energy(samples, 100)
+    assert len(result) == 3
+    assert result[0] < -100
+    assert result[1] == pytest.approx(20 * np.log10(0.5), abs=0.01)
+
+def test_plan_cuts_inside_pause_near_target():
+    plan = plan_chunks(energies([(50, True), (0.5, False), (30, True)]), FRAME, target_seconds=60)
+    assert len(plan) == 2
+    assert plan[0] == [(0.0, pytest.approx(50.25))]
+    assert plan[1][0][0] == pytest.approx(50.25)
+
+def test_plan_shortens_long_silences():
+    plan = plan_chunks(energies([(5, False), (20, True), (30, False), (20, True)]), FRAME, target_seconds=60)
+    assert len(plan) == 1
+    spans = plan[0]
+    assert spans[0] == (pytest.approx(4.75), pytest.approx(25.25))
+    assert spans[1] == (pytest.approx(54.75), pytest.approx(75.0))
+
+def test_plan_hard_cuts_without_pauses():
+    plan = plan_chunks(energies([(150, True)]), FRAME, target_seconds=60)
+    assert [sum(end - start for start, end in spans) for spans in plan] == pytest.approx([60, 60, 30])
+
+def test_split_audio_on_silence_writes_timestamp_map(tmp_path):
+    rate = 8000
+    tone = (np.sin(np.arange(rate * 3) * 0.3) * 10000).astype('<i2')
+    silence = np.zeros(rate * 4, dtype='<i2')
+    audio_path = tmp_path / "talk.wav"
+    with wave.open(str(audio_path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(np.concatenate([tone, silence, tone]).tobytes())
+
+    timestamp_map = []
+    chunks = list(split_audio_on_silence(audio_path, chunk_length_ms=60000, timestamp_map=timestamp_map))
+    assert len(chunks) == 1
+    assert len(timestamp_map[0]) == 2  # The silence in the middle was shortened
+    assert audio_duration(chunks[0]) == pytest.approx(6.5, abs=0.05)
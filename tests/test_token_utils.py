@@ -1,5 +1,5 @@
 import pytest
-from transcriber.token_utils import count_tokens, split_into_chunks
+from transcriber.token_utils import Tokenizer, count_tokens, split_into_chunks
 
 def test_count_tokens():
     text = "Hello, world!"
@@ -11,4 +11,102 @@ def test_split_into_chunks():
     chunks = split_into_chunks(text, max_tokens)
     assert len(chunks) > 1
     for chunk in chunks:
-        assert count_tokens(chunk) <= max_tokens
\ No newline at end of file
+        assert count_tokens(chunk) <= max_tokens
+
+
+class ByteEncoding:
+    """A stand-in for a tiktoken encoding with one token per byte that counts encode calls."""
+    def __init__(self):
+        self.calls = 0
+
+    def encode_ordinary(self, text):
+        self.calls += 1
+        return list(text.encode())
+
+    def decode(self, tokens):
+        return bytes(tokens).decode()
+
+    def decode_single_token_bytes(self, token):
+        return bytes([token])
+
+def test_tokenizer_encodes_each_text_once():
+    encoding = ByteEncoding()
+    tokenizer = Tokenizer(encoding=encoding)
+
+    assert tokenizer.count("hello") == 5
+    assert tokenizer.count("hello") == 5
+    assert tokenizer.count_batch(["hello", "world", "world", "again"]) == [5, 5, 5, 5]
+    assert encoding.calls == 3
+
+def test_tokenizer_split_counts_chunks_with_real_encodes():
+    encoding = ByteEncoding()
+    tokenizer = Tokenizer(encoding=encoding)
+
+    chunks = tokenizer.split("abcdefghij", 4)
+
+    assert chunks == ["abcd", "efgh", "ij"]
+    assert tokenizer.count_batch(chunks) == [4, 4, 2]
+    assert encoding.calls == 4  # Each chunk is encoded on its own rather than taken from the slices
+
+def test_tokenizer_split_keeps_characters_whole():
+    tokenizer = Tokenizer(encoding=ByteEncoding())
+
+    chunks = tokenizer.split("ééé", 3)
+
+    assert chunks == ["é", "é", "é"]
+
+def test_tokenizer_memo_is_bounded():
+    encoding = ByteEncoding()
+    tokenizer = Tokenizer(max_tokens=10, encoding=encoding)
+
+    tokenizer.count("aaaaa")
+    tokenizer.count("bbbbb")
+    tokenizer.count("ccccc")  # Evicts "aaaaa"
+    tokenizer.count("bbbbb")
+    tokenizer.count("aaaaa")
+
+    assert encoding.calls == 4
+    assert tokenizer.stats()['tokens'] <= 10
+
+def test_chunk_cuts_at_sentence_boundaries():
+    tokenizer = Tokenizer(encoding=ByteEncoding())
+    text = "First sentence here. Second one is here. Third sentence."
+
+    chunks = tokenizer.chunk(text, 25, tolerance=0.5)
+
+    assert [chunk.text for chunk in chunks] == ["First sentence here.", " Second one is here.", " Third sentence."]
+    assert all(chunk.tokens <= 25 for chunk in chunks)
+    for chunk in chunks:
+        assert text[chunk.start_char:chunk.end_char] == chunk.text
+
+def test_chunk_prefers_paragraphs_and_keeps_characters_whole():
+    tokenizer = Tokenizer(encoding=ByteEncoding())
+    text = "Größe. Ünïcödé wörds\n\nnext paragraph"
+
+    chunks = tokenizer.chunk(text, 30, tolerance=0.5)
+
+    assert chunks[0].text == "Größe. Ünïcödé wörds\n\n"
+    assert "".join(chunk.text for chunk in chunks) == text
+    for chunk in chunks:
+        assert text[chunk.start_char:chunk.end_char] == chunk.text
+        assert chunk.tokens == len(chunk.text.encode())
+
+def test_chunk_moves_hard_cuts_to_character_starts():
+    tokenizer = Tokenizer(encoding=ByteEncoding())
+    text = "a\U0001F600\U0001F600"
+
+    chunks = tokenizer.chunk(text, 4, tolerance=0.1)
+
+    assert [chunk.text for chunk in chunks] == ["a", "\U0001F600", "\U0001F600"]
+    assert all(chunk.tokens <= 4 for chunk in chunks)
+
+def test_chunk_overlap():
+    tokenizer = Tokenizer(encoding=ByteEncoding())
+    text = "alpha beta gamma delta epsilon zeta eta theta"
+
+    chunks = tokenizer.chunk(text, 16, overlap=6, tolerance=0.4)
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start_token < previous.end_token
+        assert " " in text[chunk.start_char - 1:chunk.start_char + 1]
+    assert chunks[-1].end_char == len(text)
@@ -1,12 +1,14 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from transcriber.transcription import transcribe_audio_chunk, transcribe_audio
+from transcriber.transcription import (
+    transcribe_audio_chunk, transcribe_audio, transcribe_chunks, OpenAIBackend, StubBackend, HybridBackend,
+)
 
 @pytest.fixture
 def mock_openai_client():
-    with patch('transcriber.transcription.OpenAI') as mock_openai:
+    with patch('transcriber.transcription.get_clients') as mock_clients:
         mock_client = MagicMock()
-        mock_openai.return_value = mock_client
+        mock_clients.return_value.openai.return_value = mock_client
         yield mock_client
 
 def test_transcribe_audio_chunk(mock_openai_client, tmp_path):
@@ -21,10 +23,10 @@ def test_transcribe_audio_chunk(mock_openai_client, tmp_path):
     assert result == "This is a test transcription."
 
 @patch('transcriber.transcription.os.environ.get')
-@patch('transcriber.transcription.count_tokens')
+@patch('transcriber.transcription.count_tokens_batch')
 def test_transcribe_audio(mock_count_tokens, mock_env_get, mock_openai_client, tmp_path):
     mock_env_get.return_value = "fake_api_key"
-    mock_count_tokens.return_value = 10  # Mocking token count
+    mock_count_tokens.return_value = [10, 10, 10]  # Mocking token counts
 
     # Create dummy chunk files
     chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(3)]
@@ -36,7 +38,8 @@ def test_transcribe_audio(mock_count_tokens, mock_env_get, mock_openai_client, t
     mock_split_audio.return_value = [str(file) for file in chunk_files]
     
     # Patch the audio_processing module
-    with patch('transcriber.audio_processing.split_audio', mock_split_audio):
+    with patch('transcriber.audio_processing.split_audio', mock_split_audio), \
+         patch('transcriber.audio_processing.audio_duration', return_value=60.0):
         mock_response = MagicMock()
         mock_response.text = "Chunk transcription."
         mock_openai_client.audio.transcriptions.create.return_value = mock_response
@@ -50,11 +53,143 @@ def test_transcribe_audio(mock_count_tokens, mock_env_get, mock_openai_client, t
         assert result == expected_result
 
         # Verify that split_audio was called
-        mock_split_audio.assert_called_once_with(str(test_audio))
+        mock_split_audio.assert_called_once_with(str(test_audio), 60000)
 
-        # Verify that count_tokens was called for each chunk
-        assert mock_count_tokens.call_count == 3
+        # Verify that all chunks were counted in one batch
+        mock_count_tokens.assert_called_once_with(["Chunk transcription."] * 3)
 
     # Verify that chunk files have been deleted
     for chunk_file in chunk_files:
-        assert not chunk_file.exists(), f"Chunk file {chunk_file} was not deleted"
\ No newline at end of file
+        assert not chunk_file.exists(), f"Chunk file {chunk_file} was not deleted"
+
+def test_transcribe_chunks_keeps_order_and_retries_failures(tmp_path):
+    chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(5)]
+    for chunk_file in chunk_files:
+        chunk_file.write_text("dummy chunk content")
+
+    attempts = {}
+    def fake_transcribe(client, chunk_path):
+        attempts[chunk_path] = attempts.get(chunk_path, 0) + 1
+        if chunk_path == str(chunk_files[2]) and attempts[chunk_path] == 1:
+            raise RuntimeError("temporary failure")
+        return f"text {chunk_path[-5]}"
+
+    with patch('transcriber.transcription.transcribe_audio_chunk', side_effect=fake_transcribe), \
+         patch('transcriber.audio_processing.audio_duration', return_value=60.0):
+        result = transcribe_chunks(OpenAIBackend(MagicMock()), [str(f) for f in chunk_files], concurrency=3, retries=1)
+
+    assert result == [f"text {i}" for i in range(5)]
+    assert attempts[str(chunk_files[2])] == 2
+    assert all(count == 1 for path, count in attempts.items() if path != str(chunk_files[2]))
+    for chunk_file in chunk_files:
+        assert not chunk_file.exists()
+
+def test_transcribe_chunks_raises_after_retries(tmp_path):
+    chunk_file = tmp_path / "chunk_0.wav"
+    chunk_file.write_text("dummy chunk content")
+
+    with patch('transcriber.transcription.transcribe_audio_chunk', side_effect=RuntimeError("boom")), \
+         patch('transcriber.audio_processing.audio_duration', return_value=60.0):
+        with pytest.raises(RuntimeError):
+            transcribe_chunks(OpenAIBackend(MagicMock()), [str(chunk_file)], concurrency=2, retries=2)
+    assert chunk_file.exists()
+
+def test_transcribe_chunks_uses_cache(tmp_path):
+    from transcriber.cache import ResultCache
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=1024 * 1024)
+    chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(2)]
+    for chunk_file in chunk_files:
+        chunk_file.write_text("same audio")  # Duplicate media hashes the same
+
+    with patch('transcriber.transcription.get_cache', return_value=cache), \
+         patch('transcriber.transcription.transcribe_audio_chunk', return_value="hello") as mock_transcribe, \
+         patch('transcriber.audio_processing.audio_duration', return_value=60.0):
+        first = transcribe_chunks(OpenAIBackend(MagicMock()), [str(chunk_files[0])])
+        second = transcribe_chunks(OpenAIBackend(MagicMock()), [str(chunk_files[1])])
+
+    assert first == second == ["hello"]
+    assert mock_transcribe.call_count == 1
+
+def test_stub_backend_submits_batches_and_is_deterministic(tmp_path):
+    chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(5)]
+    for i, chunk_file in enumerate(chunk_files):
+        chunk_file.write_text(f"audio {i % 2}")
+    backend = StubBackend(batch_size=2)
+
+    with patch('transcriber.audio_processing.audio_duration', return_value=60.0):
+        result = transcribe_chunks(backend, [str(f) for f in chunk_files], concurrency=2)
+
+    assert sorted(len(batch) for batch in backend.batches) == [1, 2, 2]
+    assert result[0] == result[2] == result[4] != result[1]
+    assert all(text.startswith("transcript ") for text in result)
+
+def test_hybrid_backend_overflows_to_local_and_takes_short_recordings(tmp_path):
+    import threading
+    release = threading.Event()
+    engines = []
+
+    class Recording(StubBackend):
+        def __init__(self, name):
+            super().__init__()
+            self.provider = self.model = name
+
+        def transcribe(self, chunk_path):
+            engines.append(self.provider)
+            if self.provider == 'remote':
+                assert release.wait(5)
+            else:
+                release.set()  # The API is still busy when the overflow chunk runs locally
+            return self.provider
+
+    remote, local = Recording('remote'), Recording('local')
+    backend = HybridBackend(remote, local, remote_slots=1, local_slots=1, local_max_seconds=30)
+    assert backend.select(10) is local
+    assert backend.select(600) is backend
+
+    chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(2)]
+    for chunk_file in chunk_files:
+        chunk_file.write_text("audio")
+    with patch('transcriber.audio_processing.audio_duration', return_value=60.0):
+        result = transcribe_chunks(backend, [str(f) for f in chunk_files], concurrency=1)
+
+    assert sorted(result) == ['local', 'remote']
+    assert sorted(engines) == ['local', 'remote']
+
+def test_backend_without_transcribe_fails_at_construction():
+    from transcriber.transcription import TranscriptionBackend
+
+    class Incomplete(TranscriptionBackend):
+        provider = model = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_transcribe_audio_reserves_the_planned_chunk_count(tmp_path):
+    chunk_files = [tmp_path / f"chunk_{i}.wav" for i in range(5)]
+    for chunk_file in chunk_files:
+        chunk_file.write_text("audio")
+    quota = MagicMock()
+
+    with patch('transcriber.transcription.get_quota', return_value=quota), \
+         patch('transcriber.transcription.count_tokens_batch', return_value=[1] * 5), \
+         patch('transcriber.audio_processing.audio_duration', return_value=300.0):
+        transcribe_audio(str(tmp_path / "talk.wav"), chunks=[str(f) for f in chunk_files], chunk_seconds=100,
+                         chunk_count=5, backend=StubBackend())
+
+    assert quota.reserve.call_args.kwargs['requests'] == 5  # Not 300 / 100
+
+def test_transcribe_audio_records_planned_chunk_lengths_without_probing(tmp_path):
+    chunk_files = [tmp_path / f"chunk_{i}.flac" for i in range(3)]
+    for chunk_file in chunk_files:
+        chunk_file.write_text("audio")
+    quota = MagicMock()
+
+    with patch('transcriber.transcription.get_quota', return_value=quota), \
+         patch('transcriber.transcription.count_tokens_batch', return_value=[1] * 3), \
+         patch('transcriber.audio_processing.audio_duration', return_value=250.0) as duration:
+        transcribe_audio(str(tmp_path / "talk.mp4"), chunks=[str(f) for f in chunk_files], chunk_seconds=100,
+                         backend=StubBackend())
+
+    duration.assert_called_once()  # The recording itself, not every chunk
+    recorded = sorted(call.kwargs['audio_seconds'] for call in quota.record.call_args_list)
+    assert recorded == [50.0, 100.0, 100.0]
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from unittest.mock import patch
+import pytest
+from transcriber.manifest import Manifest
+from transcriber.quota import Usage
+from transcriber.watch import DirectoryWatcher, Inotify, watch_directories
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_files_are_handed_out_once_they_stop_changing(tmp_path):
+    clock = FakeClock()
+    watcher = DirectoryWatcher([tmp_path], poll=True, settle_seconds=2, clock=clock, ignore=[tmp_path / "out"])
+    recording = tmp_path / "lecture.mp3"
+    recording.write_bytes(b"part")
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "lecture.md").write_text("transcript")  # Outputs are never inputs
+    (tmp_path / "notes.txt").write_text("not media")
+
+    watcher._scan()
+    clock.now = 1.5
+    recording.write_bytes(b"part two")  # Still being written
+    watcher._scan()
+    clock.now = 3.0
+    assert watcher._settled() == []
+
+    clock.now = 4.0
+    assert watcher._settled() == [recording.resolve()]
+    watcher._scan()
+    clock.now = 10.0
+    assert watcher._settled() == []  # Not handed out again while unchanged
+
+    recording.unlink()
+    watcher._scan()
+    assert watcher._handed_out == {}  # Deleted files are forgotten
+
+def test_manifest_skips_files_finished_before(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "done.mp3").write_bytes(b"old")
+    (library / "new.mp3").write_bytes(b"new")
+    manifest = Manifest(tmp_path / "manifest.sqlite")
+    manifest.needs_work(library / "done.mp3")
+    manifest.mark(library / "done.mp3", 'refine', 'done')
+    clock = FakeClock()
+    watcher = DirectoryWatcher([library], manifest=manifest, poll=True, settle_seconds=1, clock=clock)
+
+    watcher._scan()
+    clock.now = 1.0
+    assert [path.name for path in watcher._settled()] == ["new.mp3"]
+
+def test_inotify_notices_files_in_new_directories(tmp_path):
+    try:
+        Inotify().close()
+    except OSError:
+        pytest.skip("inotify is not available")
+    watcher = DirectoryWatcher([tmp_path], settle_seconds=0.1)
+    found = []
+    thread = threading.Thread(target=lambda: found.extend(watcher.files()))
+    thread.start()
+    try:
+        subdirectory = tmp_path / "monday"
+        subdirectory.mkdir()
+        (subdirectory / "lecture.wav").write_bytes(b"audio")
+        for _ in range(100):
+            if found:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        watcher.stop()
+        thread.join(5)
+    assert found == [(subdirectory / "lecture.wav").resolve()]
+    assert not thread.is_alive()
+
+def test_watch_processes_dropped_files_in_one_pipeline(tmp_path, make_config):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    config = make_config(tmp_path, output_dir=tmp_path / "out", cache_dir=tmp_path / "cache")
+    config.output_dir.mkdir()
+    watcher = DirectoryWatcher([inbox], poll=True, settle_seconds=0, poll_seconds=0.01)
+    refined = []
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        output_path.write_text(input_path.read_text().upper())
+        refined.append(limiter)
+        return Usage(requests=1)
+
+    def finished(path):
+        if len(refined) == 2:
+            watcher.stop()
+        else:
+            (inbox / "second.md").write_text("second")  # Dropped while the daemon runs
+
+    (inbox / "first.md").write_text("first")
+    with patch('transcriber.token_utils.count_tokens', return_value=0), \
+         patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+        asyncio.run(asyncio.wait_for(
+            watch_directories([inbox], config.output_dir, tmp_path / "instructions.md", config, on_file_done=finished,
+                              watcher=watcher),
+            10,
+        ))
+
+    assert (config.output_dir / "first_refined.md").read_text() == "FIRST"
+    assert (config.output_dir / "second_refined.md").read_text() == "SECOND"
+    assert refined[0] is refined[1]  # Both files shared one pipeline and its rate limiter
+
+def test_watch_processes_a_replaced_recording_again(tmp_path, make_config):
+    from transcriber.manifest import Manifest
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    config = make_config(tmp_path, output_dir=tmp_path / "out", cache_dir=tmp_path / "cache")
+    config.output_dir.mkdir()
+    recording = inbox / "lecture.md"
+    watcher = DirectoryWatcher([inbox], manifest=Manifest(config.cache_dir / 'manifest.sqlite'), poll=True,
+                               settle_seconds=0, poll_seconds=0.01)
+    finished = []
+
+    async def fake_refine(input_path, output_path, instructions_path, config, limiter):
+        output_path.write_text(input_path.read_text().upper())
+        return Usage(requests=1)
+
+    def done(path):
+        finished.append(path)
+        if len(finished) == 2:
+            watcher.stop()
+        else:
+            recording.write_text("second take")  # Re-recorded under the same name
+
+    recording.write_text("first take")
+    with patch('transcriber.token_utils.count_tokens', return_value=0), \
+         patch('transcriber.pipeline.process_with_refinement', side_effect=fake_refine):
+        asyncio.run(asyncio.wait_for(
+            watch_directories([inbox], config.output_dir, tmp_path / "instructions.md", config, on_file_done=done,
+                              watcher=watcher),
+            10,
+        ))
+
+    assert finished == [recording.resolve()] * 2
+    assert (config.output_dir / "lecture_refined.md").read_text() == "SECOND TAKE"
@@ -1,20 +1,26 @@
+import contextlib
 import logging
 import sys
+import time
 import os  # Add this import
 from pathlib import Path
 import click
-from tqdm import tqdm
 from colorama import init, Fore, Style
 import asyncio
 from dotenv import load_dotenv
-from .refinement_processing import process_with_refinement, process_multiple_files
-from .audio_processing import process_audio_file
 
 from .config import Config
+from .quota import configure_quota
+from .cache import configure_cache
+from .clients import get_clients
 from .file_handler import FileHandler
-from .video_processing import process_file
 from .exceptions import TranscriberError, APIKeyError
-from .api_utils import test_openai_api_key, test_anthropic_api_key, test_openrouter_api_key, test_api_keys
+from .api_utils import validate_api_keys
+from .metrics import export_metrics
+
+# The processing modules pull in the API libraries, pydub, NumPy and tiktoken, which take
+# seconds to import; they are imported in the functions that need them so that short
+# invocations (a single transcript, `cache info`, --help) start quickly.
 
 init(autoreset=True)  # Initialize colorama
 
@@ -42,7 +48,8 @@ def setup_logging(verbose):
     handler.setFormatter(ColoredFormatter('%(asctime)s - %(levelname)s - %(message)s'))
     logger.addHandler(handler)
 
-async def async_main(input_path: Path, output_path: Path, output_dir: Path, instructions_path: Path, config: Config, verbose: bool):
+async def async_main(input_path: Path, output_path: Path, output_dir: Path, instructions_path: Path, config: Config, verbose: bool,
+                     stream: bool = False, batch: bool = False):
     """
     Main asynchronous function to process input files or directories.
 
@@ -53,48 +60,163 @@ async def async_main(input_path: Path, output_path: Path, output_dir: Path, inst
         instructions_path (Path): Path to the instructions file for refinement.
         config (Config): Configuration object.
         verbose (bool): Whether to print verbose output.
+        stream (bool): Whether to print the refined transcript to stdout as it is generated;
+            progress messages then go to stderr.
+        batch (bool): Whether to refine a directory through the provider's batch API.
 
     This function handles different types of inputs (directory, audio file, video file, or markdown file)
-    and processes them accordingly, including transcription and optional refinement.
+    and processes them accordingly, including transcription and optional refinement. FFmpeg and
+    transcription run off the event loop so API calls already in flight keep running.
     """
-    if input_path.is_dir():
-        input_files = FileHandler.list_media_files(input_path) + list(input_path.glob('*.md'))  # Include .md files
-        total_files = len(input_files)
-        if not verbose:
-            print(f"Processing {total_files} files...")
-        with tqdm(total=total_files, disable=verbose) as pbar:
-            await process_multiple_files(input_files, output_dir, instructions_path, config, pbar)
-    elif input_path.suffix.lower() in ['.mp3', '.wav']:
-        if not verbose:
-            print(f"Processing audio file: {input_path.name}")
-        transcript_path = process_audio_file(input_path, output_dir)
-        if instructions_path:
+    from .refinement_processing import process_with_refinement, process_multiple_files
+    from .audio_processing import FFmpegPool, extract_media_audio_async, process_audio_file
+    from .video_processing import process_file
+
+    status = sys.stderr if stream else sys.stdout
+    output_stream = sys.stdout if stream else None
+    try:
+        if batch and not input_path.is_dir():
+            raise TranscriberError("--batch only applies to directories")
+        if input_path.is_dir():
+            if stream:
+                logging.warning("--stream only applies to single files; directory output is written to files")
+            from tqdm import tqdm
+            from .manifest import Manifest
+            # Files stream in from the scan, so the total is not known up front
+            manifest = Manifest(config.cache_dir / 'manifest.sqlite')
+            # Transcripts written to the output directory must not be picked up as inputs next time
+            input_files = manifest.discover(
+                input_path, config.scan_include, config.scan_exclude, ignore=[output_dir, config.instructions_dir],
+            )
             if not verbose:
-                print("Refining transcript with AI...")
-            await process_with_refinement(transcript_path, output_path, instructions_path, config)
-    else:
-        if input_path.suffix.lower() == '.md':
+                print(f"Processing files in {input_path}...", file=status)
+            with tqdm(disable=verbose, unit='file') as pbar:
+                if batch:
+                    from .batch_processing import run_batch_refinement
+                    await run_batch_refinement(input_files, output_dir, instructions_path, config, pbar, manifest)
+                else:
+                    await process_multiple_files(input_files, output_dir, instructions_path, config, pbar, manifest)
+        elif input_path.suffix.lower() in ['.mp3', '.wav']:
             if not verbose:
-                print(f"Refining transcript: {input_path.name}")
-            await process_with_refinement(input_path, output_path, instructions_path, config)
-        else:
-            if not verbose:
-                print(f"Processing video file: {input_path.name}")
-            transcript_path = process_file(input_path, output_dir)
+                print(f"Processing audio file: {input_path.name}", file=status)
+            ffmpeg = FFmpegPool.from_config(config)
+            audio_path = await extract_media_audio_async(input_path, output_dir, config, ffmpeg)
+            transcript_path = await asyncio.to_thread(process_audio_file, input_path, output_dir, config, audio_path, ffmpeg)
             if instructions_path:
                 if not verbose:
-                    print("Refining transcript with AI...")
-                await process_with_refinement(transcript_path, output_path, instructions_path, config)
+                    print("Refining transcript with AI...", file=status)
+                await process_with_refinement(transcript_path, output_path, instructions_path, config, stream=output_stream)
+        else:
+            if input_path.suffix.lower() == '.md':
+                if not verbose:
+                    print(f"Refining transcript: {input_path.name}", file=status)
+                await process_with_refinement(input_path, output_path, instructions_path, config, stream=output_stream)
+            else:
+                if not verbose:
+                    print(f"Processing video file: {input_path.name}", file=status)
+                ffmpeg = FFmpegPool.from_config(config)
+                audio_path = await extract_media_audio_async(input_path, output_dir, config, ffmpeg)
+                transcript_path = await asyncio.to_thread(process_file, input_path, output_dir, config, audio_path, ffmpeg)
+                if instructions_path:
+                    if not verbose:
+                        print("Refining transcript with AI...", file=status)
+                    await process_with_refinement(transcript_path, output_path, instructions_path, config, stream=output_stream)
+    finally:
+        await get_clients().aclose()  # Close the shared connection pools before the event loop ends
 
-@click.command()
+def required_providers(input_path: Path, instructions_path: Path, config: Config, batch: bool = False,
+                       ignore: list[Path] = None) -> set:
+    """
+    Return the API providers a job will call, so only their keys need to be checked.
+
+    Args:
+        input_path (Path): Path to the input file or directory.
+        instructions_path (Path): Path to the instructions file, or None.
+        config (Config): Configuration object.
+        batch (bool): Whether refinement goes through the batch API.
+        ignore (list[Path]): Files and directories a directory scan leaves out (optional).
+
+    Returns:
+        set: Provider names ('openai' for Whisper unless transcription runs locally, plus the
+        refinement provider).
+    """
+    transcription = {'openai'} if config.transcription_backend == 'openai' else set()
+    if batch:
+        refinement = config.batch_provider
+    else:
+        refinement = 'openrouter' if config.use_openrouter else 'anthropic'
+    if input_path.is_dir():
+        # Every file of a directory is refined; media files are transcribed first
+        from .manifest import scan_media
+        providers = {refinement}
+        files = scan_media(input_path, config.scan_include, config.scan_exclude, ignore=ignore)
+        if any(path.suffix.lower() != '.md' for path, _ in files):  # Stops at the first media file
+            providers |= transcription
+        return providers
+    if input_path.suffix.lower() == '.md':
+        return {refinement}
+    return transcription | {refinement} if instructions_path else transcription
+
+def resolve_instructions(instructions: str, config: Config) -> Path:
+    """
+    Find the instructions file named on the command line.
+
+    Args:
+        instructions (str): Name of a file in the instructions folder, or a full path (optional).
+        config (Config): Configuration object.
+
+    Returns:
+        Path: The instructions file, or None if no instructions were given.
+
+    Raises:
+        TranscriberError: If the file does not exist.
+    """
+    if not instructions:
+        return None
+    instructions_path = Path(instructions) if Path(instructions).is_absolute() else config.instructions_dir / instructions
+    if not instructions_path.exists():
+        raise TranscriberError(f"Instructions file '{instructions_path}' does not exist.")
+    return instructions_path
+
+class DefaultCommandGroup(click.Group):
+    """A command group that runs its default command when no subcommand is named."""
+
+    default_command = 'run'
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+@click.group(cls=DefaultCommandGroup)
+def main():
+    """
+    Convert video and audio files to text and refine the transcripts with AI.
+
+    Run `transcriber INPUT_PATH [OPTIONS]` to process a file or directory
+    (shorthand for `transcriber run`).
+    """
+
+@main.command()
 @click.argument('input_path', type=click.Path(exists=True))
 @click.option('--output', help="Path to save the output markdown file (optional)")
 @click.option('--output-dir', help="Directory to save all output files (optional)")
 @click.option('--instructions', help="Name of the instructions file in the 'instructions' folder, or full path to a custom instructions file")
+@click.option('--concurrency', type=click.IntRange(min=1), help="Number of audio chunks to transcribe at once (overrides config.yaml)")
+@click.option('--resume', is_flag=True, help="Continue interrupted jobs from their last completed chunk")
+@click.option('--include', multiple=True, help="Only process files matching this glob in a directory (repeatable)")
+@click.option('--exclude', multiple=True, help="Skip files and folders matching this glob in a directory (repeatable)")
+@click.option('--metrics-report', help="Write a JSON report of stage timings and counters to this file")
+@click.option('--metrics-textfile', help="Write the run's metrics in Prometheus text format to this file")
+@click.option('--batch', is_flag=True, help="Refine a directory through the provider's batch API, without per-minute limits")
+@click.option('--stream', is_flag=True, help="Print the refined transcript to stdout as it is generated")
+@click.option('--profile', is_flag=True, help="Profile CPU time and memory per stage and save the results next to the outputs")
 @click.option('--verbose', is_flag=True, help="Print detailed log messages")
-def main(input_path: str, output: str, output_dir: str, instructions: str, verbose: bool):
+def run(input_path: str, output: str, output_dir: str, instructions: str, concurrency: int, resume: bool,
+        include: tuple, exclude: tuple, metrics_report: str, metrics_textfile: str, batch: bool, stream: bool,
+        profile: bool, verbose: bool):
     """
-    CLI entry point for the transcriber tool.
+    Transcribe and optionally refine a file or directory.
 
     This function sets up the environment, loads configuration, and initiates the processing
     of input files or directories. It handles command-line arguments and options, sets up logging,
@@ -105,35 +227,55 @@ def main(input_path: str, output: str, output_dir: str, instructions: str, verbo
         output (str): Path to save the output markdown file (optional).
         output_dir (str): Directory to save all output files (optional).
         instructions (str): Name of the instructions file or path to a custom instructions file.
+        concurrency (int): Number of audio chunks to transcribe at once (optional).
+        resume (bool): Whether to continue interrupted jobs from their checkpoint journals.
+        include (tuple): Glob patterns of files to process in a directory (added to config.yaml's).
+        exclude (tuple): Glob patterns of files and folders to skip in a directory (added to config.yaml's).
+        metrics_report (str): Path of the JSON metrics report (overrides config.yaml).
+        metrics_textfile (str): Path of the Prometheus metrics textfile (overrides config.yaml).
+        batch (bool): Whether to refine a directory through the provider's batch API.
+        stream (bool): Whether to print the refined transcript to stdout as it is generated.
+        profile (bool): Whether to profile the run into a profile_<time> folder in the output directory.
         verbose (bool): Whether to print verbose output.
     """
     setup_logging(verbose)
     
     try:
         config = Config.from_file(Path('config.yaml'))
+        if concurrency:
+            config.transcription_concurrency = concurrency
+        if resume:
+            config.resume = True
+        config.scan_include = [*config.scan_include, *include]
+        config.scan_exclude = [*config.scan_exclude, *exclude]
+        if metrics_report:
+            config.metrics_report = metrics_report
+        if metrics_textfile:
+            config.metrics_textfile = metrics_textfile
+        configure_quota(config)
+        configure_cache(config)
         
         # Set the API keys
         os.environ['OPENAI_API_KEY'] = config.openai_api_key
         os.environ['ANTHROPIC_API_KEY'] = config.anthropic_api_key
         os.environ['OPENROUTER_API_KEY'] = config.openrouter_api_key
         
-        # Test API keys
-        test_api_keys(config)
-        
         input_path = Path(input_path)
         
-        if instructions:
-            instructions_path = Path(instructions) if Path(instructions).is_absolute() else config.instructions_dir / instructions
-            if not instructions_path.exists():
-                raise TranscriberError(f"Instructions file '{instructions_path}' does not exist.")
-        else:
-            instructions_path = None
+        instructions_path = resolve_instructions(instructions, config)
 
         if output_dir:
             output_dir = Path(output_dir)
         else:
             output_dir = config.output_dir
 
+        # Test the API keys this job needs, unless they were validated recently
+        validate_api_keys(
+            required_providers(input_path, instructions_path, config, batch, ignore=[output_dir, config.instructions_dir]),
+            config.cache_dir / 'api_keys.json',
+            config.api_key_check_ttl_hours * 60 * 60,
+        )
+
         if output:
             output_path = Path(output)
         else:
@@ -141,9 +283,109 @@ def main(input_path: str, output: str, output_dir: str, instructions: str, verbo
 
         FileHandler.ensure_dir(output_dir)
 
-        asyncio.run(async_main(input_path, output_path, output_dir, instructions_path, config, verbose))
+        if profile:
+            from .profiling import Profiler
+            profiler = Profiler(output_dir / f"profile_{time.strftime('%Y%m%d_%H%M%S')}")
+        else:
+            profiler = contextlib.nullcontext()
+        try:
+            with profiler:
+                asyncio.run(async_main(input_path, output_path, output_dir, instructions_path, config, verbose, stream, batch))
+        finally:
+            export_metrics(config)  # Failed runs are reported too
+            if profile:
+                print(f"Profile saved to: {profiler.directory}", file=sys.stderr if stream else sys.stdout)
+
+        print(f"{Fore.GREEN}Processing completed. Output saved to: {output_path}{Style.RESET_ALL}",
+              file=sys.stderr if stream else sys.stdout)
+
+    except APIKeyError as e:
+        print(f"{Fore.RED}API Key Error: {str(e)}{Style.RESET_ALL}")
+        sys.exit(1)
+    except TranscriberError as e:
+        print(f"{Fore.RED}Error: {str(e)}{Style.RESET_ALL}")
+        sys.exit(1)
+    except Exception as e:
+        if verbose:
+            logging.exception("An unexpected error occurred:")
+        else:
+            print(f"{Fore.RED}An error occurred: {str(e)}{Style.RESET_ALL}")
+        sys.exit(1)
+
+@main.command()
+@click.argument('directories', nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--output-dir', help="Directory to save all output files (optional)")
+@click.option('--instructions', help="Name of the instructions file in the 'instructions' folder, or full path to a custom instructions file")
+@click.option('--include', multiple=True, help="Only process files matching this glob (repeatable)")
+@click.option('--exclude', multiple=True, help="Skip files and folders matching this glob (repeatable)")
+@click.option('--poll', is_flag=True, help="Rescan the directories instead of using inotify (e.g. for network shares)")
+@click.option('--metrics-textfile', help="Keep the daemon's metrics in Prometheus text format in this file")
+@click.option('--verbose', is_flag=True, help="Print detailed log messages")
+def watch(directories: tuple, output_dir: str, instructions: str, include: tuple, exclude: tuple, poll: bool,
+          metrics_textfile: str, verbose: bool):
+    """
+    Process recordings as they are dropped into directories, until interrupted.
+
+    Configuration, API key checks and imports happen once when the daemon starts, and
+    API clients, the tokenizer and any local Whisper model stay loaded between files,
+    so a new recording starts processing within seconds of being completely written.
+
+    Args:
+        directories (tuple): The directories to watch.
+        output_dir (str): Directory to save all output files (optional).
+        instructions (str): Name of the instructions file or path to a custom instructions file.
+        include (tuple): Glob patterns of files to process (added to config.yaml's).
+        exclude (tuple): Glob patterns of files and folders to skip (added to config.yaml's).
+        poll (bool): Whether to rescan the directories instead of using inotify.
+        metrics_textfile (str): Path of the Prometheus metrics textfile, updated after every file.
+        verbose (bool): Whether to print verbose output.
+    """
+    setup_logging(verbose)
+    try:
+        config = Config.from_file(Path('config.yaml'))
+        config.scan_include = [*config.scan_include, *include]
+        config.scan_exclude = [*config.scan_exclude, *exclude]
+        if metrics_textfile:
+            config.metrics_textfile = metrics_textfile
+        configure_quota(config)
+        configure_cache(config)
+        os.environ['OPENAI_API_KEY'] = config.openai_api_key
+        os.environ['ANTHROPIC_API_KEY'] = config.anthropic_api_key
+        os.environ['OPENROUTER_API_KEY'] = config.openrouter_api_key
+
+        instructions_path = resolve_instructions(instructions, config)
+        refinement = 'openrouter' if config.use_openrouter else 'anthropic'
+        transcription = {'openai'} if config.transcription_backend == 'openai' else set()
+        validate_api_keys(  # Checked once for the whole session
+            transcription | {refinement},
+            config.cache_dir / 'api_keys.json',
+            config.api_key_check_ttl_hours * 60 * 60,
+        )
+        output_dir = Path(output_dir) if output_dir else config.output_dir
+        FileHandler.ensure_dir(output_dir)
+
+        from .watch import watch_directories
+
+        def queued(path: Path):
+            print(f"Queued: {path}")
+
+        def finished(path: Path):
+            export_metrics(config)  # Keep the textfile current for the collector
+
+        print(f"Watching {', '.join(directories)} (Ctrl+C to stop)...")
 
-        print(f"{Fore.GREEN}Processing completed. Output saved to: {output_path}{Style.RESET_ALL}")
+        async def session():
+            try:
+                await watch_directories([Path(d) for d in directories], output_dir, instructions_path, config, poll,
+                                        queued, finished)
+            finally:
+                await get_clients().aclose()
+
+        try:
+            asyncio.run(session())
+        finally:
+            export_metrics(config)
+        print(f"{Fore.GREEN}Stopped watching. Output saved to: {output_dir}{Style.RESET_ALL}")
 
     except APIKeyError as e:
         print(f"{Fore.RED}API Key Error: {str(e)}{Style.RESET_ALL}")
@@ -151,6 +393,9 @@ def main(input_path: str, output: str, output_dir: str, instructions: str, verbo
     except TranscriberError as e:
         print(f"{Fore.RED}Error: {str(e)}{Style.RESET_ALL}")
         sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"{Fore.YELLOW}Interrupted.{Style.RESET_ALL}")
+        sys.exit(130)
     except Exception as e:
         if verbose:
             logging.exception("An unexpected error occurred:")
@@ -158,5 +403,43 @@ def main(input_path: str, output: str, output_dir: str, instructions: str, verbo
             print(f"{Fore.RED}An error occurred: {str(e)}{Style.RESET_ALL}")
         sys.exit(1)
 
+def format_bytes(size: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} B"
+        size /= 1024
+
+@main.group()
+def cache():
+    """Inspect and prune the API result cache."""
+
+@cache.command()
+def info():
+    """Show what is stored in the result cache."""
+    config = Config.from_file(Path('config.yaml'))
+    stats = configure_cache(config).stats()
+    print(f"Cache: {stats['path']} (limit {format_bytes(stats['max_bytes'])})")
+    if not stats['namespaces']:
+        print("  The cache is empty.")
+    for namespace, entry in sorted(stats['namespaces'].items()):
+        print(f"  {namespace}: {entry['entries']} entries, {format_bytes(entry['bytes'])}")
+
+@cache.command()
+@click.option('--max-size', type=float, help="Evict least recently used entries until the cache is at most this many MB")
+@click.option('--older-than', type=float, help="Remove entries not used for this many days")
+@click.option('--namespace', help="Remove every entry of this kind (e.g. 'transcription')")
+def prune(max_size: float, older_than: float, namespace: str):
+    """Remove entries from the result cache."""
+    config = Config.from_file(Path('config.yaml'))
+    result_cache = configure_cache(config)
+    if max_size is None and older_than is None and namespace is None:
+        max_size = config.cache_max_mb
+    removed = result_cache.prune(
+        max_bytes=int(max_size * 1024 * 1024) if max_size is not None else None,
+        older_than=older_than * 24 * 60 * 60 if older_than is not None else None,
+        namespace=namespace,
+    )
+    print(f"{Fore.GREEN}Removed {removed} cache entries.{Style.RESET_ALL}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
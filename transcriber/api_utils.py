@@ -1,6 +1,11 @@
+import hashlib
+import json
+import logging
 import os
-from openai import OpenAI
-from anthropic import Anthropic
+import time
+from pathlib import Path
+from .clients import get_clients
+from .file_handler import FileHandler
 from .exceptions import APIKeyError
 
 def test_openai_api_key():
@@ -8,7 +13,7 @@ def test_openai_api_key():
     if not api_key:
         raise APIKeyError("OpenAI API key is not set in the environment variables.")
     
-    client = OpenAI(api_key=api_key)
+    client = get_clients().openai()
     try:
         # Make a simple API call to test the key
         client.models.list()
@@ -20,14 +25,10 @@ def test_anthropic_api_key():
     if not api_key:
         raise APIKeyError("Anthropic API key is not set in the environment variables.")
     
-    client = Anthropic(api_key=api_key)
+    client = get_clients().anthropic()
     try:
-        # Make a simple API call to test the key
-        client.completions.create(
-            model="claude-2.1",
-            max_tokens_to_sample=1,
-            prompt="Human: Test\n\nAssistant: This is a test."
-        )
+        # Listing models checks the key without using any tokens
+        client.models.list(limit=1)
     except Exception as e:
         raise APIKeyError(f"Error testing Anthropic API key: {str(e)}")
 
@@ -36,10 +37,7 @@ def test_openrouter_api_key():
     if not api_key:
         raise APIKeyError("OpenRouter API key is not set in the environment variables.")
     
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+    client = get_clients().openrouter()
     try:
         # Make a simple API call to test the key
         response = client.chat.completions.create(
@@ -53,9 +51,48 @@ def test_openrouter_api_key():
     except Exception as e:
         raise APIKeyError(f"Error testing OpenRouter API key: {str(e)}")
 
-def test_api_keys(config):
-    if config.use_openrouter:
-        test_openrouter_api_key()
-    else:
-        test_openai_api_key()
-        test_anthropic_api_key()
\ No newline at end of file
+KEY_CHECKS = {
+    'openai': ('OPENAI_API_KEY', test_openai_api_key),
+    'anthropic': ('ANTHROPIC_API_KEY', test_anthropic_api_key),
+    'openrouter': ('OPENROUTER_API_KEY', test_openrouter_api_key),
+}
+
+def validate_api_keys(providers, cache_path: Path = None, ttl_seconds: float = 24 * 60 * 60, clock=time.time):
+    """
+    Check the API keys of the providers a job uses, skipping recently validated keys.
+
+    A successful check is remembered in `cache_path` together with a hash of the key
+    (never the key itself), so later runs with the same key make no network call until
+    `ttl_seconds` have passed.
+
+    Args:
+        providers: Names of the providers to check ('openai', 'anthropic', 'openrouter').
+        cache_path (Path): File remembering successful checks (optional; without it every
+            key is checked).
+        ttl_seconds (float): How long a successful check is trusted.
+        clock: Function returning the current time in seconds.
+
+    Raises:
+        APIKeyError: If a key is missing or rejected.
+    """
+    checked = {}
+    if cache_path is not None and cache_path.exists():
+        try:
+            checked = json.loads(cache_path.read_text())
+        except ValueError:
+            checked = {}
+
+    now = clock()
+    for provider in sorted(providers):
+        env_var, check = KEY_CHECKS[provider]
+        api_key = os.getenv(env_var)
+        fingerprint = hashlib.sha256(api_key.encode()).hexdigest() if api_key else None
+        entry = checked.get(provider)
+        if fingerprint and entry and entry.get('key') == fingerprint and now - entry.get('checked', 0) < ttl_seconds:
+            logging.info(f"Skipping {provider} API key check (validated recently)")
+            continue
+        check()
+        checked[provider] = {'key': fingerprint, 'checked': now}
+        if cache_path is not None:
+            FileHandler.ensure_dir(cache_path.parent)
+            FileHandler.write_file(cache_path, json.dumps(checked))
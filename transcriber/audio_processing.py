@@ -1,57 +1,592 @@
+import asyncio
+import json
 import logging
+import os
+import queue
 import subprocess
-import shlex
+import threading
+import time
+import wave
 from pathlib import Path
-from pydub import AudioSegment
-from .exceptions import VideoProcessingError
+from typing import Iterator
+from .exceptions import VideoProcessingError, QuotaExceededError
 from .file_handler import FileHandler
+from .chunk_planner import SIZE_MARGIN, plan_chunks, plan_stream_chunks
+from .journal import JobJournal, open_journal, file_identity
+from .metrics import get_metrics
 
-def convert_video_to_audio(video_path: Path, audio_path: Path):
+# Chunk encodings suited to Whisper: 16 kHz mono is what the model works with internally.
+# The copy-* formats keep source audio that Whisper already accepts without re-encoding it.
+WHISPER_RESAMPLE = ['-ac', '1', '-ar', '16000']
+CHUNK_FORMATS = {
+    'flac': ('flac', [*WHISPER_RESAMPLE, '-c:a', 'flac']),
+    'opus': ('ogg', [*WHISPER_RESAMPLE, '-c:a', 'libopus', '-b:a', '24k', '-application', 'voip']),
+    'mp3': ('mp3', [*WHISPER_RESAMPLE, '-c:a', 'libmp3lame', '-b:a', '32k']),
+    'wav': ('wav', [*WHISPER_RESAMPLE, '-c:a', 'pcm_s16le']),
+    'copy-mp3': ('mp3', ['-c:a', 'copy']),
+    'copy-m4a': ('m4a', ['-c:a', 'copy']),
+    'copy-ogg': ('ogg', ['-c:a', 'copy']),
+    'copy-flac': ('flac', ['-c:a', 'copy']),
+}
+# Bitrates (bits per second) chunks over the upload limit are re-encoded with, as Opus
+SHRINK_MAX_BIT_RATE = 24000
+SHRINK_MIN_BIT_RATE = 6000  # The lowest bitrate libopus encodes at
+
+def available_cores() -> int:
+    """Return the number of CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        return os.cpu_count() or 1
+
+def _convert_command(video_path: Path, audio_path: Path, sample_rate: int, channels: int, threads: int = 0) -> list[str]:
+    return [
+        'ffmpeg', '-nostdin', '-y', '-loglevel', 'error',
+        *(['-threads', str(threads)] if threads else []),
+        '-i', str(video_path),
+        '-vn', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-ac', str(channels),
+        str(audio_path),
+    ]
+
+def convert_video_to_audio(video_path: Path, audio_path: Path, sample_rate: int = 44100, channels: int = 2, threads: int = 0):
     """
     Convert a video file to an audio file using FFmpeg.
 
     Args:
         video_path (Path): Path to the input video file.
         audio_path (Path): Path to save the output audio file.
+        sample_rate (int): Sample rate of the output in Hz. Default is 44100.
+        channels (int): Number of output channels. Default is 2.
+        threads (int): Number of threads FFmpeg may use; 0 lets FFmpeg decide.
 
     Raises:
         VideoProcessingError: If there's an error during the conversion process.
     """
     try:
         logging.info(f"Converting video to audio: {video_path.name}")
-        command = f"ffmpeg -i {shlex.quote(str(video_path))} -vn -acodec pcm_s16le -ar 44100 -ac 2 {shlex.quote(str(audio_path))}"
-        subprocess.run(command, shell=True, check=True, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        command = _convert_command(video_path, audio_path, sample_rate, channels, threads)
+        with get_metrics().span('ffmpeg_convert'):
+            subprocess.run(command, check=True, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
         logging.info("Conversion completed successfully")
     except subprocess.CalledProcessError as e:
         raise VideoProcessingError(f"Error converting video to audio: {e.stderr.decode()}")
 
-def split_audio(audio_path: Path, chunk_length_ms: int = 60000):
+def _parse_progress(line: str, state: dict) -> float:
+    """
+    Feed one line of FFmpeg `-progress` output into `state`.
+
+    Returns:
+        float: Seconds of input processed when the line ends a progress report, else None.
+    """
+    key, _, value = line.strip().partition('=')
+    if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+        state['seconds'] = int(value) / 1_000_000  # out_time_ms is in microseconds as well
+    elif key == 'progress':
+        return state.get('seconds', 0.0)
+    return None
+
+class FFmpegPool:
+    """
+    Runs FFmpeg conversions as asyncio subprocesses, a limited number at a time.
+
+    The event loop keeps serving API requests while videos decode. At most `processes`
+    conversions run at once, each limited to `threads` FFmpeg threads, so together
+    they fit the available cores instead of oversubscribing them. A pool created
+    inside a running event loop remembers it, so worker threads can run their
+    extractions on it too (see `extract_audio_chunks`).
+    """
+
+    def __init__(self, processes: int = 0, threads: int = 2):
+        self.threads = max(1, threads)
+        self.processes = processes or max(1, available_cores() // self.threads)
+        self._semaphore = None
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+
+    @classmethod
+    def from_config(cls, config: 'Config') -> 'FFmpegPool':
+        """Create a pool from `config.ffmpeg_processes` and `config.ffmpeg_threads`."""
+        return cls(config.ffmpeg_processes, config.ffmpeg_threads)
+
+    async def _run(self, command: list[str], on_progress, error: str, metric: str, on_report=None) -> None:
+        """
+        Run an FFmpeg command once a process slot is free, following its `-progress` reports.
+
+        `on_progress` gets the seconds of input processed so far and `on_report` (optional)
+        is called after every report. The process is killed if the caller is cancelled.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.processes)
+        command = [*command[:-1], '-progress', 'pipe:1', '-nostats', command[-1]]
+
+        async with self._semaphore:
+            started = time.perf_counter()  # Timed once a process slot is free
+            process = await asyncio.create_subprocess_exec(
+                *command, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+
+            async def follow_progress():
+                state = {}
+                async for line in process.stdout:
+                    seconds = _parse_progress(line.decode(), state)
+                    if seconds is not None:
+                        on_progress(seconds)
+                        if on_report:
+                            on_report()
+
+            try:
+                _, stderr = await asyncio.gather(follow_progress(), process.stderr.read())
+                if await process.wait() != 0:
+                    raise VideoProcessingError(f"{error}: {stderr.decode()}")
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                get_metrics().observe(metric, time.perf_counter() - started)
+
+    async def convert(self, video_path: Path, audio_path: Path, sample_rate: int = 44100, channels: int = 2,
+                      on_progress=None) -> None:
+        """
+        Convert a video file to a WAV file without blocking the event loop.
+
+        Args:
+            video_path (Path): Path to the input video file.
+            audio_path (Path): Path to save the output audio file.
+            sample_rate (int): Sample rate of the output in Hz. Default is 44100.
+            channels (int): Number of output channels. Default is 2.
+            on_progress: Called with the seconds of input converted so far, as FFmpeg
+                reports them (optional; logged at debug level otherwise).
+
+        Raises:
+            VideoProcessingError: If FFmpeg fails.
+        """
+        command = _convert_command(video_path, audio_path, sample_rate, channels, self.threads)
+        on_progress = on_progress or (lambda seconds: logging.debug(f"Converted {seconds:.0f}s of {video_path.name}"))
+        logging.info(f"Converting video to audio: {video_path.name}")
+        await self._run(command, on_progress, "Error converting video to audio", 'ffmpeg_convert')
+        logging.info("Conversion completed successfully")
+
+    async def segment(self, media_path: Path, chunk_dir: Path, chunk_seconds: int, chunk_format: str, on_chunk,
+                      on_progress=None) -> None:
+        """
+        Cut the audio of a media file into chunk files without blocking the event loop.
+
+        FFmpeg decodes the input once and writes the chunks with its segment muxer. The
+        segment list is read after every progress report, so each chunk is passed to
+        `on_chunk` within one report interval of FFmpeg finishing it.
+
+        Args:
+            media_path (Path): Path to the input video or audio file.
+            chunk_dir (Path): Directory to write the chunk files to.
+            chunk_seconds (int): Length of each chunk in seconds.
+            chunk_format (str): Chunk encoding, one of CHUNK_FORMATS.
+            on_chunk: Called with the path of each finished chunk, in playback order.
+            on_progress: Called with the seconds of input processed so far (optional;
+                logged at debug level otherwise).
+
+        Raises:
+            VideoProcessingError: If FFmpeg fails or the chunk format is unknown.
+        """
+        command, list_path = _segment_command(media_path, Path(chunk_dir), chunk_seconds, chunk_format, self.threads)
+        on_progress = on_progress or (lambda seconds: logging.debug(f"Extracted {seconds:.0f}s of {Path(media_path).name}"))
+        state = {}
+
+        def report_chunks(final: bool = False):
+            for chunk in _read_segment_list(list_path, Path(chunk_dir), state, final):
+                on_chunk(chunk)
+
+        logging.info(f"Extracting {chunk_seconds}s {chunk_format} chunks from: {Path(media_path).name}")
+        try:
+            await self._run(command, on_progress, "Error extracting audio chunks", 'ffmpeg_segment', report_chunks)
+            report_chunks(final=True)
+        finally:
+            if list_path.exists():
+                list_path.unlink()
+        logging.info("Chunk extraction completed successfully")
+
+    async def shrink(self, chunk_path: Path, seconds: float, max_bytes: int) -> Path:
+        """
+        Re-encode a chunk that came out over the upload limit as low-bitrate Opus.
+
+        Chunk lengths are planned from typical compression ratios and average bitrates,
+        so noisy audio or a variable bitrate can still push a chunk over the limit. The
+        bitrate is chosen so `seconds` of audio fit in `max_bytes`. The original chunk
+        is removed.
+
+        Args:
+            chunk_path (Path): The oversized chunk.
+            seconds (float): Length of the chunk in seconds (at most).
+            max_bytes (int): The upload size limit.
+
+        Returns:
+            Path: The re-encoded chunk.
+
+        Raises:
+            VideoProcessingError: If FFmpeg fails or the chunk does not fit even at the
+                lowest bitrate.
+        """
+        chunk_path = Path(chunk_path)
+        bit_rate = max(SHRINK_MIN_BIT_RATE, min(SHRINK_MAX_BIT_RATE, int(max_bytes * SIZE_MARGIN * 8 / seconds)))
+        output_path = chunk_path.with_name(f"{chunk_path.stem}_small.ogg")
+        command = [
+            'ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-threads', str(self.threads),
+            '-i', str(chunk_path),
+            '-vn', *WHISPER_RESAMPLE, '-c:a', 'libopus', '-b:a', str(bit_rate), '-application', 'voip',
+            str(output_path),
+        ]
+        logging.warning(f"Chunk {chunk_path.name} is over the upload limit, re-encoding it at {bit_rate // 1000} kbit/s")
+        try:
+            await self._run(command, lambda seconds: None, "Error re-encoding oversized chunk", 'ffmpeg_shrink')
+        except BaseException:
+            if output_path.exists():
+                output_path.unlink()
+            raise
+        chunk_path.unlink()
+        if output_path.stat().st_size > max_bytes:
+            raise VideoProcessingError(f"Chunk {chunk_path.name} does not fit under the upload limit even at {bit_rate} bit/s")
+        return output_path
+
+def audio_duration(audio_path) -> float:
     """
-    Split an audio file into chunks of specified length.
+    Get the duration of an audio file in seconds.
+
+    WAV files are measured from their header; other formats are probed with FFmpeg.
 
     Args:
-        audio_path (Path): Path to the input audio file.
-        chunk_length_ms (int): Length of each chunk in milliseconds. Default is 60000 (1 minute).
+        audio_path: Path to the audio file.
 
     Returns:
-        list: A list of paths to the created audio chunks.
+        float: The duration in seconds.
+    """
+    if str(audio_path).lower().endswith('.wav'):
+        with wave.open(str(audio_path), 'rb') as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    from pydub.utils import mediainfo  # Slow to import and only needed for non-WAV files
+    return float(mediainfo(str(audio_path))['duration'])
+
+def split_audio(audio_path: Path, chunk_length_ms: int = 60000) -> Iterator[str]:
+    """
+    Split a WAV file into chunks of specified length.
+
+    Frames are read lazily with the `wave` module and each chunk is written out before
+    the next one is read, so memory use stays at about one chunk regardless of the
+    length of the recording. Chunks are produced as the generator is consumed.
+
+    Args:
+        audio_path (Path): Path to the input WAV file.
+        chunk_length_ms (int): Length of each chunk in milliseconds. Default is 60000 (1 minute).
+
+    Yields:
+        str: Path to each created audio chunk, in playback order.
+
+    Raises:
+        VideoProcessingError: If the file is not a PCM WAV file.
     """
     logging.info("Splitting audio into chunks")
-    audio = AudioSegment.from_wav(str(audio_path))
-    chunks = []
-    for i, chunk in enumerate(audio[::chunk_length_ms]):
-        chunk_name = f"{audio_path}_chunk_{i}.wav"
-        chunk.export(chunk_name, format="wav")
-        chunks.append(chunk_name)
-    return chunks
+    try:
+        source = wave.open(str(audio_path), 'rb')
+    except (wave.Error, EOFError) as e:
+        raise VideoProcessingError(f"Cannot split {audio_path}: not a PCM WAV file ({str(e)})")
+
+    metrics = get_metrics()
+    with source:
+        params = source.getparams()
+        frames_per_chunk = max(1, params.framerate * chunk_length_ms // 1000)
+        i = 0
+        while True:
+            # Only reading and writing are timed, not the time the consumer holds the generator
+            with metrics.span('split_audio'):
+                frames = source.readframes(frames_per_chunk)
+                if not frames:
+                    break
+                chunk_name = f"{audio_path}_chunk_{i}.wav"
+                with wave.open(chunk_name, 'wb') as chunk:
+                    chunk.setparams(params)
+                    chunk.writeframes(frames)
+                del frames
+            yield chunk_name
+            i += 1
 
-def process_audio_file(audio_path: Path, output_dir: Path) -> Path:
+def _segment_command(media_path: Path, chunk_dir: Path, chunk_seconds: int, chunk_format: str,
+                     threads: int = 0) -> tuple[list[str], Path]:
+    if chunk_format not in CHUNK_FORMATS:
+        raise VideoProcessingError(f"Unknown chunk format '{chunk_format}'. Use one of: {', '.join(CHUNK_FORMATS)}")
+    extension, codec_args = CHUNK_FORMATS[chunk_format]
+    safe_base_name = FileHandler.safe_filename(Path(media_path).stem)
+    list_path = chunk_dir / f"{safe_base_name}_chunks.txt"
+    command = [
+        'ffmpeg', '-nostdin', '-y', '-loglevel', 'error',
+        *(['-threads', str(threads)] if threads else []),
+        '-i', str(media_path),
+        '-vn', *codec_args,
+        '-f', 'segment', '-segment_time', str(chunk_seconds), '-reset_timestamps', '1',
+        '-segment_list', str(list_path), '-segment_list_type', 'flat',
+        str(chunk_dir / f"{safe_base_name}_chunk_%05d.{extension}"),
+    ]
+    return command, list_path
+
+def _read_segment_list(list_path: Path, chunk_dir: Path, state: dict, final: bool = False) -> list[str]:
+    """
+    Return the chunks FFmpeg added to its segment list since the last call with `state`.
+
+    A line is only complete once FFmpeg has written its newline; the last, unterminated
+    line is kept in `state` until then, or returned as well if `final`.
+    """
+    if list_path.exists():
+        with list_path.open('r') as f:
+            f.seek(state.get('offset', 0))
+            state['pending'] = state.get('pending', '') + f.read()
+            state['offset'] = f.tell()
+    *names, state['pending'] = state.get('pending', '').split('\n')
+    if final:
+        names.append(state['pending'])
+        state['pending'] = ''
+    return [str(chunk_dir / name.strip()) for name in names if name.strip()]
+
+_END = object()  # Marks the end of the chunks passed from the event loop to `extract_audio_chunks`
+
+def extract_audio_chunks(media_path: Path, chunk_dir: Path, chunk_seconds: int = 60, chunk_format: str = 'flac',
+                         threads: int = 0, pool: FFmpegPool = None, max_bytes: int = 0) -> Iterator[str]:
+    """
+    Extract the audio of a media file straight into ready-to-upload chunk files.
+
+    FFmpeg decodes the input once and writes 16 kHz mono chunks (or stream-copies the
+    source audio) with its segment muxer, so no full-length intermediate WAV is written.
+    Chunks are yielded as soon as FFmpeg finishes them, which lets transcription start
+    on the first chunk while later ones are still being decoded.
+
+    This is meant for worker threads: FFmpeg runs through `pool.segment` on the pool's
+    event loop, so it counts against the pool's process limit like any conversion. Without
+    a pool bound to a running loop, a private one-process pool runs on a helper thread.
+    Closing the generator early stops FFmpeg. With `max_bytes`, every chunk is checked
+    before it is yielded and one that came out larger is re-encoded (see `FFmpegPool.shrink`).
+
+    Args:
+        media_path (Path): Path to the input video or audio file.
+        chunk_dir (Path): Directory to write the chunk files to.
+        chunk_seconds (int): Length of each chunk in seconds. Default is 60.
+        chunk_format (str): Chunk encoding, one of CHUNK_FORMATS. Default is 'flac'.
+        threads (int): Number of threads FFmpeg may use when no pool is given.
+        pool (FFmpegPool): The pool to run FFmpeg in (optional).
+        max_bytes (int): The upload size limit chunks must fit under (optional; 0 does
+            not check chunk sizes).
+
+    Yields:
+        str: Path to each finished chunk, in playback order.
+
+    Raises:
+        VideoProcessingError: If FFmpeg fails or the chunk format is unknown.
+    """
+    runner = None
+    if pool is None or pool.loop is None or not pool.loop.is_running():
+        loop = asyncio.new_event_loop()
+        runner = threading.Thread(target=loop.run_forever, name='ffmpeg-segment', daemon=True)
+        runner.start()
+        pool = FFmpegPool(1, threads or (pool.threads if pool else 0))
+    else:
+        loop = pool.loop
+
+    chunks = queue.Queue()
+    finished = threading.Event()
+    tasks = []
+
+    def done(task):
+        finished.set()
+        chunks.put(_END)
+
+    def start():
+        tasks.append(loop.create_task(pool.segment(media_path, Path(chunk_dir), chunk_seconds, chunk_format, chunks.put)))
+        tasks[0].add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    try:
+        while (chunk := chunks.get()) is not _END:
+            if max_bytes and os.path.getsize(chunk) > max_bytes:
+                chunk = str(asyncio.run_coroutine_threadsafe(pool.shrink(chunk, chunk_seconds, max_bytes), loop).result())
+            yield chunk
+        tasks[0].result()
+    finally:
+        if not finished.is_set():
+            loop.call_soon_threadsafe(lambda: tasks[0].cancel())  # The consumer stopped early; kill FFmpeg
+            finished.wait()
+        if runner is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            runner.join()
+            loop.close()
+
+def needs_extraction(media_path: Path, config: 'Config') -> bool:
+    """Return whether `transcribe_media` needs a WAV file converted from the media first."""
+    return config.audio_extraction != 'segment' and media_path.suffix.lower() != '.wav'
+
+def _extraction_target(media_path: Path, output_dir: Path, config: 'Config') -> tuple[Path, int, int]:
+    # Silence detection and Whisper both work on 16 kHz mono; the 'wav' mode keeps the original format
+    safe_base_name = FileHandler.safe_filename(media_path.stem)
+    audio_path = output_dir / f"{safe_base_name}_audio.wav"
+    if config.audio_extraction == 'silence':
+        return audio_path, 16000, 1
+    return audio_path, 44100, 2
+
+def extract_media_audio(media_path: Path, output_dir: Path, config: 'Config') -> Path:
+    """
+    Convert a video or audio file to the WAV file `transcribe_media` splits.
+
+    This is the CPU-bound part of the work, kept separate so it can run in another
+    process while earlier files are being transcribed. In 'segment' mode, or for WAV
+    input, there is nothing to convert and the input path is returned.
+
+    Args:
+        media_path (Path): Path to the input video or audio file.
+        output_dir (Path): Directory for the WAV file.
+        config (Config): Configuration object containing transcription settings.
+
+    Returns:
+        Path: Path to the audio to transcribe.
+
+    Raises:
+        VideoProcessingError: If the conversion fails.
+    """
+    if not needs_extraction(media_path, config):
+        return media_path
+    audio_path, sample_rate, channels = _extraction_target(media_path, output_dir, config)
+    convert_video_to_audio(media_path, audio_path, sample_rate, channels, config.ffmpeg_threads)
+    return audio_path
+
+async def extract_media_audio_async(media_path: Path, output_dir: Path, config: 'Config', pool: FFmpegPool) -> Path:
+    """
+    Like `extract_media_audio`, but converts in an FFmpeg subprocess of `pool` without
+    blocking the event loop.
+
+    Args:
+        media_path (Path): Path to the input video or audio file.
+        output_dir (Path): Directory for the WAV file.
+        config (Config): Configuration object containing transcription settings.
+        pool (FFmpegPool): The pool limiting concurrent conversions.
+
+    Returns:
+        Path: Path to the audio to transcribe.
+
+    Raises:
+        VideoProcessingError: If the conversion fails.
+    """
+    if not needs_extraction(media_path, config):
+        return media_path
+    audio_path, sample_rate, channels = _extraction_target(media_path, output_dir, config)
+    try:
+        await pool.convert(media_path, audio_path, sample_rate, channels)
+    except BaseException:
+        if audio_path.exists():
+            audio_path.unlink()
+        raise
+    return audio_path
+
+def transcribe_media(media_path: Path, output_dir: Path, config: 'Config', audio_path: Path = None,
+                     ffmpeg: FFmpegPool = None) -> tuple[str, list, JobJournal]:
+    """
+    Transcribe a video or audio file using the configured audio extraction mode.
+
+    - 'segment': FFmpeg streams compressed chunks straight from the input, copying the
+      source audio when Whisper accepts its codec.
+    - 'wav': the input is converted to a 44.1 kHz stereo WAV (unless it already is a
+      WAV file), which is split into fixed-length chunks.
+    - 'silence': the input is converted to a 16 kHz mono WAV (unless it already is a
+      WAV file), which is split at pauses with long silences left out.
+
+    Unless `config.chunk_seconds` is set, chunks are as long as fits under the upload
+    size limit, which keeps the number of requests to a minimum. Streamed chunks that
+    compress worse than planned are re-encoded to fit before they are uploaded. Completed chunks are
+    checkpointed in a journal, which `config.resume` picks up after a crash. The journal
+    is returned for the caller to discard once the transcript has been written.
+
+    Args:
+        media_path (Path): Path to the input video or audio file.
+        output_dir (Path): Directory for the temporary WAV file.
+        config (Config): Configuration object containing transcription settings.
+        audio_path (Path): WAV file already produced by `extract_media_audio` (optional).
+            It is removed afterwards like one converted here.
+        ffmpeg (FFmpegPool): Pool that 'segment' extraction runs in (optional).
+
+    Returns:
+        tuple[str, list, JobJournal]: The transcript, in 'silence' mode the timestamp map
+        giving the source spans of each chunk (None otherwise), and the job's journal.
+    """
+    from .transcription import transcribe_audio, create_backend  # Move this import here to avoid circular import
+    from .silence import plan_silence_chunks, split_audio_on_silence
+
+    max_bytes = int(config.max_upload_mb * 1024 * 1024)
+    options = dict(
+        concurrency=config.transcription_concurrency, retries=config.transcription_retries, backend=create_backend(config),
+    )
+    if config.audio_extraction == 'segment':
+        plan = plan_stream_chunks(media_path, config.chunk_format, config.chunk_seconds, max_bytes)
+        journal = open_journal(config, 'transcription', *file_identity(media_path), 'segment', plan.chunk_seconds, plan.chunk_format)
+        transcript = transcribe_audio(
+            media_path, streaming=True, chunk_seconds=plan.chunk_seconds, chunk_format=plan.chunk_format,
+            ffmpeg_threads=config.ffmpeg_threads, ffmpeg=ffmpeg, journal=journal, chunk_count=plan.chunk_count,
+            max_bytes=max_bytes, **options
+        )
+        return transcript, None, journal
+
+    try:
+        if audio_path is None:
+            audio_path = extract_media_audio(media_path, output_dir, config)
+
+        with wave.open(str(audio_path), 'rb') as wav_file:
+            bytes_per_second = wav_file.getframerate() * wav_file.getnchannels() * wav_file.getsampwidth()
+        plan = plan_chunks(audio_duration(audio_path), bytes_per_second, 'wav', config.chunk_seconds, max_bytes)
+        options['chunk_seconds'] = plan.chunk_seconds
+        options['journal'] = journal = open_journal(
+            config, 'transcription', *file_identity(media_path), config.audio_extraction, plan.chunk_seconds,
+            config.silence_threshold_db, config.skip_silence_seconds,
+        )
+
+        timestamp_map = None
+        if config.audio_extraction == 'silence':
+            timestamp_map = []
+            silence_plan = plan_silence_chunks(
+                audio_path, plan.chunk_seconds * 1000, config.silence_threshold_db, config.skip_silence_seconds,
+            )
+            chunks = split_audio_on_silence(audio_path, timestamp_map=timestamp_map, plan=silence_plan)
+            transcript = transcribe_audio(
+                audio_path, chunks=chunks, chunk_count=len(silence_plan),
+                chunk_durations=[sum(end - start for start, end in spans) for spans in silence_plan], **options
+            )
+        else:
+            transcript = transcribe_audio(audio_path, chunk_count=plan.chunk_count, **options)
+        return transcript, timestamp_map, journal
+    finally:
+        if audio_path is not None and audio_path != media_path and audio_path.exists():
+            logging.info(f"Removing temporary audio file: {audio_path}")
+            audio_path.unlink()
+
+def save_timestamp_map(transcript_path: Path, timestamp_map: list) -> None:
+    """
+    Save the chunk-to-source timestamp map next to a transcript.
+
+    Each entry lists the spans of the source audio, as [start, end] in seconds, that
+    were concatenated into the corresponding chunk.
+
+    Args:
+        transcript_path (Path): Path to the transcript file.
+        timestamp_map (list): The timestamp map from `transcribe_media`.
+    """
+    map_path = transcript_path.with_suffix('.timestamps.json')
+    chunks = [{'chunk': i, 'spans': [[round(start, 3), round(end, 3)] for start, end in spans]}
+              for i, spans in enumerate(timestamp_map)]
+    FileHandler.write_file(map_path, json.dumps(chunks, indent=2))
+
+def process_audio_file(audio_path: Path, output_dir: Path, config: 'Config', extracted_path: Path = None,
+                       ffmpeg: FFmpegPool = None) -> Path:
     """
     Process an audio file by transcribing it and saving the transcription.
 
     Args:
         audio_path (Path): Path to the input audio file.
         output_dir (Path): Directory to save the output transcription.
+        config (Config): Configuration object containing transcription settings.
+        extracted_path (Path): WAV file already produced by `extract_media_audio` (optional).
+        ffmpeg (FFmpegPool): Pool that 'segment' extraction runs in (optional).
 
     Returns:
         Path: Path to the saved transcription file.
@@ -59,19 +594,22 @@ def process_audio_file(audio_path: Path, output_dir: Path) -> Path:
     Raises:
         VideoProcessingError: If there's an error during audio processing.
     """
-    from .transcription import transcribe_audio  # Move this import here to avoid circular import
-
     logging.info(f"Processing audio file: {audio_path.name}")
     safe_base_name = FileHandler.safe_filename(audio_path.stem)
     transcript_path = output_dir / f"{safe_base_name}.md"
 
     try:
-        transcript = transcribe_audio(audio_path)
+        transcript, timestamp_map, journal = transcribe_media(audio_path, output_dir, config, extracted_path, ffmpeg)
         
         logging.info(f"Saving transcription to: {transcript_path}")
         FileHandler.write_file(transcript_path, f"# Transcription: {audio_path.name}\n\n{transcript}")
+        if timestamp_map is not None:
+            save_timestamp_map(transcript_path, timestamp_map)
+        journal.discard()
         
         logging.info("Transcription saved successfully")
         return transcript_path
+    except QuotaExceededError:
+        raise
     except Exception as e:
-        raise VideoProcessingError(f"Error processing {audio_path}: {str(e)}")
\ No newline at end of file
+        raise VideoProcessingError(f"Error processing {audio_path}: {str(e)}")
@@ -0,0 +1,403 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from .audio_processing import FFmpegPool, extract_media_audio_async, process_audio_file
+from .video_processing import process_file
+from .cache import get_cache
+from .clients import get_clients
+from .config import Config
+from .exceptions import BatchJobFailedError, RefinementProcessingError
+from .file_handler import FileHandler
+from .manifest import Manifest
+from .pipeline import VIDEO_SUFFIXES, AUDIO_SUFFIXES, already_processed
+from .quota import Usage, get_quota
+from .refinement_processing import plan_refinement, refinement_cache_key, refinement_prompt
+from .token_utils import count_tokens, count_tokens_batch
+
+ANTHROPIC_API_URL = "https://api.anthropic.com"
+ANTHROPIC_VERSION = "2023-06-01"
+OPENAI_API_URL = "https://api.openai.com/v1"
+
+@dataclass
+class BatchRequest:
+    """One refinement request of a batch job."""
+    custom_id: str
+    model: str
+    system: str
+    prompt: str
+    max_tokens: int
+    temperature: float
+
+@dataclass
+class BatchResult:
+    """The outcome of one request of a batch job; `text` is None if it failed."""
+    custom_id: str
+    text: str = None
+    usage: Usage = field(default_factory=Usage)
+    error: str = None
+
+def _check(response, action: str) -> None:
+    if response.status_code >= 400:
+        raise RefinementProcessingError(f"Batch API error while {action}: {response.status_code} {response.text}")
+
+class AnthropicBatches:
+    """The Anthropic Message Batches API."""
+
+    provider = 'anthropic'
+    max_requests = 100000
+
+    def __init__(self, http, api_key: str, base_url: str = None):
+        self.http = http
+        self.base_url = (base_url or os.getenv('ANTHROPIC_BASE_URL') or ANTHROPIC_API_URL).rstrip('/')
+        self.headers = {'x-api-key': api_key, 'anthropic-version': ANTHROPIC_VERSION}
+
+    async def submit(self, requests: list[BatchRequest]) -> str:
+        """Create a batch job and return its id."""
+        body = {'requests': [
+            {
+                'custom_id': request.custom_id,
+                'params': {
+                    'model': request.model,
+                    'max_tokens': request.max_tokens,
+                    'temperature': request.temperature,
+                    'system': request.system,
+                    'messages': [{'role': 'user', 'content': request.prompt}],
+                },
+            }
+            for request in requests
+        ]}
+        response = await self.http.post(f"{self.base_url}/v1/messages/batches", json=body, headers=self.headers)
+        _check(response, 'creating a batch')
+        return response.json()['id']
+
+    async def poll(self, batch_id: str) -> bool:
+        """Return whether the batch job has ended."""
+        response = await self.http.get(f"{self.base_url}/v1/messages/batches/{batch_id}", headers=self.headers)
+        _check(response, f'checking batch {batch_id}')
+        return response.json()['processing_status'] == 'ended'
+
+    async def results(self, batch_id: str) -> list[BatchResult]:
+        """Download the results of an ended batch job."""
+        response = await self.http.get(f"{self.base_url}/v1/messages/batches/{batch_id}", headers=self.headers)
+        _check(response, f'checking batch {batch_id}')
+        response = await self.http.get(response.json()['results_url'], headers=self.headers)
+        _check(response, f'downloading the results of batch {batch_id}')
+        results = []
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            result = entry['result']
+            if result['type'] != 'succeeded':
+                results.append(BatchResult(entry['custom_id'], error=json.dumps(result.get('error', result['type']))))
+                continue
+            message = result['message']
+            text = ''.join(block['text'] for block in message['content'] if block['type'] == 'text')
+            usage = message.get('usage', {})
+            written = usage.get('cache_creation_input_tokens') or 0
+            results.append(BatchResult(entry['custom_id'], text, Usage(
+                1, usage.get('input_tokens', 0) + written, usage.get('output_tokens', 0),
+                cache_read_tokens=usage.get('cache_read_input_tokens') or 0, cache_write_tokens=written,
+            )))
+        return results
+
+class OpenAIBatches:
+    """The OpenAI Batch API, running chat completions."""
+
+    provider = 'openai'
+    max_requests = 50000
+
+    def __init__(self, http, api_key: str, base_url: str = None):
+        self.http = http
+        self.base_url = (base_url or os.getenv('OPENAI_BASE_URL') or OPENAI_API_URL).rstrip('/')
+        self.headers = {'Authorization': f"Bearer {api_key}"}
+
+    async def submit(self, requests: list[BatchRequest]) -> str:
+        """Upload the requests as a JSONL file, create a batch job for them and return its id."""
+        lines = [
+            json.dumps({
+                'custom_id': request.custom_id,
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': request.model,
+                    'max_tokens': request.max_tokens,
+                    'temperature': request.temperature,
+                    'messages': [
+                        {'role': 'system', 'content': request.system},
+                        {'role': 'user', 'content': request.prompt},
+                    ],
+                },
+            })
+            for request in requests
+        ]
+        response = await self.http.post(
+            f"{self.base_url}/files", headers=self.headers, data={'purpose': 'batch'},
+            files={'file': ('requests.jsonl', "\n".join(lines).encode(), 'application/jsonl')},
+        )
+        _check(response, 'uploading batch requests')
+        response = await self.http.post(f"{self.base_url}/batches", headers=self.headers, json={
+            'input_file_id': response.json()['id'],
+            'endpoint': '/v1/chat/completions',
+            'completion_window': '24h',
+        })
+        _check(response, 'creating a batch')
+        return response.json()['id']
+
+    async def poll(self, batch_id: str) -> bool:
+        """
+        Return whether the batch job has completed.
+
+        Raises:
+            BatchJobFailedError: If the job failed, expired or was cancelled.
+        """
+        response = await self.http.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers)
+        _check(response, f'checking batch {batch_id}')
+        status = response.json()['status']
+        if status in ('failed', 'expired', 'cancelled'):
+            raise BatchJobFailedError(f"Batch {batch_id} {status}")
+        return status == 'completed'
+
+    async def results(self, batch_id: str) -> list[BatchResult]:
+        """Download the results of a completed batch job."""
+        response = await self.http.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers)
+        _check(response, f'checking batch {batch_id}')
+        batch = response.json()
+        results = []
+        for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+            if not file_id:
+                continue
+            response = await self.http.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers)
+            _check(response, f'downloading the results of batch {batch_id}')
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                reply = entry.get('response') or {}
+                if entry.get('error') or reply.get('status_code') != 200:
+                    results.append(BatchResult(entry['custom_id'], error=json.dumps(entry.get('error') or reply.get('body'))))
+                    continue
+                body = reply['body']
+                usage = body.get('usage', {})
+                results.append(BatchResult(
+                    entry['custom_id'], body['choices'][0]['message']['content'],
+                    Usage(1, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)),
+                ))
+        return results
+
+def batch_api(config: Config):
+    """
+    Create the batch API client selected by `config.batch_provider`.
+
+    Returns:
+        AnthropicBatches | OpenAIBatches: The batch API, sharing the process-wide HTTP client.
+
+    Raises:
+        RefinementProcessingError: If the provider is not supported.
+    """
+    http = get_clients().async_http()
+    if config.batch_provider == 'anthropic':
+        return AnthropicBatches(http, config.anthropic_api_key)
+    if config.batch_provider == 'openai':
+        return OpenAIBatches(http, config.openai_api_key)
+    raise RefinementProcessingError(f"Unsupported batch provider: {config.batch_provider} (use 'anthropic' or 'openai')")
+
+def batch_model(config: Config) -> str:
+    """Return the model batch refinement uses with the configured provider."""
+    return config.claude_model if config.batch_provider == 'anthropic' else config.batch_openai_model
+
+@dataclass
+class _BatchFile:
+    input_path: Path
+    transcript_path: Path
+    output_path: Path
+    chunks: list = None
+    plan_key: str = None
+    refined: dict = field(default_factory=dict)
+
+async def _transcribe_inputs(input_files, output_dir: Path, config: Config, pbar, manifest: Manifest) -> list[_BatchFile]:
+    """Transcribe the media files among the inputs, and return every file that needs refinement."""
+    ffmpeg = FFmpegPool.from_config(config)
+    semaphore = asyncio.Semaphore(max(1, config.pipeline_transcribe_workers))
+
+    async def transcribe(input_file: Path, output_path: Path) -> _BatchFile:
+        async with semaphore:
+            audio_path = await extract_media_audio_async(input_file, output_dir, config, ffmpeg)
+            process = process_file if input_file.suffix.lower() in VIDEO_SUFFIXES else process_audio_file
+            try:
+                transcript_path = await asyncio.to_thread(process, input_file, output_dir, config, audio_path, ffmpeg)
+            finally:
+                if audio_path and audio_path != input_file and audio_path.exists():
+                    audio_path.unlink()
+        if manifest:
+            manifest.mark(input_file, 'transcribe', 'done')
+        return _BatchFile(input_file, transcript_path, output_path)
+
+    files, pending = [], []
+    for input_file in input_files:
+        output_path = output_dir / f"{input_file.stem}_refined.md"
+        suffix = input_file.suffix.lower()
+        if already_processed(input_file, output_path, manifest):
+            logging.info(f"Skipping {input_file.name} as it has already been processed.")
+            if pbar:
+                pbar.update(1)
+        elif suffix == '.md':
+            files.append(_BatchFile(input_file, input_file, output_path))
+        elif suffix in VIDEO_SUFFIXES + AUDIO_SUFFIXES:
+            pending.append((input_file, transcribe(input_file, output_path)))
+        else:
+            logging.warning(f"Unsupported file type: {input_file.name}. Skipping.")
+            if pbar:
+                pbar.update(1)
+
+    for (input_file, _), outcome in zip(pending, await asyncio.gather(*(task for _, task in pending), return_exceptions=True)):
+        if isinstance(outcome, Exception):
+            logging.error(f"Error transcribing {input_file.name}: {str(outcome)}")
+            if manifest:
+                manifest.mark(input_file, 'transcribe', 'failed')
+            if pbar:
+                pbar.update(1)
+        else:
+            files.append(outcome)
+    return files
+
+async def run_batch_refinement(input_files, output_dir: Path, instructions_path: Path, config: Config, pbar=None,
+                               manifest: Manifest = None, sleep=asyncio.sleep) -> Usage:
+    """
+    Refine many files through a provider batch API instead of interactive requests.
+
+    Media files are transcribed first. Then the chunks of every transcript that are not
+    in the result cache are submitted as batch jobs (Anthropic Message Batches or the
+    OpenAI Batch API, per `config.batch_provider`) of at most `config.batch_max_requests`
+    requests each. The jobs are polled every `config.batch_poll_seconds` until they end,
+    and the refined transcripts are written to the output directory as usual. Batch jobs
+    are not subject to the per-minute rate limits, which makes them suited to large
+    overnight backlogs; the daily quota still applies.
+
+    The ids of submitted jobs are saved in the cache directory, so running the same
+    backlog again after an interruption resumes polling instead of submitting it again.
+    Requests that fail in the batch keep their original text, as in interactive mode.
+
+    Args:
+        input_files: Video, audio and markdown transcript files (any iterable of Path).
+        output_dir (Path): Directory to save all output files.
+        instructions_path (Path): Path to the instructions file for refinement.
+        config (Config): Configuration object.
+        pbar: Progress bar updated as each file finishes (optional).
+        manifest (Manifest): Manifest recording the status of each stage per file (optional).
+        sleep: Coroutine function used to wait between polls.
+
+    Returns:
+        Usage: The refinement usage of all files.
+
+    Raises:
+        RefinementProcessingError: If a batch job cannot be submitted or fails as a whole.
+        QuotaExceededError: If the backlog does not fit in the remaining daily allowance.
+    """
+    api = batch_api(config)
+    model = batch_model(config)
+    instructions = FileHandler.read_file(instructions_path)
+    instruction_tokens = count_tokens(instructions)
+    cache = get_cache()
+
+    files = await _transcribe_inputs(input_files, output_dir, config, pbar, manifest)
+    requests = []
+    targets = {}  # custom_id -> (file, chunk index)
+    for index, batch_file in enumerate(files):
+        transcript = FileHandler.read_file(batch_file.transcript_path)
+        batch_file.chunks, batch_file.plan_key = plan_refinement(
+            batch_file.transcript_path, transcript, instructions, instruction_tokens, model, config,
+        )
+        for i, chunk in enumerate(batch_file.chunks):
+            refined = cache.get('refinement', refinement_cache_key(model, instructions, config.temperature, chunk)) if cache else None
+            if refined is not None:
+                batch_file.refined[i] = refined
+            else:
+                custom_id = f"file{index}-chunk{i}"
+                targets[custom_id] = (batch_file, i)
+                requests.append(BatchRequest(
+                    custom_id, model, instructions, refinement_prompt(chunk), config.max_tokens, config.temperature,
+                ))
+
+    total_usage = Usage()
+    quota = get_quota()
+    chunk_tokens = count_tokens_batch([request.prompt for request in requests])
+    reservation = quota.reserve(
+        api.provider,
+        requests=len(requests),
+        input_tokens=sum(instruction_tokens + tokens for tokens in chunk_tokens),
+        output_tokens=sum(chunk_tokens),
+    )
+    with reservation:
+        if requests:
+            logging.info(f"Submitting {len(requests)} chunks of {len(files)} files as {api.provider} batch jobs")
+            for result in await _run_batches(api, requests, config, sleep):
+                if result.custom_id not in targets:
+                    continue
+                batch_file, i = targets[result.custom_id]
+                if result.text is None:
+                    logging.error(f"Chunk {i+1} of {batch_file.input_path.name} failed in the batch: {result.error}")
+                    continue
+                batch_file.refined[i] = result.text
+                quota.record(api.provider, model, result.usage.requests, result.usage.input_tokens,
+                             result.usage.output_tokens, reservation=reservation,
+                             cache_read_tokens=result.usage.cache_read_tokens,
+                             cache_write_tokens=result.usage.cache_write_tokens)
+                total_usage.add(result.usage)
+                if cache:
+                    cache.put('refinement', refinement_cache_key(model, instructions, config.temperature, batch_file.chunks[i]), result.text)
+
+    for batch_file in files:
+        refined = [batch_file.refined.get(i, chunk) for i, chunk in enumerate(batch_file.chunks)]
+        FileHandler.write_file(batch_file.output_path, "\n\n".join(refined))
+        if cache:
+            cache.put('refinement-plan', batch_file.plan_key, json.dumps(batch_file.chunks))
+        if manifest:
+            manifest.mark(batch_file.input_path, 'refine', 'done')
+        if pbar:
+            pbar.update(1)
+        logging.info(f"Refined transcript saved to: {batch_file.output_path}")
+
+    logging.info(f"Processed a total of {total_usage.tokens} tokens")
+    return total_usage
+
+async def _run_batches(api, requests: list[BatchRequest], config: Config, sleep) -> list[BatchResult]:
+    """Submit the requests in jobs of at most `batch_max_requests`, wait for them and collect the results."""
+    identity = hashlib.sha256(json.dumps([
+        api.provider,
+        [(request.custom_id, request.model, request.system, request.prompt) for request in requests],
+    ]).encode()).hexdigest()
+    state_path = config.cache_dir / 'batches' / f"{identity}.json"
+    state = {'batches': [], 'submitted': 0}
+    if state_path.exists():
+        state = json.loads(FileHandler.read_file(state_path))
+        logging.info(f"Resuming {len(state['batches'])} batch jobs submitted earlier")
+    size = max(1, min(config.batch_max_requests, api.max_requests))
+    FileHandler.ensure_dir(state_path.parent)
+    while state['submitted'] < len(requests):
+        # The state is saved after every job, so an interrupted submission continues where it stopped
+        state['batches'].append(await api.submit(requests[state['submitted']:state['submitted'] + size]))
+        state['submitted'] = min(len(requests), state['submitted'] + size)
+        FileHandler.write_file(state_path, json.dumps(state))
+        logging.info(f"Submitted batch job {state['batches'][-1]}")
+    batch_ids = state['batches']
+
+    results = []
+    for batch_id in batch_ids:
+        try:
+            while not await api.poll(batch_id):
+                logging.info(f"Waiting for batch {batch_id}")
+                await sleep(config.batch_poll_seconds)
+        except BatchJobFailedError:
+            # The job will never complete, so the next run must submit the requests again instead of resuming it
+            state_path.unlink(missing_ok=True)
+            logging.error(f"Batch {batch_id} ended without results; running the backlog again submits new jobs")
+            raise
+        results.extend(await api.results(batch_id))
+    if state_path.exists():
+        state_path.unlink()
+    return results
@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from .metrics import get_metrics
+
+class ResultCache:
+    """
+    A content-addressed, size-limited cache of API results stored in SQLite.
+
+    Entries are grouped by namespace (e.g. 'transcription') and keyed by a hash of the
+    request content, so the same input is only sent to the API once no matter which file
+    it came from. When the cache grows beyond `max_bytes`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """
+        Look up a cached result and mark it as recently used.
+
+        Args:
+            namespace (str): The cache namespace.
+            key (str): The content key.
+
+        Returns:
+            Optional[str]: The cached value, or None on a miss.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT value FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            get_metrics().count('cache_lookups', namespace=namespace, result='hit' if row else 'miss')
+            if row is None:
+                return None
+            self._db.execute('UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?', (time.time(), namespace, key))
+            return row[0]
+
+    def put(self, namespace: str, key: str, value: str) -> None:
+        """
+        Store a result, evicting least recently used entries if the cache is full.
+
+        Args:
+            namespace (str): The cache namespace.
+            key (str): The content key.
+            value (str): The result to store.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (namespace, key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+                (namespace, key, value, len(value.encode()), now, now),
+            )
+            self._evict(self.max_bytes)
+
+    def _evict(self, max_bytes: int) -> int:
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        removed = 0
+        if total <= max_bytes:
+            return removed
+        for namespace, key, size in self._db.execute('SELECT namespace, key, size FROM entries ORDER BY accessed').fetchall():
+            if total <= max_bytes:
+                break
+            self._db.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        """
+        Summarize the cache contents.
+
+        Returns:
+            dict: Number of entries and bytes per namespace, plus the configured limit.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT namespace, COUNT(*), SUM(size), MIN(accessed), MAX(accessed) FROM entries GROUP BY namespace'
+            ).fetchall()
+        return {
+            'path': str(self.path),
+            'max_bytes': self.max_bytes,
+            'namespaces': {
+                namespace: {'entries': count, 'bytes': size, 'oldest_access': oldest, 'newest_access': newest}
+                for namespace, count, size, oldest, newest in rows
+            },
+        }
+
+    def prune(self, max_bytes: int = None, older_than: float = None, namespace: str = None) -> int:
+        """
+        Remove entries from the cache.
+
+        Args:
+            max_bytes (int): Evict least recently used entries until the cache is at most
+                this size (optional).
+            older_than (float): Remove entries not used for this many seconds (optional).
+            namespace (str): Remove every entry in this namespace (optional).
+
+        Returns:
+            int: The number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            if namespace is not None:
+                removed += self._db.execute('DELETE FROM entries WHERE namespace = ?', (namespace,)).rowcount
+            if older_than is not None:
+                removed += self._db.execute('DELETE FROM entries WHERE accessed < ?', (time.time() - older_than,)).rowcount
+            if max_bytes is not None:
+                removed += self._evict(max_bytes)
+            self._db.execute('VACUUM')
+        return removed
+
+def hash_file(path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 of a file's contents.
+
+    Args:
+        path: Path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_cache = None
+
+def configure_cache(config) -> ResultCache:
+    """
+    Open the process-wide result cache from the configuration.
+
+    Args:
+        config (Config): Configuration object containing the cache directory and size.
+
+    Returns:
+        ResultCache: The shared cache.
+    """
+    global _cache
+    _cache = ResultCache(config.cache_dir / 'results.sqlite', int(config.cache_max_mb * 1024 * 1024))
+    return _cache
+
+def get_cache() -> Optional[ResultCache]:
+    """Return the process-wide result cache, or None when caching is not configured."""
+    return _cache
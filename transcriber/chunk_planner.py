@@ -0,0 +1,150 @@
+import json
+import logging
+import math
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from .exceptions import VideoProcessingError
+
+WHISPER_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+SIZE_MARGIN = 0.9  # Leave room for container overhead and variable bitrates
+BASELINE_CHUNK_SECONDS = 60  # Fixed chunk length used before chunks were planned
+
+# Bytes per second of audio for each re-encoded chunk format (16 kHz mono). FLAC is
+# planned at a typical ratio for speech; noisy recordings can compress worse, and copied
+# streams can peak above their average bitrate, so chunks that come out over the limit
+# are re-encoded before upload (see FFmpegPool.shrink).
+ENCODED_BYTES_PER_SECOND = {
+    'flac': 16000 * 2 * 0.7,  # Speech usually compresses to 70% or less with FLAC
+    'opus': 24000 / 8,
+    'mp3': 32000 / 8,
+    'wav': 16000 * 2,
+}
+
+# Source codecs Whisper accepts as they are, with the chunk format that stream-copies them
+COPYABLE_CODECS = {
+    'mp3': 'copy-mp3',
+    'aac': 'copy-m4a',
+    'opus': 'copy-ogg',
+    'vorbis': 'copy-ogg',
+    'flac': 'copy-flac',
+}
+
+@dataclass
+class ChunkPlan:
+    """How a recording is cut into chunks for upload."""
+    chunk_seconds: int
+    chunk_format: str
+    chunk_count: int
+    baseline_count: int
+
+    @property
+    def requests_saved(self) -> int:
+        """Number of requests saved compared to fixed 60-second chunks."""
+        return self.baseline_count - self.chunk_count
+
+def probe_audio(media_path: Path) -> dict:
+    """
+    Read the codec, bitrate and duration of the first audio stream with FFprobe.
+
+    Args:
+        media_path (Path): Path to the video or audio file.
+
+    Returns:
+        dict: 'codec' (str), 'bit_rate' (int or None) and 'duration' (float).
+
+    Raises:
+        VideoProcessingError: If the file cannot be probed or has no audio stream.
+    """
+    command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,bit_rate:format=duration,bit_rate',
+        '-of', 'json', str(media_path),
+    ]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise VideoProcessingError(f"Error probing {media_path}: {e.stderr.decode()}")
+    info = json.loads(result.stdout)
+    if not info.get('streams'):
+        raise VideoProcessingError(f"No audio stream found in {media_path}")
+    stream, container = info['streams'][0], info.get('format', {})
+    bit_rate = stream.get('bit_rate')
+    return {
+        'codec': stream.get('codec_name'),
+        'bit_rate': int(bit_rate) if bit_rate and bit_rate != 'N/A' else None,
+        'duration': float(container.get('duration', 0)),
+    }
+
+def max_chunk_seconds(bytes_per_second: float, max_bytes: int = WHISPER_MAX_UPLOAD_BYTES) -> int:
+    """
+    Return the longest chunk, in whole seconds, that stays under the upload limit.
+
+    Args:
+        bytes_per_second (float): Size of one second of encoded audio.
+        max_bytes (int): The upload size limit.
+
+    Returns:
+        int: The chunk length in seconds (at least 1).
+    """
+    return max(1, int(max_bytes * SIZE_MARGIN / bytes_per_second))
+
+def plan_chunks(duration: float, bytes_per_second: float, chunk_format: str, chunk_seconds: int = 0,
+                max_bytes: int = WHISPER_MAX_UPLOAD_BYTES) -> ChunkPlan:
+    """
+    Choose the chunk length for a recording so each chunk lands just under the upload limit.
+
+    Args:
+        duration (float): Length of the recording in seconds.
+        bytes_per_second (float): Size of one second of audio in the chunk format.
+        chunk_format (str): The chunk format the plan is for.
+        chunk_seconds (int): Requested chunk length; 0 picks the longest that fits. A
+            requested length that would not fit is shortened.
+        max_bytes (int): The upload size limit.
+
+    Returns:
+        ChunkPlan: The plan, including how many requests it saves.
+    """
+    longest = max_chunk_seconds(bytes_per_second, max_bytes)
+    seconds = min(chunk_seconds, longest) if chunk_seconds else longest
+    if duration > 0:
+        # Spread the audio evenly instead of leaving a short last chunk
+        count = math.ceil(duration / seconds)
+        seconds = min(seconds, math.ceil(duration / count))
+    plan = ChunkPlan(
+        chunk_seconds=seconds,
+        chunk_format=chunk_format,
+        chunk_count=max(1, math.ceil(duration / seconds)),
+        baseline_count=max(1, math.ceil(duration / BASELINE_CHUNK_SECONDS)),
+    )
+    logging.info(
+        f"Chunk plan: {plan.chunk_count} x {plan.chunk_seconds}s {plan.chunk_format} chunks "
+        f"instead of {plan.baseline_count} x {BASELINE_CHUNK_SECONDS}s, saving {plan.requests_saved} requests"
+    )
+    return plan
+
+def plan_stream_chunks(media_path: Path, chunk_format: str, chunk_seconds: int = 0,
+                       max_bytes: int = WHISPER_MAX_UPLOAD_BYTES) -> ChunkPlan:
+    """
+    Plan streamed FFmpeg chunks for a media file.
+
+    When the source audio already uses a codec Whisper accepts and its bitrate is known,
+    the chunks stream-copy it instead of re-encoding. Otherwise they are encoded in
+    `chunk_format`.
+
+    Args:
+        media_path (Path): Path to the video or audio file.
+        chunk_format (str): Format to encode to when the source cannot be copied.
+        chunk_seconds (int): Requested chunk length; 0 picks the longest that fits.
+        max_bytes (int): The upload size limit.
+
+    Returns:
+        ChunkPlan: The plan for `extract_audio_chunks`.
+    """
+    if chunk_format not in ENCODED_BYTES_PER_SECOND:
+        raise VideoProcessingError(f"Unknown chunk format '{chunk_format}'. Use one of: {', '.join(ENCODED_BYTES_PER_SECOND)}")
+    info = probe_audio(media_path)
+    copy_format = COPYABLE_CODECS.get(info['codec'])
+    if copy_format and info['bit_rate']:
+        return plan_chunks(info['duration'], info['bit_rate'] / 8, copy_format, chunk_seconds, max_bytes)
+    return plan_chunks(info['duration'], ENCODED_BYTES_PER_SECOND[chunk_format], chunk_format, chunk_seconds, max_bytes)
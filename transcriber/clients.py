@@ -0,0 +1,139 @@
+import asyncio
+import importlib.util
+import os
+import threading
+from .metrics import get_metrics
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+MAX_CONNECTIONS = 64  # Per client; enough for every concurrent chunk of every pipeline stage
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60.0  # Seconds an idle connection is kept open for the next request
+CONNECT_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 600.0  # Whisper uploads and long completions can take minutes
+
+def _openrouter_base_url() -> str:
+    """The OpenRouter API URL; OPENROUTER_BASE_URL overrides it, like OPENAI_BASE_URL does for OpenAI."""
+    return os.getenv('OPENROUTER_BASE_URL', OPENROUTER_BASE_URL)
+
+def _http2_available() -> bool:
+    """Return whether the optional h2 package needed for HTTP/2 is installed."""
+    return importlib.util.find_spec('h2') is not None
+
+def _count_response(response) -> None:
+    """Count every HTTP response by host and status, including the API libraries' own retries."""
+    metrics = get_metrics()
+    metrics.count('http_responses', host=response.request.url.host, status=response.status_code)
+    if response.status_code == 429:
+        metrics.count('rate_limited', host=response.request.url.host)
+
+async def _count_response_async(response) -> None:
+    _count_response(response)
+
+def _http_client(asynchronous: bool):
+    """Create an HTTP client with keep-alive connection pooling and HTTP/2 when available."""
+    import httpx  # Installed with the API libraries; only needed once a client is created
+
+    options = dict(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+        event_hooks={'response': [_count_response_async if asynchronous else _count_response]},
+    )
+    return httpx.AsyncClient(**options) if asynchronous else httpx.Client(**options)
+
+class ClientRegistry:
+    """
+    Creates each API client once and hands the same instance to every caller.
+
+    Every client has its own HTTP connection pool, so sharing them lets all files and
+    chunks of a run reuse open (and, with h2 installed, multiplexed HTTP/2)
+    connections instead of paying a TLS handshake per call. Clients are keyed by
+    their API key, so a changed key gets a new client. Async clients are tied to the
+    event loop they were created in and are recreated for a new loop. The API libraries
+    take a second or more to import, so they are only imported when a client is needed.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple, factory, asynchronous: bool = False):
+        loop = asyncio.get_running_loop() if asynchronous else None
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None or entry[0] is not loop:
+                entry = self._clients[key] = (loop, factory())
+            return entry[1]
+
+    def openai(self) -> 'OpenAI':
+        """The OpenAI client used for Whisper, which runs in worker threads."""
+        from openai import OpenAI
+        api_key = os.getenv('OPENAI_API_KEY')
+        return self._get(('openai', api_key), lambda: OpenAI(api_key=api_key, http_client=_http_client(False)))
+
+    def anthropic(self) -> 'Anthropic':
+        """The synchronous Anthropic client."""
+        from anthropic import Anthropic
+        api_key = os.getenv('ANTHROPIC_API_KEY')
+        return self._get(('anthropic', api_key), lambda: Anthropic(api_key=api_key, http_client=_http_client(False)))
+
+    def openrouter(self) -> 'OpenAI':
+        """The synchronous OpenRouter client."""
+        from openai import OpenAI
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        return self._get(
+            ('openrouter', api_key),
+            lambda: OpenAI(base_url=_openrouter_base_url(), api_key=api_key, http_client=_http_client(False)),
+        )
+
+    def async_openai(self) -> 'AsyncOpenAI':
+        """The async OpenAI client of the running event loop."""
+        from openai import AsyncOpenAI
+        api_key = os.getenv('OPENAI_API_KEY')
+        return self._get(
+            ('async_openai', api_key), lambda: AsyncOpenAI(api_key=api_key, http_client=_http_client(True)), True,
+        )
+
+    def async_anthropic(self) -> 'AsyncAnthropic':
+        """The async Anthropic client of the running event loop."""
+        from anthropic import AsyncAnthropic
+        api_key = os.getenv('ANTHROPIC_API_KEY')
+        return self._get(
+            ('async_anthropic', api_key), lambda: AsyncAnthropic(api_key=api_key, http_client=_http_client(True)), True,
+        )
+
+    def async_openrouter(self) -> 'AsyncOpenAI':
+        """The async OpenRouter client of the running event loop."""
+        from openai import AsyncOpenAI
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        return self._get(
+            ('async_openrouter', api_key),
+            lambda: AsyncOpenAI(base_url=_openrouter_base_url(), api_key=api_key, http_client=_http_client(True)),
+            True,
+        )
+
+    def async_http(self) -> 'httpx.AsyncClient':
+        """A plain async HTTP client of the running event loop, for endpoints the API libraries lack."""
+        return self._get(('async_http',), lambda: _http_client(True), True)
+
+    async def aclose(self) -> None:
+        """Close every client and its connections."""
+        with self._lock:
+            entries = list(self._clients.items())
+            self._clients.clear()
+        for key, (loop, client) in entries:
+            if loop is None:
+                client.close()
+            elif loop is asyncio.get_running_loop():
+                await (client.aclose() if key[0] == 'async_http' else client.close())  # httpx names it aclose
+
+_clients = ClientRegistry()
+
+def get_clients() -> ClientRegistry:
+    """Return the process-wide API client registry."""
+    return _clients
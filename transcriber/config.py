@@ -1,9 +1,17 @@
 import os
 import yaml
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'transcriber'
+
+def default_daily_limits() -> dict:
+    return {
+        'anthropic': {'tokens': 300000},
+        'openrouter': {'tokens': 300000},
+    }
+
 @dataclass
 class Config:
     openai_api_key: str
@@ -16,6 +24,46 @@ class Config:
     openrouter_claude_model: str
     max_tokens: int
     temperature: float
+    transcription_concurrency: int = 4
+    transcription_retries: int = 3
+    transcription_backend: str = 'openai'
+    local_model: str = 'small'
+    local_device: str = 'cpu'
+    local_compute_type: str = 'int8'
+    local_cpu_threads: int = 0
+    local_workers: int = 0
+    local_max_seconds: float = 0
+    audio_extraction: str = 'segment'
+    chunk_seconds: int = 0
+    max_upload_mb: float = 25
+    chunk_format: str = 'flac'
+    silence_threshold_db: float = -40.0
+    skip_silence_seconds: float = 2.0
+    ffmpeg_processes: int = 0
+    ffmpeg_threads: int = 2
+    refinement_concurrency: int = 4
+    requests_per_minute: int = 5
+    tokens_per_minute: int = 40000
+    max_tokens_per_request: int = 20000
+    prompt_caching: bool = True
+    daily_limits: dict = field(default_factory=default_daily_limits)
+    cache_dir: Path = DEFAULT_CACHE_DIR
+    cache_max_mb: float = 512
+    resume: bool = False
+    scan_include: list = field(default_factory=list)
+    scan_exclude: list = field(default_factory=lambda: ['*_refined.md', '*_processed.md'])
+    api_key_check_ttl_hours: float = 24
+    pipeline_transcribe_workers: int = 2
+    pipeline_refine_workers: int = 2
+    pipeline_queue_size: int = 2
+    metrics_report: str = ''
+    metrics_textfile: str = ''
+    batch_provider: str = 'anthropic'
+    batch_openai_model: str = 'gpt-4o-mini'
+    batch_poll_seconds: float = 60
+    batch_max_requests: int = 10000
+    watch_settle_seconds: float = 2.0
+    watch_poll_seconds: float = 2.0
 
     @classmethod
     def from_file(cls, path: Path) -> 'Config':
@@ -24,10 +72,12 @@ class Config:
         # Convert string paths to Path objects
         data['output_dir'] = Path(data['output_dir'])
         data['instructions_dir'] = Path(data['instructions_dir'])
+        if data.get('cache_dir'):
+            data['cache_dir'] = Path(data['cache_dir']).expanduser()
         
         # Load API keys from environment variables
         data['openai_api_key'] = os.getenv('OPENAI_API_KEY', data.get('openai_api_key', ''))
         data['anthropic_api_key'] = os.getenv('ANTHROPIC_API_KEY', data.get('anthropic_api_key', ''))
         data['openrouter_api_key'] = os.getenv('OPENROUTER_API_KEY', data.get('openrouter_api_key', ''))
         
-        return cls(**data)
\ No newline at end of file
+        return cls(**data)
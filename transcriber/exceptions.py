@@ -4,6 +4,9 @@ class TranscriberError(Exception):
 class VideoProcessingError(TranscriberError):
     """Exception raised when an error occurs during video processing."""
 
+class TranscriptionError(TranscriberError):
+    """Exception raised when an error occurs during transcription."""
+
 class ClaudeProcessingError(TranscriberError):
     """Exception raised when an error occurs during Claude API processing."""
 
@@ -11,4 +14,10 @@ class APIKeyError(TranscriberError):
     """Exception raised when there's an issue with API keys."""
 
 class RefinementProcessingError(TranscriberError):
-    """Exception raised when an error occurs during refinement processing."""
\ No newline at end of file
+    """Exception raised when an error occurs during refinement processing."""
+
+class QuotaExceededError(TranscriberError):
+    """Exception raised when a job would exceed the daily API usage limits."""
+
+class BatchJobFailedError(RefinementProcessingError):
+    """Exception raised when a batch job failed, expired or was cancelled as a whole."""
@@ -1,7 +1,17 @@
 from pathlib import Path
 import logging
+import os
+import tempfile
 from typing import List
 import re
+from .metrics import get_metrics
+
+def _current_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+_FILE_MODE = 0o666 & ~_current_umask()  # Mode of newly created files, as open() would use
 
 class FileHandler:
     """A utility class for handling file operations in the Transcriber project."""
@@ -31,7 +41,7 @@ class FileHandler:
             IOError: If there's an error reading the file.
         """
         try:
-            with path.open('r') as f:
+            with get_metrics().span('file_read'), path.open('r') as f:
                 return f.read()
         except IOError as e:
             logging.error(f"Error reading file {path}: {e}")
@@ -40,7 +50,10 @@ class FileHandler:
     @staticmethod
     def write_file(path: Path, content: str) -> None:
         """
-        Write content to a file.
+        Write content to a file atomically.
+
+        The content is written to a temporary file in the same directory, which then
+        replaces the target, so readers never see a partially written file.
 
         Args:
             path (Path): The path to the file to write.
@@ -50,8 +63,18 @@ class FileHandler:
             IOError: If there's an error writing to the file.
         """
         try:
-            with path.open('w') as f:
-                f.write(content)
+            with get_metrics().span('file_write'):
+                fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+                try:
+                    os.chmod(tmp_name, _FILE_MODE)
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_name, path)
+                except BaseException:
+                    os.unlink(tmp_name)
+                    raise
         except IOError as e:
             logging.error(f"Error writing file {path}: {e}")
             raise
@@ -110,4 +133,95 @@ class FileHandler:
         """
         video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv']
         audio_extensions = ['.mp3', '.wav']
-        return [f for f in directory.iterdir() if f.suffix.lower() in video_extensions + audio_extensions or f.suffix.lower() == '.md']
\ No newline at end of file
+        return [f for f in directory.iterdir() if f.suffix.lower() in video_extensions + audio_extensions or f.suffix.lower() == '.md']
+
+class ProgressiveWriter:
+    """
+    Write the parts of a document in order while they complete in any order.
+
+    Each part is appended to `<path>.partial` as soon as it and every part before it are
+    complete, so the beginning of a long document can be read while the rest is still
+    being produced. Parts that finish early are held until their turn. When all parts
+    are written the partial file replaces `path` in one step, like `FileHandler.write_file`;
+    if writing fails it is removed.
+
+    With a `stream` (e.g. sys.stdout), text is also echoed there as it arrives: pieces of
+    the part whose turn it is are printed immediately via `add_text`, and pieces of later
+    parts are held until their turn.
+
+    Use as a context manager.
+    """
+
+    def __init__(self, path: Path, parts: int, separator: str = "\n\n", stream=None):
+        self.path = path
+        self.parts = parts
+        self.separator = separator
+        self.stream = stream
+        self.partial_path = path.with_name(f"{path.name}.partial")
+        self._file = None
+        self._next = 0
+        self._completed = {}
+        self._pieces = {}
+
+    def __enter__(self) -> 'ProgressiveWriter':
+        self._file = self.partial_path.open('w')
+        os.chmod(self.partial_path, _FILE_MODE)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        try:
+            if exc_type is None:
+                if self._next < self.parts:
+                    raise IOError(f"Only {self._next} of {self.parts} parts of {self.path} were completed")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            if exc_type is None and self._next >= self.parts:
+                os.replace(self.partial_path, self.path)
+            else:
+                self.partial_path.unlink()
+
+    def add_text(self, index: int, text: str) -> None:
+        """
+        Echo a piece of a part that is still being produced to the stream.
+
+        Args:
+            index (int): Position of the part.
+            text (str): The next piece of its text.
+        """
+        if self.stream is None:
+            return
+        self._pieces[index] = self._pieces.get(index, '') + text
+        if index == self._next:
+            self._echo(text)
+
+    def complete(self, index: int, text: str) -> None:
+        """
+        Provide the final text of a part and write every part that is now due.
+
+        Args:
+            index (int): Position of the part.
+            text (str): Its complete text.
+        """
+        self._completed[index] = text
+        while self._next in self._completed:
+            self._write(self._next, self._completed.pop(self._next))
+            self._next += 1
+            if self.stream is not None and self._next < self.parts:
+                self._echo(self.separator + self._pieces.get(self._next, ''))
+
+    def _write(self, index: int, text: str) -> None:
+        with get_metrics().span('file_write'):
+            self._file.write((self.separator if index else '') + text)
+            self._file.flush()
+        if self.stream is not None:
+            echoed = self._pieces.pop(index, '')
+            # The streamed pieces are normally the start of the final text; a part that
+            # failed halfway and fell back to other text is printed again in full
+            self._echo(text[len(echoed):] if text.startswith(echoed) else "\n" + text)
+
+    def _echo(self, text: str) -> None:
+        if text:
+            self.stream.write(text)
+            self.stream.flush()
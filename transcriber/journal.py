@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+class JobJournal:
+    """
+    An append-only, crash-safe record of the chunks a job has completed.
+
+    Each completed chunk is written as one JSON line and flushed to disk before the
+    job moves on, so after a crash the finished chunks can be read back and only the
+    remaining ones need to be processed. A torn last line is ignored on load.
+    """
+
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._completed = {}
+        if resume and self.path.exists():
+            self._load()
+        elif self.path.exists():
+            self.path.unlink()
+
+    def _load(self) -> None:
+        with self.path.open('r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self._completed[entry['index']] = entry['result']
+        if self._completed:
+            logging.info(f"Resuming with {len(self._completed)} completed chunks from {self.path.name}")
+
+    @property
+    def completed(self) -> dict:
+        """Results of the chunks completed so far, by chunk index."""
+        return dict(self._completed)
+
+    def record(self, index: int, result: str) -> None:
+        """
+        Durably record the result of a completed chunk.
+
+        Args:
+            index (int): The chunk index.
+            result (str): The chunk result.
+        """
+        line = json.dumps({'index': index, 'result': result}) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open('a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._completed[index] = result
+
+    def discard(self) -> None:
+        """Delete the journal once the job's output has been written."""
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
+            self._completed = {}
+
+def open_journal(config, stage: str, *identity) -> JobJournal:
+    """
+    Open the journal of a job stage.
+
+    The job is identified by its stage and whatever determines its chunks and results
+    (input file, its size and modification time, model, settings...), so a changed input
+    or setting starts a new journal instead of resuming a stale one.
+
+    Args:
+        config (Config): Configuration object; `config.resume` decides whether completed
+            chunks from an earlier run are kept.
+        stage (str): The pipeline stage, e.g. 'transcription'.
+        *identity: Values identifying the job.
+
+    Returns:
+        JobJournal: The journal.
+    """
+    key = hashlib.sha256(json.dumps([stage, *map(str, identity)]).encode()).hexdigest()[:32]
+    return JobJournal(config.cache_dir / 'journals' / f"{stage}-{key}.jsonl", resume=config.resume)
+
+def file_identity(path: Path) -> tuple:
+    """Return the resolved path, size and modification time of a file."""
+    stat = Path(path).stat()
+    return str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns
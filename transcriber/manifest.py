@@ -0,0 +1,224 @@
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+from .cache import hash_file
+
+MEDIA_SUFFIXES = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.mp3', '.wav', '.md']
+FINAL_STAGE = 'refine'
+
+def _matches(relative: str, patterns: list[str]) -> bool:
+    name = relative.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def is_media(relative: str, include: list[str] = None, exclude: list[str] = None,
+             suffixes: list[str] = MEDIA_SUFFIXES) -> bool:
+    """
+    Return whether `scan_media` would yield a file, given its path relative to the root.
+
+    Args:
+        relative (str): Path of the file relative to the scanned root, with '/' separators.
+        include (list[str]): Glob patterns a file must match (optional).
+        exclude (list[str]): Glob patterns of files and directories to skip (optional).
+        suffixes (list[str]): File extensions to consider.
+    """
+    parts = relative.split('/')
+    for depth in range(1, len(parts) + 1):
+        if parts[depth - 1].startswith('.') or _matches('/'.join(parts[:depth]), exclude or []):
+            return False
+    if os.path.splitext(relative)[1].lower() not in suffixes:
+        return False
+    return not include or _matches(relative, include)
+
+def scan_media(root: Path, include: list[str] = None, exclude: list[str] = None,
+               suffixes: list[str] = MEDIA_SUFFIXES, ignore: list[Path] = None) -> Iterator[tuple[Path, os.stat_result]]:
+    """
+    Walk a directory tree and yield media files as they are found.
+
+    The walk uses `os.scandir`, whose entries carry the file type from the directory
+    listing itself, so only media files are stat'ed. Each file is yielded right away so
+    processing can start before the scan finishes. Patterns are matched against the
+    path relative to `root` (with '/' separators) and against the file name; an
+    excluded or ignored directory is not entered at all.
+
+    Args:
+        root (Path): The directory to scan.
+        include (list[str]): Glob patterns a file must match to be yielded (optional;
+            default is every file with one of `suffixes`).
+        exclude (list[str]): Glob patterns of files and directories to skip (optional).
+        suffixes (list[str]): File extensions to consider.
+        ignore (list[Path]): Files and directories inside `root` to leave out, such as
+            the output directory (optional).
+
+    Yields:
+        tuple[Path, os.stat_result]: Each matching file and its stat data.
+    """
+    include, exclude = include or [], exclude or []
+    base = Path(root).resolve()
+    ignored = {
+        path.relative_to(base).as_posix() for path in (Path(path).resolve() for path in ignore or []) if path.is_relative_to(base)
+    }
+    pending = [(Path(root), '')]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            logging.warning(f"Cannot scan {directory}: {str(e)}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            relative = prefix + entry.name
+            if entry.name.startswith('.') or relative in ignored or _matches(relative, exclude):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append((Path(entry.path), relative + '/'))
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in suffixes:
+                if include and not _matches(relative, include):
+                    continue
+                yield Path(entry.path), entry.stat()
+        pending.extend(reversed(subdirectories))  # Visit subdirectories in name order
+
+class Manifest:
+    """
+    A persistent record of the files in a media library and how far each got.
+
+    For every file the manifest stores its size, modification time and content hash
+    together with the status of each pipeline stage. A rescan compares size and
+    modification time first and only hashes files that look new or changed, so files
+    that are already done cost one directory entry each.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL, '
+            'stages TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def get(self, path: Path) -> dict:
+        """
+        Look up a file.
+
+        Args:
+            path (Path): Path to the file.
+
+        Returns:
+            dict: 'size', 'mtime_ns', 'hash' and 'stages' (stage name to status), or None
+            if the file is not in the manifest.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, mtime_ns, hash, stages FROM files WHERE path = ?', (str(Path(path).resolve()),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'size': row[0], 'mtime_ns': row[1], 'hash': row[2], 'stages': json.loads(row[3])}
+
+    def _load(self, root: Path) -> dict:
+        prefix = str(root)
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT path, size, mtime_ns, hash, stages FROM files WHERE path >= ? AND path < ?',
+                (prefix + os.sep, prefix + chr(ord(os.sep) + 1)),
+            ).fetchall()
+        return {path: (size, mtime_ns, digest, stages) for path, size, mtime_ns, digest, stages in rows}
+
+    def _save(self, path: str, size: int, mtime_ns: int, digest: str, stages: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime_ns, hash, stages, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (path, size, mtime_ns, digest, json.dumps(stages), time.time()),
+            )
+
+    def discover(self, root: Path, include: list[str] = None, exclude: list[str] = None,
+                 ignore: list[Path] = None) -> Iterator[Path]:
+        """
+        Scan a directory tree and yield the files that still need work.
+
+        Files whose size and modification time match the manifest are not read; they are
+        skipped when their final stage is done. Other files are hashed: a file with the
+        same content as before (e.g. only touched or copied back) keeps its stage
+        statuses, while new or changed content starts over.
+
+        Args:
+            root (Path): The directory to scan.
+            include (list[str]): Glob patterns a file must match (optional).
+            exclude (list[str]): Glob patterns of files and directories to skip (optional).
+            ignore (list[Path]): Files and directories inside `root` to leave out (optional).
+
+        Yields:
+            Path: Each file to process, as soon as it is found.
+        """
+        root = Path(root).resolve()
+        known = self._load(root)
+        found = changed = skipped = 0
+        for path, stat in scan_media(root, include, exclude, ignore=ignore):
+            found += 1
+            # Already absolute and resolved, as the walk starts at the resolved root
+            pending, rehashed = self._check(path, stat, known.get(str(path)))
+            changed += rehashed
+            if not pending:
+                skipped += 1
+                continue
+            yield path
+        logging.info(f"Scanned {found} files: {changed} new or changed, {skipped} already done")
+
+    def needs_work(self, path: Path) -> bool:
+        """
+        Check a single file the way `discover` does, e.g. one reported by a directory watcher.
+
+        Args:
+            path (Path): Path to the file.
+
+        Returns:
+            bool: False if the file's final stage is done for its current content.
+        """
+        path = Path(path).resolve()
+        with self._lock:
+            entry = self._db.execute(
+                'SELECT size, mtime_ns, hash, stages FROM files WHERE path = ?', (str(path),)
+            ).fetchone()
+        return self._check(path, path.stat(), entry)[0]
+
+    def _check(self, path: Path, stat: os.stat_result, entry: tuple) -> tuple[bool, bool]:
+        """Return whether a file still needs work and whether it had to be hashed."""
+        rehashed = False
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            stages = json.loads(entry[3])
+        else:
+            digest = hash_file(path)
+            stages = json.loads(entry[3]) if entry and entry[2] == digest else {}
+            self._save(str(path), stat.st_size, stat.st_mtime_ns, digest, stages)
+            rehashed = True
+        return stages.get(FINAL_STAGE) != 'done', rehashed
+
+    def mark(self, path: Path, stage: str, status: str) -> None:
+        """
+        Record the status of a pipeline stage for a file.
+
+        Args:
+            path (Path): Path to the file.
+            stage (str): The stage, e.g. 'transcribe' or 'refine'.
+            status (str): 'done' or 'failed'.
+        """
+        key = str(Path(path).resolve())
+        with self._lock:
+            row = self._db.execute('SELECT stages FROM files WHERE path = ?', (key,)).fetchone()
+            if row is None:
+                return
+            stages = json.loads(row[0])
+            stages[stage] = status
+            self._db.execute(
+                'UPDATE files SET stages = ?, updated = ? WHERE path = ?', (json.dumps(stages), time.time(), key)
+            )
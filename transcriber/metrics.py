@@ -0,0 +1,203 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PROMETHEUS_PREFIX = 'transcriber'
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _prometheus_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+class Metrics:
+    """
+    Timing spans and counters for one run, exported as a JSON report or Prometheus textfile.
+
+    A span measures how long an operation took (FFmpeg, splitting, a Whisper upload, a
+    refinement request, a rate-limit wait, file I/O); every span keeps its count, total
+    and maximum duration. Counters add up quantities such as tokens, audio seconds,
+    retries and HTTP 429 responses and may carry labels (e.g. the provider). Recording
+    is thread-safe and cheap, so metrics are always collected.
+    """
+
+    def __init__(self, clock=time.perf_counter, wall_clock=time.time):
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything recorded so far and start a new run."""
+        with self._lock:
+            self._spans = {}
+            self._counters = {}
+            self._started = self._clock()
+            self._started_at = self._wall_clock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record one completed span.
+
+        Args:
+            name (str): Name of the span, e.g. 'whisper_request'.
+            seconds (float): How long it took.
+        """
+        with self._lock:
+            span = self._spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the body of a `with` block as a span, whether it succeeds or fails."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self._clock() - start)
+
+    def timed(self, name: str):
+        """Decorator that records every call of a function or coroutine function as a span."""
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add to a counter.
+
+        Args:
+            name (str): Name of the counter, e.g. 'input_tokens'.
+            value (float): Amount to add.
+            **labels: Labels that distinguish series of the counter, e.g. provider='openai'.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels) -> float:
+        """Return the value of a counter; without labels, the sum over all its series."""
+        with self._lock:
+            if labels:
+                return self._counters.get((name, _label_key(labels)), 0)
+            return sum(value for (counter, _), value in self._counters.items() if counter == name)
+
+    def report(self) -> dict:
+        """
+        Summarize the run.
+
+        Returns:
+            dict: 'started' (Unix time), 'duration_seconds', 'spans' (name to count,
+            total_seconds, mean_seconds and max_seconds) and 'counters' (name to value, or
+            to a list of labelled series).
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    'count': count,
+                    'total_seconds': total,
+                    'mean_seconds': total / count,
+                    'max_seconds': longest,
+                }
+                for name, (count, total, longest) in sorted(self._spans.items())
+            }
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                if labels:
+                    counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+                else:
+                    counters[name] = value
+            return {
+                'started': self._started_at,
+                'duration_seconds': self._clock() - self._started,
+                'spans': spans,
+                'counters': counters,
+            }
+
+    def prometheus(self) -> str:
+        """Render the run in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            f'# TYPE {PROMETHEUS_PREFIX}_run_start_time_seconds gauge',
+            f'{PROMETHEUS_PREFIX}_run_start_time_seconds {report["started"]}',
+            f'# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge',
+            f'{PROMETHEUS_PREFIX}_run_duration_seconds {report["duration_seconds"]}',
+        ]
+        if report['spans']:
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_span_seconds summary')
+            for name, span in report['spans'].items():
+                labels = _prometheus_labels((('span', name),))
+                lines.append(f'{PROMETHEUS_PREFIX}_span_seconds_sum{labels} {span["total_seconds"]}')
+                lines.append(f'{PROMETHEUS_PREFIX}_span_seconds_count{labels} {span["count"]}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_span_max_seconds gauge')
+            for name, span in report['spans'].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_span_max_seconds{_prometheus_labels((("span", name),))} {span["max_seconds"]}')
+        with self._lock:
+            counters = sorted(self._counters.items())
+        names = []
+        for (name, _), _ in counters:
+            if name not in names:
+                names.append(name)
+        for name in names:
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name}_total counter')
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_total{_prometheus_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: Path) -> None:
+        """Write the run report as JSON."""
+        from .file_handler import FileHandler  # Imported here as file_handler imports this module
+        FileHandler.ensure_dir(Path(path).parent)
+        FileHandler.write_file(Path(path), json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path: Path) -> None:
+        """
+        Write the run in the Prometheus text format, e.g. for node_exporter's textfile collector.
+
+        The file is replaced atomically so the collector never reads a partial file.
+        """
+        from .file_handler import FileHandler
+        FileHandler.ensure_dir(Path(path).parent)
+        FileHandler.write_file(Path(path), self.prometheus())
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics of the current run."""
+    return _metrics
+
+def export_metrics(config) -> None:
+    """
+    Write the run's metrics to the files named in the configuration, if any.
+
+    Args:
+        config (Config): Configuration object with `metrics_report` (JSON) and
+            `metrics_textfile` (Prometheus) paths; empty paths are skipped.
+    """
+    if config.metrics_report:
+        _metrics.write_json(Path(config.metrics_report).expanduser())
+    if config.metrics_textfile:
+        _metrics.write_prometheus(Path(config.metrics_textfile).expanduser())
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from .audio_processing import FFmpegPool, extract_media_audio_async, process_audio_file
+from .video_processing import process_file
+from .refinement_processing import create_rate_limiter, process_with_refinement
+from .file_handler import FileHandler
+from .exceptions import QuotaExceededError
+from .quota import Usage
+from .config import Config
+from .manifest import Manifest
+
+VIDEO_SUFFIXES = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv']
+AUDIO_SUFFIXES = ['.mp3', '.wav']
+
+@dataclass
+class PipelineJob:
+    """A file moving through the pipeline and what each stage produced for it."""
+    input_path: Path
+    output_path: Path
+    audio_path: Path = None
+    transcript_path: Path = None
+
+def already_processed(input_file: Path, output_path: Path, manifest: Manifest = None) -> bool:
+    """
+    Return whether a file can be skipped because it has been processed before.
+
+    With a manifest the decision comes from the file's stage statuses for its current
+    content, so a file that changed since it was processed is done again even though
+    its refined transcript exists. Without one, an existing output file counts as done.
+
+    Args:
+        input_file (Path): The video, audio or transcript file.
+        output_path (Path): Where its refined transcript is written.
+        manifest (Manifest): Manifest recording the status of each stage per file (optional).
+    """
+    if manifest is not None:
+        try:
+            return not manifest.needs_work(input_file)
+        except FileNotFoundError:
+            return False  # Let the stages report the missing file
+    return output_path.exists()
+
+_DONE = object()  # Tells a stage worker that no more jobs will arrive
+
+async def _stage(name: str, workers: int, inbox: asyncio.Queue, outbox: asyncio.Queue, handle, finish,
+                 downstream_workers: int = 0, manifest: Manifest = None) -> None:
+    """
+    Run a pipeline stage: `workers` tasks take jobs from `inbox`, handle them and pass them on.
+
+    A job that fails does not reach the next stage and its input file is reported to
+    `finish` instead, as is every job leaving the last stage (`outbox` is None). The outcome of each job
+    is recorded in `manifest` if given. Each worker stops at a _DONE marker; once all
+    have stopped, one marker per downstream worker is queued.
+    """
+    async def worker():
+        while (job := await inbox.get()) is not _DONE:
+            input_path = job.input_path
+            try:
+                job = await handle(job)
+            except QuotaExceededError as e:
+                # Leave the file unprocessed so a later run picks it up; smaller files may still fit
+                logging.warning(f"Skipping {input_path.name}: {str(e)}")
+                job = None
+            except Exception as e:
+                logging.error(f"Error in {name} stage for file {input_path.name}: {str(e)}")
+                job = None
+                if manifest:
+                    manifest.mark(input_path, name, 'failed')
+            else:
+                if manifest:
+                    manifest.mark(input_path, name, 'done')
+            if job is None or outbox is None:
+                finish(input_path)
+            else:
+                await outbox.put(job)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    for _ in range(downstream_workers):
+        await outbox.put(_DONE)
+
+async def run_pipeline(input_files, output_dir: Path, instructions_path: Path, config: Config, pbar=None,
+                       manifest: Manifest = None, on_file_done=None) -> Usage:
+    """
+    Transcribe and refine many files with the stages of different files overlapping.
+
+    Each file goes through three stages connected by bounded queues:
+
+    - extract: FFmpeg converts the input to WAV in asyncio subprocesses, as many at once
+      as fit the available cores (only needed for the 'wav' and 'silence' modes),
+    - transcribe: the audio is split and sent to Whisper,
+    - refine: the transcript is refined with the shared rate limiter.
+
+    While one file is being refined the next can be transcribed and a third extracted,
+    so a directory takes about as long as its slowest stage rather than the sum of all
+    stages. The number of workers per stage and the queue size come from the
+    configuration; the bounded queues keep extracted WAV files from piling up on disk
+    when transcription is the bottleneck.
+
+    `input_files` may be a generator, such as `Manifest.discover`; it is advanced in a
+    worker thread so files enter the pipeline while a directory is still being scanned.
+
+    Args:
+        input_files: Video, audio and markdown transcript files (any iterable of Path).
+        output_dir (Path): Directory to save all output files.
+        instructions_path (Path): Path to the instructions file for refinement.
+        config (Config): Configuration object.
+        pbar: Progress bar updated as each file finishes (optional).
+        manifest (Manifest): Manifest recording the status of each stage per file (optional).
+        on_file_done: Called with each input file as it leaves the pipeline, whether it
+            was processed, skipped or failed (optional).
+
+    Returns:
+        Usage: The refinement usage of all files.
+    """
+    limiter = create_rate_limiter(config)
+    total_usage = Usage()
+    ffmpeg = FFmpegPool.from_config(config)
+    workers = {
+        'extract': ffmpeg.processes,
+        'transcribe': max(1, config.pipeline_transcribe_workers),
+        'refine': max(1, config.pipeline_refine_workers),
+    }
+    to_extract, to_transcribe, to_refine = (asyncio.Queue(max(1, config.pipeline_queue_size)) for _ in range(3))
+
+    def finish(input_file: Path):
+        if pbar:
+            pbar.update(1)
+        if on_file_done:
+            on_file_done(input_file)
+
+    async def extract(job: PipelineJob) -> PipelineJob:
+        if job.transcript_path is None:
+            job.audio_path = await extract_media_audio_async(job.input_path, output_dir, config, ffmpeg)
+        return job
+
+    async def transcribe(job: PipelineJob) -> PipelineJob:
+        if job.transcript_path is not None:
+            return job
+        # Transcription runs its own thread pool of Whisper requests, so it is kept off the event loop
+        process = process_file if job.input_path.suffix.lower() in VIDEO_SUFFIXES else process_audio_file
+        try:
+            job.transcript_path = await asyncio.to_thread(process, job.input_path, output_dir, config, job.audio_path, ffmpeg)
+        finally:
+            if job.audio_path and job.audio_path != job.input_path and job.audio_path.exists():
+                job.audio_path.unlink()
+        return job
+
+    async def refine(job: PipelineJob) -> PipelineJob:
+        try:
+            usage = await process_with_refinement(job.transcript_path, job.output_path, instructions_path, config, limiter)
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            logging.error(f"Error processing {job.input_path.name} with refinement API: {str(e)}")
+            # If refinement processing fails, copy the original transcript to the output
+            FileHandler.write_file(job.output_path, FileHandler.read_file(job.transcript_path))
+            usage = Usage()
+        total_usage.add(usage)
+        logging.info(f"Processed {usage.tokens} tokens for {job.input_path.name}")
+        return job
+
+    async def feed():
+        files = iter(input_files)
+        while (input_file := await asyncio.to_thread(next, files, None)) is not None:
+            output_path = output_dir / f"{input_file.stem}_refined.md"
+            suffix = input_file.suffix.lower()
+            if already_processed(input_file, output_path, manifest):
+                logging.info(f"Skipping {input_file.name} as it has already been processed.")
+                finish(input_file)
+            elif suffix == '.md':
+                # Transcripts pass through the first two stages untouched
+                await to_extract.put(PipelineJob(input_file, output_path, transcript_path=input_file))
+            elif suffix in VIDEO_SUFFIXES + AUDIO_SUFFIXES:
+                await to_extract.put(PipelineJob(input_file, output_path))
+            else:
+                logging.warning(f"Unsupported file type: {input_file.name}. Skipping.")
+                finish(input_file)
+        for _ in range(workers['extract']):
+            await to_extract.put(_DONE)
+
+    await asyncio.gather(
+        feed(),
+        _stage('extract', workers['extract'], to_extract, to_transcribe, extract, finish, workers['transcribe'], manifest),
+        _stage('transcribe', workers['transcribe'], to_transcribe, to_refine, transcribe, finish, workers['refine'], manifest),
+        _stage('refine', workers['refine'], to_refine, None, refine, finish, manifest=manifest),
+    )
+
+    logging.info(f"Processed a total of {total_usage.tokens} tokens ({total_usage.cache_read_tokens} more read from the prompt cache)")
+    return total_usage
@@ -0,0 +1,290 @@
+import cProfile
+import importlib
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+# Functions that mark a pipeline stage. A sample or allocation belongs to the innermost
+# stage function on its stack, so tokenization during refinement counts as tokenization.
+# Nested functions (e.g. the worker closures of transcribe_chunks) belong to the stage
+# of the function they are defined in.
+STAGE_FUNCTIONS = {
+    'extraction': [
+        'transcriber.audio_processing:convert_video_to_audio',
+        'transcriber.audio_processing:FFmpegPool.convert',
+        'transcriber.audio_processing:extract_media_audio',
+        'transcriber.audio_processing:extract_media_audio_async',
+    ],
+    'split': [
+        'transcriber.audio_processing:split_audio',
+        'transcriber.audio_processing:extract_audio_chunks',
+        'transcriber.silence:split_audio_on_silence',
+    ],
+    'transcription': [
+        'transcriber.transcription:transcribe_audio_chunk',
+        'transcriber.transcription:transcribe_chunks',
+    ],
+    'tokenization': [
+        'transcriber.token_utils:Tokenizer.encode',
+        'transcriber.token_utils:Tokenizer.encode_batch',
+        'transcriber.token_utils:Tokenizer.chunk',
+    ],
+    'refinement': [
+        'transcriber.refinement_processing:refine_chunk',
+        'transcriber.refinement_processing:process_with_refinement',
+    ],
+}
+OTHER_STAGE = 'other'
+# Leaf frames of threads that are waiting for work rather than doing any
+IDLE_FRAMES = {('selectors.py', 'select'), ('threading.py', 'wait'), ('queue.py', 'get'), ('thread.py', '_worker')}
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+MEMORY_CHECK_INTERVAL = 0.5  # Seconds between checks for a new memory peak
+MEMORY_GROWTH = 1.1  # A new peak snapshot is taken once traced memory grows by 10%
+TRACEBACK_FRAMES = 32
+# Before Python 3.12 cProfile only sees the thread that enabled it, so every thread needs
+# its own profile. Since 3.12 it is built on sys.monitoring, which covers all threads and
+# allows only one active profiler, so a second profile would fail to enable.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+TOP_ENTRIES = 15
+
+def _resolve(target: str):
+    module_name, _, attribute = target.partition(':')
+    value = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        value = getattr(value, name)
+    return value.__code__
+
+def _nested_codes(code):
+    yield code
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            yield from _nested_codes(const)
+
+def stage_codes() -> dict:
+    """Map the code object of every stage function, and of the functions nested in it, to its stage."""
+    codes = {}
+    for stage, targets in STAGE_FUNCTIONS.items():
+        for target in targets:
+            for code in _nested_codes(_resolve(target)):
+                codes[code] = stage
+    return codes
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profiler:
+    """
+    Profile a run and write CPU and memory hot spots per pipeline stage.
+
+    While active, three things are recorded:
+
+    - a sampling profiler reads the stack of every thread every few milliseconds, so the
+      asyncio event loop, worker threads and time spent waiting on the network or on
+      FFmpeg are all covered; samples are attributed to a stage by the stage functions
+      on their stack (see STAGE_FUNCTIONS) and written as collapsed stacks, the input
+      format of flamegraph.pl, speedscope and similar tools,
+    - cProfile records the main thread and every thread started during the run (with one
+      profile per thread before Python 3.12); the merged profile is written in pstats
+      format,
+    - tracemalloc traces allocations and a snapshot is taken whenever traced memory
+      reaches a new peak; the allocations live at the highest peak are summarized per
+      stage, which shows what held the memory when a long recording ran out of it.
+
+    Nothing is installed unless a profiler is started, so runs without --profile pay no
+    cost for it.
+    """
+
+    def __init__(self, directory: Path, interval: float = SAMPLE_INTERVAL, frames: int = TRACEBACK_FRAMES):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._samples = Counter()
+        self._profiles = []
+        self._peak = 0
+        self._peak_snapshot = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self) -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+        self.write()
+
+    def start(self) -> None:
+        """Start sampling, cProfile and tracemalloc."""
+        self._codes = stage_codes()
+        self._started = time.perf_counter()
+        tracemalloc.start(self.frames)
+        self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._sampler.start()
+        if PROFILE_PER_THREAD:
+            threading.setprofile(self._profile_thread)
+        main_profile = cProfile.Profile()
+        self._profiles.append(main_profile)
+        main_profile.enable()
+
+    def _profile_thread(self, frame, event, arg):
+        # Installed by threading.setprofile in each new thread; replaces itself with cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def stop(self) -> None:
+        """Stop recording; the results are kept for `write`."""
+        self._profiles[0].disable()
+        if PROFILE_PER_THREAD:
+            threading.setprofile(None)
+        self._stop.set()
+        self._sampler.join()
+        self._check_memory(force=True)
+        self.duration = time.perf_counter() - self._started
+        self.peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        next_memory_check = 0.0
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                stage = None
+                while frame is not None:
+                    if stage is None:
+                        stage = self._codes.get(frame.f_code)
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                self._samples[(stage or OTHER_STAGE, tuple(reversed(stack)))] += 1
+            now = time.monotonic()
+            if now >= next_memory_check:
+                self._check_memory()
+                next_memory_check = now + MEMORY_CHECK_INTERVAL
+
+    def _check_memory(self, force: bool = False) -> None:
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self._peak * MEMORY_GROWTH or (force and self._peak_snapshot is None):
+            self._peak = current
+            self._peak_snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, __file__),  # The profiler's own samples
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+
+    def stage_samples(self) -> Counter:
+        """Return the number of samples per stage."""
+        totals = Counter()
+        for (stage, _), count in self._samples.items():
+            totals[stage] += count
+        return totals
+
+    def collapsed_stacks(self) -> list[str]:
+        """Return the samples as collapsed stack lines ('stage;outer;...;inner count'), heaviest first."""
+        lines = Counter()
+        for (stage, stack), count in self._samples.items():
+            lines[';'.join([stage, *(_frame_label(code) for code in stack)])] += count
+        return [f"{stack} {count}" for stack, count in lines.most_common()]
+
+    def _stage_ranges(self) -> dict:
+        ranges = {}
+        for code, stage in self._codes.items():
+            lines = [line for _, _, line in code.co_lines() if line is not None]
+            if lines:
+                ranges.setdefault(code.co_filename, []).append((code.co_firstlineno, max(lines), stage))
+        return ranges
+
+    def allocations_by_stage(self) -> dict:
+        """
+        Group the allocations live at the memory peak by stage.
+
+        Returns:
+            dict: Stage name to (total bytes, Counter of bytes per allocating source line).
+        """
+        if self._peak_snapshot is None:
+            return {}
+        ranges = self._stage_ranges()
+
+        def stage_of(traceback) -> str:
+            for frame in reversed(traceback):  # Innermost frame first
+                for first, last, stage in ranges.get(frame.filename, ()):
+                    if first <= frame.lineno <= last:
+                        return stage
+            return OTHER_STAGE
+
+        totals = Counter()
+        lines = {}
+        for trace in self._peak_snapshot.traces:
+            stage = stage_of(trace.traceback)
+            innermost = trace.traceback[-1]
+            totals[stage] += trace.size
+            lines.setdefault(stage, Counter())[f"{innermost.filename}:{innermost.lineno}"] += trace.size
+        return {stage: (total, lines[stage]) for stage, total in totals.items()}
+
+    def summary(self) -> str:
+        """Return a readable summary of where time and memory went, per stage."""
+        samples = self.stage_samples()
+        total = sum(samples.values()) or 1
+        lines = [f"Profiled {self.duration:.1f}s, {sum(samples.values())} busy samples every {self.interval * 1000:.0f} ms", '']
+        lines.append('Busy time per stage (wall clock, all threads):')
+        for stage, count in samples.most_common():
+            lines.append(f"  {stage:<14} {count * self.interval:8.2f}s  {count / total:6.1%}")
+        for stage, _ in samples.most_common():
+            leaves = Counter()
+            for (sample_stage, stack), count in self._samples.items():
+                if sample_stage == stage:
+                    leaves[_frame_label(stack[-1])] += count
+            lines.append('')
+            lines.append(f"Top functions in {stage} (own samples):")
+            for label, count in leaves.most_common(TOP_ENTRIES):
+                lines.append(f"  {count:8d}  {label}")
+
+        lines.append('')
+        lines.append(f"Peak traced memory: {self.peak_traced / 2**20:.1f} MiB")
+        for stage, (size, allocations) in sorted(self.allocations_by_stage().items(), key=lambda item: -item[1][0]):
+            lines.append('')
+            lines.append(f"Allocations live at the peak in {stage}: {size / 2**20:.1f} MiB")
+            for location, location_size in allocations.most_common(TOP_ENTRIES):
+                lines.append(f"  {location_size / 2**10:10.1f} KiB  {location}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self) -> None:
+        """
+        Write the profile files to the profile directory:
+
+        - cpu.collapsed: sampled stacks per stage, for flame graphs,
+        - cpu.pstats: the merged cProfile data of all threads,
+        - memory_peak.snapshot: the tracemalloc snapshot of the memory peak,
+        - summary.txt: time per stage, top functions and top allocations per stage.
+        """
+        from .file_handler import FileHandler
+
+        FileHandler.ensure_dir(self.directory)
+        FileHandler.write_file(self.directory / 'cpu.collapsed', '\n'.join(self.collapsed_stacks()) + '\n')
+        stats = None
+        for profile in self._profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                continue  # A thread that never ran any Python code has no statistics
+        if stats is not None:
+            stats.dump_stats(str(self.directory / 'cpu.pstats'))
+        if self._peak_snapshot is not None:
+            self._peak_snapshot.dump(str(self.directory / 'memory_peak.snapshot'))
+        FileHandler.write_file(self.directory / 'summary.txt', self.summary())
+        logging.info(f"Profile written to {self.directory}")
@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from .exceptions import QuotaExceededError
+from .metrics import get_metrics
+
+WINDOW_SECONDS = 24 * 60 * 60  # Limits apply to a rolling 24-hour window
+
+@dataclass
+class Usage:
+    """
+    API usage for one provider/model, or a sum over several.
+
+    `cache_read_tokens` are prompt tokens served from the provider's prompt cache; they
+    are not part of `input_tokens`. `cache_write_tokens` are the part of `input_tokens`
+    that was written to the cache.
+    """
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    audio_seconds: float = 0.0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: 'Usage') -> None:
+        self.requests += other.requests
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.audio_seconds += other.audio_seconds
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_write_tokens += other.cache_write_tokens
+
+class Reservation:
+    """
+    Usage set aside ahead of a job so concurrent jobs cannot overcommit the quota.
+
+    The reserved amount shrinks as the job records its actual usage, and whatever is
+    left is released when the reservation is closed.
+    """
+
+    def __init__(self, accountant: 'QuotaAccountant', provider: str, usage: Usage):
+        self.accountant = accountant
+        self.provider = provider
+        self.remaining = usage
+
+    def __enter__(self) -> 'Reservation':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.accountant.release(self)
+
+class QuotaAccountant:
+    """
+    Track API usage per provider and model and enforce daily limits.
+
+    Every request is appended to a JSON-lines usage log, so the totals survive
+    across invocations and are shared by every process writing to the same file.
+    Events older than the rolling window are dropped when the log is loaded. With
+    `path` set to None usage is only kept in memory.
+
+    `limits` maps a provider name to its daily limits, e.g.
+    ``{"anthropic": {"tokens": 300000, "requests": 1000}, "openai": {"audio_seconds": 36000}}``.
+    A missing or zero limit means unlimited.
+    """
+
+    def __init__(self, path: Path, limits: dict = None, clock=time.time):
+        self.path = Path(path) if path is not None else None
+        self.limits = limits or {}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._events = []
+        self._reservations = []
+        self._offset = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        cutoff = self._clock() - WINDOW_SECONDS
+        with self.path.open('r') as f:
+            lines = f.readlines()
+            self._offset = f.tell()
+        events = []
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Ignore a partially written last line
+            if event['time'] >= cutoff:
+                events.append(event)
+        self._events = events
+        if len(events) < len(lines):
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('w') as f:
+            for event in self._events:
+                f.write(json.dumps(event) + "\n")
+        os.replace(tmp_path, self.path)
+        self._offset = self.path.stat().st_size
+
+    def _refresh(self) -> None:
+        """Pick up events appended to the usage log since the last read."""
+        if self.path is None or not self.path.exists():
+            return
+        with self.path.open('r') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                self._offset += len(line.encode())
+                try:
+                    self._events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+    def usage(self, provider: str = None, model: str = None) -> Usage:
+        """
+        Return the usage recorded within the rolling window.
+
+        Args:
+            provider (str): Only count usage for this provider (optional).
+            model (str): Only count usage for this model (optional).
+
+        Returns:
+            Usage: The summed usage.
+        """
+        with self._lock:
+            self._refresh()
+            return self._usage(provider, model)
+
+    def _usage(self, provider: str = None, model: str = None) -> Usage:
+        cutoff = self._clock() - WINDOW_SECONDS
+        total = Usage()
+        for event in self._events:
+            if event['time'] < cutoff:
+                continue
+            if provider and event['provider'] != provider:
+                continue
+            if model and event['model'] != model:
+                continue
+            total.add(Usage(
+                event['requests'], event['input_tokens'], event['output_tokens'], event['audio_seconds'],
+                event.get('cache_read_tokens', 0), event.get('cache_write_tokens', 0),
+            ))
+        return total
+
+    def remaining(self, provider: str) -> dict:
+        """
+        Return how much of each configured daily limit is left for a provider.
+
+        Args:
+            provider (str): The provider name.
+
+        Returns:
+            dict: Remaining amount per limit name; pending reservations count as used.
+        """
+        with self._lock:
+            self._refresh()
+            return self._remaining(provider)
+
+    def _remaining(self, provider: str) -> dict:
+        used = self._usage(provider)
+        for reservation in self._reservations:
+            if reservation.provider == provider:
+                used.add(reservation.remaining)
+        limits = self.limits.get(provider, {})
+        current = {'tokens': used.tokens, 'requests': used.requests, 'audio_seconds': used.audio_seconds}
+        return {name: limit - current[name] for name, limit in limits.items() if limit}
+
+    def reserve(self, provider: str, requests: int = 0, input_tokens: int = 0, output_tokens: int = 0,
+                audio_seconds: float = 0.0) -> Reservation:
+        """
+        Set aside the estimated usage of a job before starting it.
+
+        Args:
+            provider (str): The provider name.
+            requests (int): Estimated number of requests.
+            input_tokens (int): Estimated number of prompt tokens.
+            output_tokens (int): Estimated number of completion tokens.
+            audio_seconds (float): Estimated seconds of audio to transcribe.
+
+        Returns:
+            Reservation: A reservation to pass to `record`; use it as a context manager
+            to release what is left over when the job ends.
+
+        Raises:
+            QuotaExceededError: If the job does not fit in what is left of the daily limits.
+        """
+        usage = Usage(requests, input_tokens, output_tokens, audio_seconds)
+        needed = {'tokens': usage.tokens, 'requests': usage.requests, 'audio_seconds': usage.audio_seconds}
+        with self._lock:
+            self._refresh()
+            for name, left in self._remaining(provider).items():
+                if needed[name] > left:
+                    raise QuotaExceededError(
+                        f"Daily {name.replace('_', ' ')} limit for {provider} would be exceeded "
+                        f"(needs {needed[name]:g}, {max(left, 0):g} left)"
+                    )
+            reservation = Reservation(self, provider, usage)
+            self._reservations.append(reservation)
+            return reservation
+
+    def release(self, reservation: Reservation) -> None:
+        """Release whatever is left of a reservation."""
+        with self._lock:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+
+    def record(self, provider: str, model: str, requests: int = 1, input_tokens: int = 0, output_tokens: int = 0,
+               audio_seconds: float = 0.0, reservation: Reservation = None, cache_read_tokens: int = 0,
+               cache_write_tokens: int = 0) -> None:
+        """
+        Record the actual usage of a request and persist it to the usage log.
+
+        Args:
+            provider (str): The provider name.
+            model (str): The model name.
+            requests (int): Number of requests made.
+            input_tokens (int): Number of prompt tokens used.
+            output_tokens (int): Number of completion tokens used.
+            audio_seconds (float): Seconds of audio transcribed.
+            reservation (Reservation): Reservation the usage is drawn from (optional).
+            cache_read_tokens (int): Number of prompt tokens read from the prompt cache,
+                in addition to `input_tokens`.
+            cache_write_tokens (int): Number of the input tokens written to the prompt cache.
+        """
+        metrics = get_metrics()
+        metrics.count('api_requests', requests, provider=provider)
+        if input_tokens or output_tokens:
+            metrics.count('input_tokens', input_tokens, provider=provider)
+            metrics.count('output_tokens', output_tokens, provider=provider)
+        if audio_seconds:
+            metrics.count('audio_seconds', audio_seconds, provider=provider)
+        if cache_read_tokens or cache_write_tokens:
+            metrics.count('prompt_cache_read_tokens', cache_read_tokens, provider=provider)
+            metrics.count('prompt_cache_write_tokens', cache_write_tokens, provider=provider)
+        event = {
+            'time': self._clock(),
+            'provider': provider,
+            'model': model,
+            'requests': requests,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'audio_seconds': audio_seconds,
+            'cache_read_tokens': cache_read_tokens,
+            'cache_write_tokens': cache_write_tokens,
+        }
+        with self._lock:
+            if self.path is None:
+                self._events.append(event)
+            else:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open('a') as f:
+                    f.write(json.dumps(event) + "\n")
+                self._refresh()
+            if reservation is not None:
+                left = reservation.remaining
+                left.requests = max(0, left.requests - requests)
+                left.input_tokens = max(0, left.input_tokens - input_tokens)
+                left.output_tokens = max(0, left.output_tokens - output_tokens)
+                left.audio_seconds = max(0.0, left.audio_seconds - audio_seconds)
+
+    def summary(self) -> dict:
+        """
+        Return the usage within the rolling window for every provider and model.
+
+        Returns:
+            dict: Usage per "provider/model" key.
+        """
+        with self._lock:
+            self._refresh()
+            keys = sorted({(e['provider'], e['model']) for e in self._events})
+            return {f"{provider}/{model}": asdict(self._usage(provider, model)) for provider, model in keys}
+
+_accountant = None
+
+def configure_quota(config) -> QuotaAccountant:
+    """
+    Create the process-wide quota accountant from the configuration.
+
+    Args:
+        config (Config): Configuration object containing the cache directory and daily limits.
+
+    Returns:
+        QuotaAccountant: The shared accountant.
+    """
+    global _accountant
+    _accountant = QuotaAccountant(config.cache_dir / 'usage.jsonl', config.daily_limits)
+    return _accountant
+
+def get_quota() -> QuotaAccountant:
+    """
+    Return the process-wide quota accountant.
+
+    Falls back to an in-memory accountant without limits when `configure_quota`
+    was never called, so library use outside the CLI does not need any setup.
+    """
+    global _accountant
+    if _accountant is None:
+        _accountant = QuotaAccountant(None)
+    return _accountant
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously at a fixed rate per minute.
+
+    The bucket starts full and holds at most `capacity` units. Usage recorded after
+    the fact may push the level below zero; the debt is paid back by the refill
+    before any further request is admitted.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Return how many seconds to wait before `amount` units are available.
+
+        Requests larger than the bucket are capped at its capacity, so they wait for
+        a full bucket instead of waiting forever.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Remove `amount` units from the bucket, allowing it to go into debt."""
+        self._refill()
+        self.level -= amount
+
+class RateLimiter:
+    """
+    Async rate limiter enforcing both requests-per-minute and tokens-per-minute.
+
+    Callers `await acquire(tokens)` before each API request, passing the estimated
+    prompt size, and call `record(tokens)` afterwards with any usage that was not
+    known up front (e.g. completion tokens). Waiters are admitted in FIFO order.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Wait until one request carrying `tokens` tokens fits within both limits.
+
+        Args:
+            tokens (int): Estimated number of tokens the request will consume.
+        """
+        async with self._lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                logging.debug(f"Rate limit reached, waiting {delay:.1f}s")
+                await asyncio.sleep(delay)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def record(self, tokens: int) -> None:
+        """
+        Charge tokens consumed by a request beyond what was passed to `acquire`.
+
+        Args:
+            tokens (int): Number of additional tokens consumed.
+        """
+        self.tokens.take(tokens)
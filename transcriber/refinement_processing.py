@@ -1,142 +1,390 @@
 import logging
 import asyncio
-import os
+import hashlib
+import json
+import time
 from pathlib import Path
-from openai import OpenAI
-from anthropic import Anthropic
-from .file_handler import FileHandler  # Add this import
+from .file_handler import FileHandler, ProgressiveWriter
 from .config import Config
-from .exceptions import RefinementProcessingError
-from .token_utils import count_tokens, split_into_chunks
+from .exceptions import RefinementProcessingError, QuotaExceededError
+from .quota import Usage, get_quota
+from .cache import get_cache
+from .clients import get_clients
+from .journal import open_journal, file_identity
+from .metrics import get_metrics
+from .rate_limiter import RateLimiter
+from .token_utils import count_tokens, count_tokens_batch, chunk_text
 
-MAX_TOKENS_PER_REQUEST = 20000
-REQUESTS_PER_MINUTE = 5
-TOKENS_PER_DAY = 300000
+def create_rate_limiter(config: Config) -> RateLimiter:
+    """
+    Create a rate limiter for the refinement API from the configured limits.
+
+    Args:
+        config (Config): Configuration object containing API settings.
+
+    Returns:
+        RateLimiter: A limiter enforcing the configured requests and tokens per minute.
+    """
+    return RateLimiter(config.requests_per_minute, config.tokens_per_minute)
+
+def refinement_provider(config: Config) -> str:
+    """Return the name under which refinement usage is tracked by the quota accountant."""
+    return 'openrouter' if config.use_openrouter else 'anthropic'
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# Shorter prompts are not cached by the provider (the minimum is 1024 tokens for most models)
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_TTL = 300  # Seconds a cached prefix lives after it was last used
+_prompt_cache_used = {}  # (model, instructions hash) -> when a request last used the prefix
+
+def use_prompt_cache(config: Config, instruction_tokens: int) -> bool:
+    """Return whether refinement requests should mark the instructions as a cacheable prefix."""
+    return config.prompt_caching and instruction_tokens >= PROMPT_CACHE_MIN_TOKENS
+
+def _prompt_cache_warm(key: tuple) -> bool:
+    used = _prompt_cache_used.get(key)
+    return used is not None and time.monotonic() - used < PROMPT_CACHE_TTL
+
+def refinement_cache_key(model: str, instructions: str, temperature: float, chunk: str) -> str:
+    """Return the cache key of a refinement request: model, instructions, temperature and chunk text."""
+    return _sha256(json.dumps([model, _sha256(instructions), temperature, _sha256(chunk)]))
+
+def refinement_prompt(chunk: str) -> str:
+    """Return the user prompt that asks for one transcript chunk to be refined."""
+    return f"Here's a chunk of the transcript to refine:\n\n{chunk}\n\nPlease refine this chunk according to the instructions provided."
+
+def align_chunks(transcript: str, previous_chunks: list[str], max_tokens: int) -> list[str]:
+    """
+    Split a transcript into chunks, reusing the chunks of a previous run where possible.
+
+    Previous chunks that still appear in the transcript, in order, are kept as they are
+    so their cached refinements can be reused. Only the text between them (new or edited
+    passages) is split into new chunks, cut at paragraph or sentence boundaries.
+
+    Args:
+        transcript (str): The transcript to split.
+        previous_chunks (list[str]): The chunks the transcript was split into last time.
+        max_tokens (int): The maximum number of tokens per new chunk.
 
-async def process_with_refinement(input_path: Path, output_path: Path, instructions_path: Path, config: Config):
+    Returns:
+        list[str]: The chunks, in transcript order.
+    """
+    chunks = []
+    position = 0
+    for previous in previous_chunks:
+        index = transcript.find(previous, position)
+        if not previous or index < 0:
+            continue
+        if transcript[position:index].strip():
+            chunks.extend(chunk.text for chunk in chunk_text(transcript[position:index], max_tokens))
+        chunks.append(previous)
+        position = index + len(previous)
+    if transcript[position:].strip():
+        chunks.extend(chunk.text for chunk in chunk_text(transcript[position:], max_tokens))
+    return chunks
+
+def plan_refinement(input_path: Path, transcript: str, instructions: str, instruction_tokens: int, model: str,
+                    config: Config) -> tuple[list[str], str]:
+    """
+    Split a transcript into refinement chunks, keeping the boundaries of the previous run.
+
+    Args:
+        input_path (Path): Path of the transcript, which identifies the previous run.
+        transcript (str): The transcript text.
+        instructions (str): The refinement instructions.
+        instruction_tokens (int): Number of tokens in the instructions.
+        model (str): Name of the refinement model.
+        config (Config): Configuration object containing API settings.
+
+    Returns:
+        tuple[list[str], str]: The chunks, and the cache key under which to store them for
+        the next run once they are refined.
+    """
+    max_chunk_tokens = config.max_tokens_per_request - instruction_tokens - 200  # 200 tokens buffer for prompts
+    cache = get_cache()
+    plan_key = _sha256(json.dumps([str(Path(input_path).resolve()), model, _sha256(instructions)]))
+    previous_chunks = json.loads(cache.get('refinement-plan', plan_key) or '[]') if cache else []
+    return align_chunks(transcript, previous_chunks, max_chunk_tokens), plan_key
+
+def system_prompt(instructions: str, cache: bool):
+    """
+    Return the refinement instructions as a system prompt.
+
+    Args:
+        instructions (str): The refinement instructions.
+        cache (bool): Whether to mark the instructions as a cacheable prompt prefix.
+
+    Returns:
+        str | list[dict]: The instructions, or a text block with `cache_control` so the
+        provider keeps the processed prefix and later requests only pay for their chunk.
+    """
+    if not cache:
+        return instructions
+    return [{"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}}]
+
+def _message_usage(usage, output_tokens: int = None) -> Usage:
+    # input_tokens of the messages API excludes the cached prefix; cache writes are processed like input
+    written = getattr(usage, 'cache_creation_input_tokens', None) or 0
+    read = getattr(usage, 'cache_read_input_tokens', None) or 0
+    output = usage.output_tokens if output_tokens is None else output_tokens
+    return Usage(1, usage.input_tokens + written, output, cache_read_tokens=read, cache_write_tokens=written)
+
+async def refine_chunk(client, model: str, instructions: str, chunk: str, config: Config, on_text=None,
+                       cache_prompt: bool = False) -> tuple[str, Usage]:
+    """
+    Send a single transcript chunk to the refinement API.
+
+    Args:
+        client: The AsyncAnthropic or AsyncOpenAI (OpenRouter) client object.
+        model (str): Name of the model to use.
+        instructions (str): The refinement instructions.
+        chunk (str): The transcript chunk to refine.
+        config (Config): Configuration object containing API settings.
+        on_text: If given, the response is streamed and this is called with each piece
+            of text as it arrives (optional).
+        cache_prompt (bool): Whether to mark the instructions as a cacheable prefix.
+
+    Returns:
+        tuple[str, Usage]: The refined text and the usage of the request. Input tokens
+        read from the prompt cache are reported as `cache_read_tokens`, not as input.
+    """
+    user_prompt = refinement_prompt(chunk)
+    if config.use_openrouter:
+        # OpenRouter passes cache_control on content blocks through to Anthropic
+        messages = [
+            {"role": "system", "content": system_prompt(instructions, cache_prompt)},
+            {"role": "user", "content": user_prompt}
+        ]
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=config.max_tokens,
+            temperature=config.temperature,
+            stream=on_text is not None,
+        )
+        if on_text is not None:
+            pieces = []
+            async for event in response:
+                piece = event.choices[0].delta.content if event.choices else None
+                if piece:
+                    pieces.append(piece)
+                    on_text(piece)
+            text, usage = "".join(pieces), None  # Streamed responses do not report usage
+        else:
+            text = response.choices[0].message.content
+            usage = getattr(response, 'usage', None)
+        if usage:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            read = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+            return text, Usage(1, usage.prompt_tokens - read, usage.completion_tokens, cache_read_tokens=read)
+        return text, Usage(1, count_tokens(instructions) + count_tokens(user_prompt), count_tokens(text))
+
+    response = await client.messages.create(
+        model=model,
+        max_tokens=config.max_tokens,
+        temperature=config.temperature,
+        system=system_prompt(instructions, cache_prompt),
+        messages=[{"role": "user", "content": user_prompt}],
+        stream=on_text is not None,
+    )
+    if on_text is None:
+        text = "".join(block.text for block in response.content if block.type == "text")
+        return text, _message_usage(response.usage)
+    pieces = []
+    start_usage, output_tokens = None, 0
+    async for event in response:
+        if event.type == "message_start":
+            start_usage = event.message.usage
+        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+            pieces.append(event.delta.text)
+            on_text(event.delta.text)
+        elif event.type == "message_delta":
+            output_tokens = event.usage.output_tokens
+    text = "".join(pieces)
+    if start_usage is None:
+        return text, Usage(1, count_tokens(instructions) + count_tokens(user_prompt), count_tokens(text))
+    return text, _message_usage(start_usage, output_tokens)
+
+async def process_with_refinement(input_path: Path, output_path: Path, instructions_path: Path, config: Config, limiter: RateLimiter = None,
+                                  stream=None):
     """
     Process a single file with the refinement API.
 
     This function reads the input file, applies refinement instructions, and saves the refined output.
+    Chunks are sent concurrently, up to `config.refinement_concurrency` at a time, and every
+    request is admitted by a token-bucket limiter that enforces the configured requests and
+    tokens per minute. The whole file's estimated usage is reserved with the quota
+    accountant before the first request, so a file is either refined completely or not
+    started at all.
+
+    When a result cache is configured, refined chunks are cached by model, instructions,
+    temperature and chunk text, and the chunk boundaries of the previous run of the same
+    file are reused. Re-running an edited transcript therefore only sends the new or
+    changed passages to the API. Refined chunks are also checkpointed in a journal as
+    they complete, which `config.resume` picks up after a crash.
+
+    When the instructions are long enough to be cached (see `use_prompt_cache`), they are
+    sent as a cacheable system prefix. The provider then processes them once and later
+    chunks, and other files with the same instructions, read them from its prompt cache
+    within a few minutes. Concurrent requests only share a cache entry once it has been
+    written, so unless the prefix was used recently the first chunk is sent alone and the
+    rest follow when it completes. Cache hits and the input tokens read from the cache are
+    logged per file and counted in the run metrics.
+
+    The output is written progressively: each refined chunk is appended to
+    `<output>.partial` as soon as every chunk before it is done, and the partial file
+    becomes the output once the last chunk is written. Memory use therefore does not
+    grow with the number of refined chunks. With `stream`, the responses are streamed
+    from the API and the refined text is also printed there, in order, as it arrives.
 
     Args:
         input_path (Path): Path to the input file to be refined.
         output_path (Path): Path to save the refined output.
         instructions_path (Path): Path to the file containing refinement instructions.
         config (Config): Configuration object containing API settings.
+        limiter (RateLimiter): Rate limiter shared with other files (optional). A new one
+            is created from the config if not provided.
+        stream: Text stream, such as sys.stdout, the refined transcript is printed to as it
+            is generated (optional).
+
+    Returns:
+        Usage: The API usage of the refinement.
 
     Raises:
         RefinementProcessingError: If there's an error during the refinement process.
+        QuotaExceededError: If the file does not fit in the remaining daily allowance.
     """
     logging.info(f"Processing with Refinement API: {input_path.name}")
     
     if config.use_openrouter:
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv('OPENROUTER_API_KEY'),
-        )
+        client = get_clients().async_openrouter()
         model = config.openrouter_claude_model
     else:
-        client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        client = get_clients().async_anthropic()
         model = config.claude_model
+
+    if limiter is None:
+        limiter = create_rate_limiter(config)
     
     transcript = FileHandler.read_file(input_path)
     instructions = FileHandler.read_file(instructions_path)
+    instruction_tokens = count_tokens(instructions)
     
-    chunks = split_into_chunks(transcript, MAX_TOKENS_PER_REQUEST - count_tokens(instructions) - 200)  # 200 tokens buffer for prompts
-    
-    refined_chunks = []
-    for i, chunk in enumerate(chunks):
-        logging.info(f"Processing chunk {i+1} of {len(chunks)}")
-        try:
-            if config.use_openrouter:
-                messages = [
-                    {"role": "system", "content": instructions},
-                    {"role": "user", "content": f"Here's a chunk of the transcript to refine:\n\n{chunk}\n\nPlease refine this chunk according to the instructions provided."}
-                ]
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=config.max_tokens,
-                    temperature=config.temperature,
-                )
-                refined_chunks.append(response.choices[0].message.content)
-            else:
-                response = client.completions.create(
-                    model=model,
-                    max_tokens_to_sample=config.max_tokens,
-                    temperature=config.temperature,
-                    prompt=f"{instructions}\n\nHuman: Here's a chunk of the transcript to refine:\n\n{chunk}\n\nPlease refine this chunk according to the instructions provided.\n\nAssistant:"
-                )
-                refined_chunks.append(response.completion)
-            
-            # Rate limiting
-            if i < len(chunks) - 1:  # Don't wait after the last chunk
-                await asyncio.sleep(60 / REQUESTS_PER_MINUTE)
-        
-        except Exception as e:
-            logging.error(f"Error processing chunk {i+1} with Refinement API: {str(e)}")
-            refined_chunks.append(chunk)  # Use original chunk if processing fails
-    
-    refined_transcript = "\n\n".join(refined_chunks)
-    FileHandler.write_file(output_path, refined_transcript)
-    
-    logging.info(f"Refined transcript saved to: {output_path}")
+    chunks, plan_key = plan_refinement(input_path, transcript, instructions, instruction_tokens, model, config)
+    cache = get_cache()
+    journal = open_journal(
+        config, 'refinement', *file_identity(input_path), _sha256(json.dumps(chunks)),
+        model, _sha256(instructions), config.temperature,
+    )
+    cached = journal.completed
+    if cache:
+        for i, chunk in enumerate(chunks):
+            if i in cached:
+                continue
+            refined = cache.get('refinement', refinement_cache_key(model, instructions, config.temperature, chunk))
+            if refined is not None:
+                cached[i] = refined
+    if cached:
+        logging.info(f"{len(cached)} of {len(chunks)} chunks already refined")
+    pending = [i for i in range(len(chunks)) if i not in cached]
+    # Encodes each pending chunk once more (chunks are slices, which the tokenizer does not memoize)
+    chunk_tokens = dict(zip(pending, count_tokens_batch([chunks[i] for i in pending])))
+    semaphore = asyncio.Semaphore(max(1, config.refinement_concurrency))
 
-async def process_multiple_files(input_files: list[Path], output_dir: Path, instructions_path: Path, config: Config, pbar=None):
-    from .video_processing import process_file
-    from .audio_processing import process_audio_file
-
-    total_tokens = 0
-    for input_file in input_files:
-        output_path = output_dir / f"{input_file.stem}_refined.md"
-        
-        # Check if the output file already exists
-        if output_path.exists():
-            logging.info(f"Skipping {input_file.name} as it has already been processed.")
-            if pbar:
-                pbar.update(1)
-            continue
+    # Refined text is about as long as its input, which is used as the completion estimate
+    provider = refinement_provider(config)
+    quota = get_quota()
+    reservation = quota.reserve(
+        provider,
+        requests=len(pending),
+        input_tokens=sum(instruction_tokens + tokens + 200 for tokens in chunk_tokens.values()),
+        output_tokens=sum(chunk_tokens.values()),
+    )
+    total_usage = Usage()
+    metrics = get_metrics()
+    cache_prompt = use_prompt_cache(config, instruction_tokens)
+    prefix_key = (model, _sha256(instructions))
+    primed = asyncio.Event()  # Set once the cacheable prefix has been written
+    if not cache_prompt or len(pending) < 2 or _prompt_cache_warm(prefix_key):
+        primed.set()
+    cache_hits = 0
 
+    async def refine(i: int, chunk: str) -> None:
+        if i in cached:
+            writer.complete(i, cached.pop(i))
+            return
+        if i != pending[0]:
+            await primed.wait()
         try:
-            if input_file.suffix.lower() in ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv']:
-                transcript_path = process_file(input_file, output_dir)
-            elif input_file.suffix.lower() in ['.mp3', '.wav']:
-                transcript_path = process_audio_file(input_file, output_dir)
-            elif input_file.suffix.lower() == '.md':
-                transcript_path = input_file
-            else:
-                logging.warning(f"Unsupported file type: {input_file.name}. Skipping.")
-                if pbar:
-                    pbar.update(1)
-                continue
+            await send(i, chunk)
+        finally:
+            primed.set()
 
+    async def send(i: int, chunk: str) -> None:
+        nonlocal cache_hits
+        async with semaphore:
+            with metrics.span('rate_limit_wait'):
+                await limiter.acquire(instruction_tokens + chunk_tokens[i] + 200)
+            logging.info(f"Processing chunk {i+1} of {len(chunks)}")
             try:
-                await process_with_refinement(transcript_path, output_path, instructions_path, config)
+                with metrics.span('refinement_request'):
+                    on_text = (lambda text: writer.add_text(i, text)) if stream is not None else None
+                    refined, usage = await refine_chunk(client, model, instructions, chunk, config, on_text, cache_prompt)
             except Exception as e:
-                logging.error(f"Error processing {input_file.name} with refinement API: {str(e)}")
-                # If refinement processing fails, copy the original transcript to the output
-                FileHandler.write_file(output_path, FileHandler.read_file(transcript_path))
-            
-            # Count tokens processed
-            file_content = FileHandler.read_file(output_path)
-            file_tokens = count_tokens(file_content)
-            total_tokens += file_tokens
-            
-            logging.info(f"Processed {file_tokens} tokens for {input_file.name}")
-            
-            if pbar:
-                pbar.update(1)
-            
-            if total_tokens >= TOKENS_PER_DAY:
-                logging.warning("Daily token limit reached. Stopping processing.")
-                break
-            
-            # Wait to avoid hitting rate limits
-            await asyncio.sleep(60 / REQUESTS_PER_MINUTE)
-        
-        except Exception as e:
-            logging.error(f"Error processing file {input_file.name}: {str(e)}")
-            # Continue to the next file
-
-    logging.info(f"Processed a total of {total_tokens} tokens")
\ No newline at end of file
+                logging.error(f"Error processing chunk {i+1} with Refinement API: {str(e)}")
+                metrics.count('refinement_errors', provider=provider)
+                writer.complete(i, chunk)  # Use original chunk if processing fails
+                return
+            limiter.record(usage.output_tokens)
+            quota.record(provider, model, usage.requests, usage.input_tokens, usage.output_tokens, reservation=reservation,
+                         cache_read_tokens=usage.cache_read_tokens, cache_write_tokens=usage.cache_write_tokens)
+            if cache_prompt:
+                _prompt_cache_used[prefix_key] = time.monotonic()
+                result = 'hit' if usage.cache_read_tokens else 'write' if usage.cache_write_tokens else 'miss'
+                metrics.count('prompt_cache_requests', provider=provider, result=result)
+                cache_hits += result == 'hit'
+            total_usage.add(usage)
+            if cache:
+                cache.put('refinement', refinement_cache_key(model, instructions, config.temperature, chunk), refined)
+            journal.record(i, refined)
+            writer.complete(i, refined)
+
+    with reservation, ProgressiveWriter(output_path, len(chunks), stream=stream) as writer:
+        await asyncio.gather(*(refine(i, chunk) for i, chunk in enumerate(chunks)))
+    if stream is not None:
+        stream.write("\n")
+    if cache:
+        cache.put('refinement-plan', plan_key, json.dumps(chunks))
+    journal.discard()
+    if cache_prompt and total_usage.requests:
+        logging.info(
+            f"Prompt cache: {cache_hits} of {total_usage.requests} requests reused the instructions, "
+            f"{total_usage.cache_read_tokens} input tokens read from the cache"
+        )
+    
+    logging.info(f"Refined transcript saved to: {output_path}")
+    return total_usage
+
+async def process_multiple_files(input_files, output_dir: Path, instructions_path: Path, config: Config, pbar=None,
+                                 manifest=None) -> Usage:
+    """
+    Transcribe and refine many files, overlapping the stages of different files.
+
+    See `pipeline.run_pipeline`.
+
+    Args:
+        input_files: Video, audio and markdown transcript files (any iterable of Path).
+        output_dir (Path): Directory to save all output files.
+        instructions_path (Path): Path to the instructions file for refinement.
+        config (Config): Configuration object.
+        pbar: Progress bar updated as each file finishes (optional).
+        manifest (Manifest): Manifest recording the status of each stage per file (optional).
+
+    Returns:
+        Usage: The refinement usage of all files.
+    """
+    from .pipeline import run_pipeline  # Imported here to avoid circular import
+
+    return await run_pipeline(input_files, output_dir, instructions_path, config, pbar, manifest)
@@ -0,0 +1,211 @@
+import logging
+import wave
+from pathlib import Path
+from typing import Iterator
+import numpy as np
+from .exceptions import VideoProcessingError
+from .metrics import get_metrics
+
+FRAME_MS = 30  # Length of the analysis frames used for energy detection
+MIN_PAUSE_SECONDS = 0.3  # Shortest pause considered as a chunk boundary
+KEEP_SILENCE_SECONDS = 0.5  # Silence kept when a long silence is shortened
+SEARCH_FRACTION = 0.25  # How far before the target length a pause is looked for
+
+def _samples(frames: bytes, sampwidth: int, channels: int) -> np.ndarray:
+    """Convert raw PCM frames to mono float samples in the range [-1, 1]."""
+    if sampwidth == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sampwidth == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif sampwidth == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise VideoProcessingError(f"Unsupported sample width for silence detection: {sampwidth * 8} bits")
+    return samples.reshape(-1, channels).mean(axis=1)
+
+def frame_energy(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """
+    Compute the energy of consecutive frames in dBFS.
+
+    Args:
+        samples (np.ndarray): Mono samples in the range [-1, 1].
+        frame_length (int): Number of samples per frame. A trailing partial frame
+            gets its own value.
+
+    Returns:
+        np.ndarray: One energy value per frame.
+    """
+    full = len(samples) // frame_length
+    squares = np.square(samples, dtype=np.float64)
+    power = squares[:full * frame_length].reshape(full, frame_length).mean(axis=1)
+    if len(samples) % frame_length:
+        power = np.append(power, squares[full * frame_length:].mean())
+    return 10 * np.log10(power + 1e-12)
+
+def wav_frame_energy(audio_path: Path, frame_ms: int = FRAME_MS, block_seconds: int = 60) -> tuple[np.ndarray, float]:
+    """
+    Compute per-frame energy of a WAV file without loading it into memory at once.
+
+    Args:
+        audio_path (Path): Path to the PCM WAV file.
+        frame_ms (int): Length of each analysis frame in milliseconds.
+        block_seconds (int): Amount of audio decoded per read.
+
+    Returns:
+        tuple[np.ndarray, float]: Energy per frame in dBFS and the frame length in seconds.
+    """
+    with wave.open(str(audio_path), 'rb') as source:
+        frame_length = max(1, source.getframerate() * frame_ms // 1000)
+        block_frames = frame_length * max(1, source.getframerate() * block_seconds // frame_length)
+        energies = []
+        while True:
+            frames = source.readframes(block_frames)
+            if not frames:
+                break
+            samples = _samples(frames, source.getsampwidth(), source.getnchannels())
+            energies.append(frame_energy(samples, frame_length))
+        frame_seconds = frame_length / source.getframerate()
+    return (np.concatenate(energies) if energies else np.zeros(0)), frame_seconds
+
+def _silent_runs(silent: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return start and end frame indices of every run of silent frames."""
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def plan_chunks(energies: np.ndarray, frame_seconds: float, target_seconds: float,
+                threshold_db: float = -40.0, skip_silence_seconds: float = 2.0) -> list[list[tuple[float, float]]]:
+    """
+    Plan chunk boundaries inside pauses and leave out long silences.
+
+    Silences longer than `skip_silence_seconds` are shortened to KEEP_SILENCE_SECONDS
+    (half on each side of the pause), so they are neither uploaded nor billed. The
+    remaining audio is packed into chunks of at most `target_seconds`, cut in the middle
+    of a pause close to the target length where possible, and at the target length when
+    there is no pause to cut at.
+
+    Args:
+        energies (np.ndarray): Energy per frame in dBFS.
+        frame_seconds (float): Length of each frame in seconds.
+        target_seconds (float): Maximum length of a chunk in seconds.
+        threshold_db (float): Frames below this energy count as silence.
+        skip_silence_seconds (float): Silences at least this long are shortened.
+
+    Returns:
+        list[list[tuple[float, float]]]: For each chunk, the spans of the source audio
+        (start and end in seconds) that are concatenated to form it. This is the
+        timestamp map from chunk positions back to the source.
+    """
+    total = len(energies) * frame_seconds
+    starts, ends = _silent_runs(energies < threshold_db)
+    run_starts, run_ends = starts * frame_seconds, np.minimum(ends * frame_seconds, total)
+    lengths = run_ends - run_starts
+
+    # Source spans that are kept: everything except the middle of long silences
+    keep = KEEP_SILENCE_SECONDS / 2
+    long_runs = lengths >= skip_silence_seconds
+    cut_starts = np.where(run_starts[long_runs] == 0, 0, run_starts[long_runs] + keep)
+    cut_ends = np.where(run_ends[long_runs] >= total, total, run_ends[long_runs] - keep)
+    span_starts = np.concatenate(([0.0], cut_ends))
+    span_ends = np.concatenate((cut_starts, [total]))
+    valid = span_ends > span_starts
+    span_starts, span_ends = span_starts[valid], span_ends[valid]
+    if not len(span_starts):
+        return []
+
+    # Positions on the kept timeline where a chunk may be cut, in order of preference
+    offsets = np.concatenate(([0.0], np.cumsum(span_ends - span_starts)))
+    kept_total = offsets[-1]
+    pauses = (lengths >= MIN_PAUSE_SECONDS) & ~long_runs
+    midpoints = (run_starts[pauses] + run_ends[pauses]) / 2
+    span_of = np.searchsorted(span_starts, midpoints, side='right') - 1
+    inside = (span_of >= 0) & (midpoints < span_ends[np.maximum(span_of, 0)])
+    pause_cuts = offsets[span_of[inside]] + midpoints[inside] - span_starts[span_of[inside]]
+    candidates = np.unique(np.concatenate((offsets, pause_cuts)))
+
+    boundaries = [0.0]
+    while kept_total - boundaries[-1] > target_seconds:
+        ideal = boundaries[-1] + target_seconds
+        window = candidates[(candidates > ideal - target_seconds * SEARCH_FRACTION) & (candidates <= ideal)]
+        boundaries.append(float(window[-1]) if len(window) else ideal)
+    boundaries.append(float(kept_total))
+
+    # Map each chunk on the kept timeline back to spans of the source audio
+    chunks = []
+    for a, b in zip(boundaries, boundaries[1:]):
+        spans = []
+        for i in range(np.searchsorted(offsets, a, side='right') - 1, len(span_starts)):
+            if offsets[i] >= b:
+                break
+            start = span_starts[i] + max(0.0, a - offsets[i])
+            end = span_starts[i] + min(offsets[i + 1], b) - offsets[i]
+            if end > start:
+                spans.append((float(start), float(end)))
+        if spans:
+            chunks.append(spans)
+
+    skipped = total - kept_total
+    if skipped > 0:
+        logging.info(f"Skipping {skipped:.0f}s of silence ({100 * skipped / total:.0f}% of the audio)")
+    return chunks
+
+def plan_silence_chunks(audio_path: Path, chunk_length_ms: int = 60000, threshold_db: float = -40.0,
+                        skip_silence_seconds: float = 2.0) -> list:
+    """
+    Analyse a WAV file and plan the chunks `split_audio_on_silence` cuts it into.
+
+    Args:
+        audio_path (Path): Path to the input PCM WAV file.
+        chunk_length_ms (int): Maximum length of each chunk in milliseconds.
+        threshold_db (float): Frames below this energy (dBFS) count as silence.
+        skip_silence_seconds (float): Silences at least this long are shortened.
+
+    Returns:
+        list: The source spans of each chunk (see `plan_chunks`).
+
+    Raises:
+        VideoProcessingError: If the file is not a PCM WAV file.
+    """
+    with get_metrics().span('silence_analysis'):
+        try:
+            energies, frame_seconds = wav_frame_energy(audio_path)
+        except (wave.Error, EOFError) as e:
+            raise VideoProcessingError(f"Cannot split {audio_path}: not a PCM WAV file ({str(e)})")
+        return plan_chunks(energies, frame_seconds, chunk_length_ms / 1000, threshold_db, skip_silence_seconds)
+
+def split_audio_on_silence(audio_path: Path, chunk_length_ms: int = 60000, threshold_db: float = -40.0,
+                           skip_silence_seconds: float = 2.0, timestamp_map: list = None, plan: list = None) -> Iterator[str]:
+    """
+    Split a WAV file into chunks that end in pauses and leave out long silences.
+
+    Like `split_audio`, chunks are written one at a time so memory stays bounded.
+
+    Args:
+        audio_path (Path): Path to the input PCM WAV file.
+        chunk_length_ms (int): Maximum length of each chunk in milliseconds.
+        threshold_db (float): Frames below this energy (dBFS) count as silence.
+        skip_silence_seconds (float): Silences at least this long are shortened.
+        timestamp_map (list): If given, the source spans of each chunk are appended to it
+            as it is produced (see `plan_chunks`).
+        plan (list): The plan from `plan_silence_chunks` (optional; made here otherwise).
+
+    Yields:
+        str: Path to each created audio chunk, in playback order.
+    """
+    logging.info("Splitting audio into chunks at pauses")
+    metrics = get_metrics()
+    if plan is None:
+        plan = plan_silence_chunks(audio_path, chunk_length_ms, threshold_db, skip_silence_seconds)
+
+    with wave.open(str(audio_path), 'rb') as source:
+        params = source.getparams()
+        for i, spans in enumerate(plan):
+            chunk_name = f"{audio_path}_chunk_{i}.wav"
+            with metrics.span('split_audio'), wave.open(chunk_name, 'wb') as chunk:
+                chunk.setparams(params)
+                for start, end in spans:
+                    first = round(start * params.framerate)
+                    source.setpos(first)
+                    chunk.writeframes(source.readframes(round(end * params.framerate) - first))
+            if timestamp_map is not None:
+                timestamp_map.append(spans)
+            yield chunk_name
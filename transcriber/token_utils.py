@@ -1,4 +1,311 @@
-import tiktoken
+import hashlib
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+from .metrics import get_metrics
+
+TOKENIZER_MODEL = "gpt-3.5-turbo"
+MEMO_MAX_TOKENS = 4_000_000  # About 16 MB of memoized token arrays
+
+# How good a place to cut a token boundary is, from worst to best
+BOUNDARY_INVALID = -1  # Inside a multi-byte character
+BOUNDARY_CHARACTER = 0
+BOUNDARY_WORD = 1
+BOUNDARY_SENTENCE = 2
+BOUNDARY_PARAGRAPH = 3
+
+_WHITESPACE = np.frombuffer(b' \t\r\n', dtype=np.uint8)
+_SENTENCE_END = np.frombuffer(b'.!?', dtype=np.uint8)
+_CLOSING = np.frombuffer(b'"\')]', dtype=np.uint8)
+
+@dataclass
+class TextChunk:
+    """A chunk of a text with its position in the text and in the text's tokens."""
+    text: str
+    start_char: int
+    end_char: int
+    start_token: int
+    end_token: int
+
+    @property
+    def tokens(self) -> int:
+        """Number of tokens in the chunk."""
+        return self.end_token - self.start_token
+
+class Tokenizer:
+    """
+    A shared tokenizer that encodes each text only once.
+
+    The encoding is loaded on first use and kept. Token arrays are memoized by a hash
+    of the text in an LRU bounded by the total number of tokens held, so counting the
+    same transcript, chunk or instructions again in a later stage is a lookup. Only the
+    results of real encodes are memoized: the token slice a chunk was cut from can differ
+    from what encoding the chunk's text on its own gives.
+    """
+
+    def __init__(self, model: str = TOKENIZER_MODEL, max_tokens: int = MEMO_MAX_TOKENS,
+                 max_workers: int = None, encoding=None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._encoding = encoding
+        self._memo = OrderedDict()
+        self._memo_tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def encoding(self):
+        """The tiktoken encoding, loaded once."""
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    import tiktoken  # Deferred so commands that never count tokens start faster
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+        return self._encoding
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def _lookup(self, key: bytes):
+        with self._lock:
+            tokens = self._memo.get(key)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return tokens
+
+    def _store(self, key: bytes, tokens: array) -> None:
+        if len(tokens) > self.max_tokens:
+            return
+        with self._lock:
+            previous = self._memo.pop(key, None)
+            if previous is not None:
+                self._memo_tokens -= len(previous)
+            self._memo[key] = tokens
+            self._memo_tokens += len(tokens)
+            while self._memo_tokens > self.max_tokens:
+                _, evicted = self._memo.popitem(last=False)
+                self._memo_tokens -= len(evicted)
+
+    def encode(self, text: str) -> array:
+        """
+        Encode a text, reusing the tokens of an earlier call with the same text.
+
+        Args:
+            text (str): The text to encode.
+
+        Returns:
+            array: The token ids. Treat it as read-only; it is shared with the memo.
+        """
+        key = self._key(text)
+        tokens = self._lookup(key)
+        if tokens is None:
+            with get_metrics().span('tokenize'):
+                tokens = array('I', self.encoding.encode_ordinary(text))
+            self._store(key, tokens)
+        return tokens
+
+    def encode_batch(self, texts: list[str]) -> list[array]:
+        """
+        Encode many texts, encoding the ones not seen before in parallel.
+
+        Duplicate texts are encoded once. tiktoken releases the GIL while encoding, so
+        the thread pool uses several cores.
+
+        Args:
+            texts (list[str]): The texts to encode.
+
+        Returns:
+            list[array]: The token ids of each text, in order.
+        """
+        keys = [self._key(text) for text in texts]
+        found = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            tokens = self._lookup(key)
+            if tokens is None:
+                missing[key] = text
+            else:
+                found[key] = tokens
+        if not missing:
+            return [found[key] for key in keys]
+        with get_metrics().span('tokenize'):
+            if len(missing) > 1 and self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                    encoded = list(executor.map(self.encoding.encode_ordinary, missing.values()))
+            else:
+                encoded = [self.encoding.encode_ordinary(text) for text in missing.values()]
+        for key, tokens in zip(missing, encoded):
+            found[key] = array('I', tokens)
+            self._store(key, found[key])
+        return [found[key] for key in keys]
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens in a text."""
+        return len(self.encode(text))
+
+    def count_batch(self, texts: list[str]) -> list[int]:
+        """Return the number of tokens in each of many texts, encoding them in parallel."""
+        return [len(tokens) for tokens in self.encode_batch(texts)]
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        """
+        Split a text into chunks, each containing at most max_tokens.
+
+        Cuts that would fall inside a multi-byte character move back to the character's
+        start, so no chunk contains a broken character.
+
+        Args:
+            text (str): The input text to split.
+            max_tokens (int): The maximum number of tokens per chunk.
+
+        Returns:
+            list[str]: A list of text chunks.
+        """
+        tokens = np.frombuffer(self.encode(text), dtype=np.uint32)
+        data = text.encode()
+        byte_offsets = self._token_byte_offsets(tokens)
+        boundaries = _byte_boundaries(data)[byte_offsets]
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + max_tokens, len(tokens))
+            if boundaries[end] == BOUNDARY_INVALID:
+                end = _valid_cut(boundaries, start, end)
+            chunks.append(data[int(byte_offsets[start]):int(byte_offsets[end])].decode())
+            start = end
+        return chunks
+
+    def _token_byte_offsets(self, tokens: np.ndarray) -> np.ndarray:
+        # Byte length of each distinct token id, looked up once per id rather than per token
+        ids, inverse = np.unique(tokens, return_inverse=True)
+        lengths = np.fromiter((len(self.encoding.decode_single_token_bytes(int(i))) for i in ids), dtype=np.int64, count=len(ids))
+        return np.concatenate(([0], np.cumsum(lengths[inverse])))
+
+    def chunk(self, text: str, max_tokens: int, overlap: int = 0, tolerance: float = 0.1) -> list[TextChunk]:
+        """
+        Split a text into chunks of at most max_tokens, cut at paragraph or sentence boundaries.
+
+        The text is encoded once and the chunks are slices of the token array. Each cut is
+        placed at the best boundary within the last `tolerance` fraction of the token
+        budget: a paragraph break, else a sentence end, else a word break, else any token
+        boundary that does not split a character. Chunks therefore use at least
+        `1 - tolerance` of the budget except at the end of the text. If every position in
+        that window splits a character, the cut moves further back to the nearest one that
+        does not.
+
+        Args:
+            text (str): The input text to split.
+            max_tokens (int): The maximum number of tokens per chunk.
+            overlap (int): Number of tokens each chunk repeats from the end of the previous
+                one, moved forward to the next word start.
+            tolerance (float): Fraction of the budget a cut may move back to reach a boundary.
+
+        Returns:
+            list[TextChunk]: The chunks with their character and token offsets.
+        """
+        if max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        overlap = max(0, min(overlap, max_tokens // 2))
+        tokens = np.frombuffer(self.encode(text), dtype=np.uint32)
+        if not len(tokens):
+            return []
+        data = text.encode()
+        byte_offsets = self._token_byte_offsets(tokens)
+        boundaries = _byte_boundaries(data)[byte_offsets]
+        # Character index of every byte position, to report offsets in the str
+        char_of_byte = np.concatenate((np.cumsum((np.frombuffer(data, dtype=np.uint8) & 0xC0) != 0x80), [len(text)]))
+        char_of_byte[:-1] -= 1
+
+        count = len(tokens)
+        window = max(1, int(max_tokens * tolerance))
+        chunks = []
+        start = 0
+        while start < count:
+            end = min(start + max_tokens, count)
+            if end < count:
+                lo = max(start + 1, end - window)
+                candidates = boundaries[lo:end + 1]
+                best = candidates.max()
+                if best > BOUNDARY_INVALID:
+                    end = lo + int(np.flatnonzero(candidates == best)[-1])
+                else:
+                    end = _valid_cut(boundaries, start, end)
+            first, last = int(byte_offsets[start]), int(byte_offsets[end])
+            chunk_text = data[first:last].decode()
+            chunks.append(TextChunk(chunk_text, int(char_of_byte[first]), int(char_of_byte[last]), start, end))
+            if end >= count:
+                break
+            next_start = end
+            if overlap:
+                lo = max(start + 1, end - overlap)
+                words = np.flatnonzero(boundaries[lo:end] >= BOUNDARY_WORD)
+                valid = np.flatnonzero(boundaries[lo:end] > BOUNDARY_INVALID)
+                if len(words):
+                    next_start = lo + int(words[0])
+                elif len(valid):
+                    next_start = lo + int(valid[0])
+            start = next_start
+        return chunks
+
+    def stats(self) -> dict:
+        """Return memo hits, misses and size."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memo), 'tokens': self._memo_tokens}
+
+def _byte_boundaries(data: bytes) -> np.ndarray:
+    """Classify every byte position of UTF-8 text (0 to len) as a cut point, see BOUNDARY_*."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    whitespace = np.isin(b, _WHITESPACE)
+    before = np.concatenate(([0], b))  # Byte before each position
+    before_ws = np.concatenate(([True], whitespace))
+    after_ws = np.concatenate((whitespace, [True]))
+    two_before = np.concatenate(([0, 0], b))[:len(b) + 1]
+
+    classes = np.full(len(b) + 1, BOUNDARY_CHARACTER, dtype=np.int8)
+    classes[before_ws != after_ws] = BOUNDARY_WORD
+    sentence_end = np.isin(before, _SENTENCE_END) | (np.isin(before, _CLOSING) & np.isin(two_before, _SENTENCE_END))
+    classes[sentence_end & after_ws] = BOUNDARY_SENTENCE
+    newline = np.concatenate((b == 10, [False]))
+    classes[(before == 10) | newline] = BOUNDARY_PARAGRAPH
+    continuation = np.concatenate(((b & 0xC0) == 0x80, [False]))
+    classes[continuation] = BOUNDARY_INVALID
+    classes[0] = classes[-1] = BOUNDARY_PARAGRAPH
+    return classes
+
+def _valid_cut(boundaries: np.ndarray, start: int, end: int) -> int:
+    """
+    Move a cut at token `end` back to the nearest token boundary after `start` that does
+    not split a character. If there is none (a single character spans the whole budget),
+    the cut moves forward to the end of that character instead.
+    """
+    valid = np.flatnonzero(boundaries[start + 1:end + 1] > BOUNDARY_INVALID)
+    if len(valid):
+        return start + 1 + int(valid[-1])
+    return start + 1 + int(np.flatnonzero(boundaries[start + 1:] > BOUNDARY_INVALID)[0])
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer() -> Tokenizer:
+    """Return the process-wide tokenizer shared by all pipeline stages."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = Tokenizer()
+    return _tokenizer
 
 def count_tokens(text: str) -> int:
     """
@@ -10,8 +317,19 @@ def count_tokens(text: str) -> int:
     Returns:
         int: The number of tokens in the text.
     """
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(encoding.encode(text))
+    return get_tokenizer().count(text)
+
+def count_tokens_batch(texts: list[str]) -> list[int]:
+    """
+    Count the number of tokens in each of many texts, encoding them in parallel.
+
+    Args:
+        texts (list[str]): The texts to tokenize.
+
+    Returns:
+        list[int]: The number of tokens in each text, in order.
+    """
+    return get_tokenizer().count_batch(texts)
 
 def split_into_chunks(text: str, max_tokens: int) -> list[str]:
     """
@@ -24,18 +342,21 @@ def split_into_chunks(text: str, max_tokens: int) -> list[str]:
     Returns:
         list[str]: A list of text chunks.
     """
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    tokens = encoding.encode(text)
-    chunks = []
-    current_chunk = []
+    return get_tokenizer().split(text, max_tokens)
 
-    for token in tokens:
-        current_chunk.append(token)
-        if len(current_chunk) >= max_tokens:
-            chunks.append(encoding.decode(current_chunk))
-            current_chunk = []
+def chunk_text(text: str, max_tokens: int, overlap: int = 0, tolerance: float = 0.1) -> list[TextChunk]:
+    """
+    Split a text into chunks of at most max_tokens, cut at paragraph or sentence boundaries.
 
-    if current_chunk:
-        chunks.append(encoding.decode(current_chunk))
+    See `Tokenizer.chunk`.
 
-    return chunks
\ No newline at end of file
+    Args:
+        text (str): The input text to split.
+        max_tokens (int): The maximum number of tokens per chunk.
+        overlap (int): Number of tokens each chunk repeats from the previous one.
+        tolerance (float): Fraction of the budget a cut may move back to reach a boundary.
+
+    Returns:
+        list[TextChunk]: The chunks with their character and token offsets.
+    """
+    return get_tokenizer().chunk(text, max_tokens, overlap, tolerance)
@@ -1,9 +1,21 @@
+import math
 import os
-from openai import OpenAI
-from .token_utils import count_tokens
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .exceptions import TranscriptionError
+from .token_utils import count_tokens_batch
+from .quota import get_quota
+from .cache import get_cache, hash_file
+from .clients import get_clients
+from .metrics import get_metrics
 import logging
 
-MAX_TOKENS_PER_REQUEST = 4096  # Adjust this based on the Whisper model's limit
+WHISPER_MODEL = "whisper-1"
+STUB_MODEL = "stub"
 
 def transcribe_audio_chunk(client, chunk_path):
     """
@@ -16,51 +28,420 @@ def transcribe_audio_chunk(client, chunk_path):
     Returns:
         str: The transcribed text for the audio chunk.
     """
-    with open(chunk_path, "rb") as audio_file:
+    with get_metrics().span('whisper_request'), open(chunk_path, "rb") as audio_file:
         transcript = client.audio.transcriptions.create(
-            model="whisper-1", 
+            model=WHISPER_MODEL,
             file=audio_file
         )
     return transcript.text
 
-def transcribe_audio(audio_path):
+class TranscriptionBackend(ABC):
+    """
+    A speech-to-text engine that audio chunks are sent to.
+
+    Chunks are submitted in batches of `batch_size`; engines that cannot transcribe
+    several chunks in one call keep the default of 1. `provider` and `model` name the
+    engine in the usage log and in the transcription cache.
+    """
+
+    provider = ''
+    model = ''
+    batch_size = 1
+    extra_workers = 0  # Workers added to the transcription concurrency for this backend
+
+    @property
+    def models(self) -> tuple:
+        """Models whose cached transcripts this backend accepts."""
+        return (self.model,)
+
+    @abstractmethod
+    def transcribe(self, chunk_path) -> str:
+        """Transcribe one chunk."""
+
+    def transcribe_batch(self, chunk_paths: list) -> list[str]:
+        """Transcribe a batch of chunks; the transcripts are returned in the same order."""
+        return [self.transcribe(chunk_path) for chunk_path in chunk_paths]
+
+    def select(self, seconds: float) -> 'TranscriptionBackend':
+        """Return the backend that transcribes a recording of this length."""
+        return self
+
+    @contextmanager
+    def acquire(self):
+        """Reserve the engine for one batch; yields the backend that runs it."""
+        yield self
+
+class OpenAIBackend(TranscriptionBackend):
+    """The OpenAI Whisper API."""
+
+    provider = 'openai'
+    model = WHISPER_MODEL
+
+    def __init__(self, client=None):
+        if client is None:
+            if not os.environ.get('OPENAI_API_KEY'):
+                raise ValueError("OPENAI_API_KEY environment variable not set")
+            client = get_clients().openai()
+        self.client = client
+
+    def transcribe(self, chunk_path) -> str:
+        return transcribe_audio_chunk(self.client, chunk_path)
+
+_local_models = {}
+_local_models_lock = threading.Lock()
+
+def load_local_model(model: str, device: str = 'cpu', compute_type: str = 'int8', cpu_threads: int = 0, workers: int = 1):
+    """
+    Load a faster-whisper model once per process and return it.
+
+    Loading a model takes seconds, so every file and chunk of a run shares one instance;
+    `workers` is the number of transcriptions it runs in parallel.
+
+    Raises:
+        TranscriptionError: If faster-whisper is not installed.
+    """
+    key = (model, device, compute_type, cpu_threads, workers)
+    with _local_models_lock:
+        if key not in _local_models:
+            try:
+                from faster_whisper import WhisperModel  # Optional dependency, only needed for local transcription
+            except ImportError:
+                raise TranscriptionError("Local transcription requires faster-whisper (pip install faster-whisper)")
+            logging.info(f"Loading local Whisper model {model} on {device}")
+            _local_models[key] = WhisperModel(
+                model, device=device, compute_type=compute_type, cpu_threads=cpu_threads, num_workers=max(1, workers),
+            )
+        return _local_models[key]
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """Whisper running on this machine through faster-whisper (CTranslate2)."""
+
+    provider = 'local'
+
+    def __init__(self, model: str, device: str = 'cpu', compute_type: str = 'int8', cpu_threads: int = 0, workers: int = 1):
+        self.model = f"faster-whisper:{model}"
+        self._options = (model, device, compute_type, cpu_threads, workers)
+
+    def transcribe(self, chunk_path) -> str:
+        engine = load_local_model(*self._options)
+        with get_metrics().span('local_transcription'):
+            segments, _ = engine.transcribe(str(chunk_path))
+            return "".join(segment.text for segment in segments).strip()
+
+class StubBackend(TranscriptionBackend):
+    """
+    A deterministic stand-in for tests and benchmarks: the transcript of a chunk is
+    derived from a hash of its audio, so identical audio gives identical text.
+    """
+
+    provider = 'stub'
+    model = STUB_MODEL
+
+    def __init__(self, batch_size: int = 1):
+        self.batch_size = batch_size
+        self.batches = []  # The chunk paths of every submitted batch
+
+    def transcribe(self, chunk_path) -> str:
+        return f"transcript {hash_file(chunk_path)[:12]}"
+
+    def transcribe_batch(self, chunk_paths: list) -> list[str]:
+        self.batches.append(list(chunk_paths))
+        return super().transcribe_batch(chunk_paths)
+
+class HybridBackend(TranscriptionBackend):
+    """
+    The API with a local engine next to it.
+
+    Recordings up to `local_max_seconds` long are transcribed locally as a whole. For
+    longer ones, chunks go to the API while fewer than `remote_slots` requests are in
+    flight, and overflow to the local engine's `local_slots` workers otherwise, so idle
+    CPU cores add to the API's throughput instead of waiting for it.
+    """
+
+    def __init__(self, remote: TranscriptionBackend, local: TranscriptionBackend, remote_slots: int, local_slots: int,
+                 local_max_seconds: float = 0):
+        self.remote = remote
+        self.local = local
+        self.remote_slots = max(1, remote_slots)
+        self.local_slots = max(1, local_slots)
+        self.local_max_seconds = local_max_seconds
+        self.provider = remote.provider
+        self.model = remote.model
+        self.extra_workers = self.local_slots
+        self._busy = {'remote': 0, 'local': 0}
+        self._condition = threading.Condition()
+
+    @property
+    def models(self) -> tuple:
+        return (self.remote.model, self.local.model)
+
+    def select(self, seconds: float) -> TranscriptionBackend:
+        return self.local if seconds <= self.local_max_seconds else self
+
+    def transcribe(self, chunk_path) -> str:
+        with self.acquire() as engine:
+            return engine.transcribe(chunk_path)
+
+    @contextmanager
+    def acquire(self):
+        with self._condition:
+            while True:
+                if self._busy['remote'] < self.remote_slots:
+                    engine = 'remote'
+                    break
+                if self._busy['local'] < self.local_slots:
+                    engine = 'local'
+                    break
+                self._condition.wait()
+            self._busy[engine] += 1
+        try:
+            yield self.remote if engine == 'remote' else self.local
+        finally:
+            with self._condition:
+                self._busy[engine] -= 1
+                self._condition.notify()
+
+def create_backend(config) -> TranscriptionBackend:
+    """
+    Create the transcription backend selected by `config.transcription_backend`.
+
+    - 'openai': the Whisper API; with `config.local_workers` set, a local engine takes
+      the overflow and recordings up to `config.local_max_seconds` (see HybridBackend),
+    - 'local': only the local faster-whisper engine,
+    - 'stub': deterministic text without any model, for tests and benchmarks.
+
+    Raises:
+        TranscriptionError: If the backend is not supported.
+        ValueError: If the OpenAI API key is not set for the 'openai' backend.
+    """
+    def local(workers: int) -> LocalWhisperBackend:
+        return LocalWhisperBackend(
+            config.local_model, config.local_device, config.local_compute_type, config.local_cpu_threads, workers,
+        )
+
+    if config.transcription_backend == 'openai':
+        if config.local_workers > 0:
+            return HybridBackend(
+                OpenAIBackend(), local(config.local_workers), config.transcription_concurrency, config.local_workers,
+                config.local_max_seconds,
+            )
+        return OpenAIBackend()
+    if config.transcription_backend == 'local':
+        return local(config.transcription_concurrency)
+    if config.transcription_backend == 'stub':
+        return StubBackend()
+    raise TranscriptionError(f"Unsupported transcription backend: {config.transcription_backend} (use 'openai', 'local' or 'stub')")
+
+def transcription_cache_key(chunk_path, model: str = WHISPER_MODEL, digest: str = None) -> str:
+    """Return the cache key of a chunk: the hash of its encoded audio plus the model name."""
+    return f"{model}:{digest or hash_file(chunk_path)}"
+
+def _remove_chunk(chunk_path):
+    if os.path.exists(chunk_path):
+        os.remove(chunk_path)
+
+def transcribe_chunks(backend: TranscriptionBackend, chunks, concurrency: int = 1, retries: int = 0, reservation=None,
+                      journal=None, durations: list = None) -> list[str]:
+    """
+    Transcribe audio chunks, sending up to `concurrency` batches at once.
+
+    `chunks` may be a generator: chunks are submitted as soon as a batch of
+    `backend.batch_size` has been produced, so transcription overlaps with extraction.
+    Transcripts are returned in chunk order regardless of the order in which the
+    requests complete. Each chunk file is removed as soon as it has been transcribed.
+    Batches that fail are retried on their own, up to `retries` extra times. The audio
+    seconds of every transcribed chunk are recorded with the quota accountant under the
+    engine that transcribed it. When a result cache is configured, chunks whose audio has
+    been transcribed before are answered from the cache without calling the backend.
+    With a journal, every transcript is checkpointed as it completes and chunks already
+    in the journal are not transcribed again.
+
+    Args:
+        backend (TranscriptionBackend): The engine chunks are sent to.
+        chunks: Paths to the audio chunk files, in playback order.
+        concurrency (int): Maximum number of batches transcribed at the same time.
+        retries (int): Number of extra attempts for batches that failed.
+        reservation (Reservation): Quota reservation the usage is drawn from (optional).
+        journal (JobJournal): Checkpoint journal of the job (optional).
+        durations (list): The length in seconds of each chunk, as planned (optional;
+            read from the chunk files otherwise, which probes every non-WAV chunk).
+
+    Returns:
+        list[str]: The transcribed text of each chunk, in chunk order.
+
+    Raises:
+        Exception: The last error raised for a chunk that failed on every attempt.
+    """
+    from .audio_processing import audio_duration  # Imported here to avoid circular import
+
+    quota = get_quota()
+    cache = get_cache()
+    completed = journal.completed if journal else {}
+    paths = []
+    digests = {}
+    transcripts = {}
+    errors = {}
+
+    def seconds(i):
+        if durations is not None and i < len(durations):
+            return durations[i]
+        return audio_duration(paths[i])
+
+    def lookup(i):
+        if i in completed:
+            return completed[i]
+        if not cache:
+            return None
+        digests[i] = hash_file(paths[i])
+        for model in backend.models:
+            transcript = cache.get('transcription', transcription_cache_key(paths[i], model, digests[i]))
+            if transcript is not None:
+                logging.info(f"Chunk {i+1} found in cache")
+                return transcript
+        return None
+
+    def transcribe(batch):
+        results = {}
+        for i in batch:
+            transcript = lookup(i)
+            if transcript is not None:
+                results[i] = transcript
+        pending = [i for i in batch if i not in results]
+        if pending:
+            with backend.acquire() as engine:
+                texts = engine.transcribe_batch([paths[i] for i in pending])
+            for i, transcript in zip(pending, texts):
+                logging.info(f"Transcribed chunk {i+1}")
+                quota.record(
+                    engine.provider, engine.model, audio_seconds=seconds(i),
+                    reservation=reservation if reservation and reservation.provider == engine.provider else None,
+                )
+                if cache:
+                    cache.put('transcription', transcription_cache_key(paths[i], engine.model, digests.get(i)), transcript)
+                results[i] = transcript
+        for i in batch:
+            if journal:
+                journal.record(i, results[i])
+            _remove_chunk(paths[i])  # Remove the chunk after transcription
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency) + backend.extra_workers) as executor:
+        futures = {}
+        batch = []
+        for i, chunk in enumerate(chunks):
+            paths.append(chunk)
+            batch.append(i)
+            if len(batch) >= backend.batch_size:
+                futures[executor.submit(transcribe, batch)] = batch
+                batch = []
+        if batch:
+            futures[executor.submit(transcribe, batch)] = batch
+
+        for attempt in range(retries + 1):
+            failed = []
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    transcripts.update(future.result())
+                except Exception as e:
+                    numbers = ", ".join(str(i + 1) for i in batch)
+                    logging.error(f"Error transcribing chunk {numbers} of {len(paths)}: {str(e)}")
+                    for i in batch:
+                        errors[i] = e
+                    failed.append(batch)
+            if not failed or attempt == retries:
+                break
+            failed_chunks = sum(len(batch) for batch in failed)
+            logging.warning(f"Retrying {failed_chunks} failed chunk(s) (attempt {attempt + 2} of {retries + 1})")
+            get_metrics().count('retries', failed_chunks, stage='transcription')
+            futures = {executor.submit(transcribe, batch): batch for batch in sorted(failed)}
+
+    if failed:
+        raise errors[min(min(batch) for batch in failed)]
+    return [transcripts[i] for i in range(len(paths))]
+
+def transcribe_audio(audio_path, concurrency: int = 1, retries: int = 0, streaming: bool = False,
+                     chunk_seconds: int = 60, chunk_format: str = 'flac', chunks=None, journal=None,
+                     ffmpeg_threads: int = 0, backend: TranscriptionBackend = None, ffmpeg=None, chunk_count: int = None,
+                     chunk_durations: list = None, max_bytes: int = 0):
     """
     Transcribe an entire audio file by splitting it into chunks and transcribing each chunk.
 
     Args:
-        audio_path: Path to the audio file to transcribe.
+        audio_path: Path to the audio (or video) file to transcribe.
+        concurrency (int): Maximum number of chunks sent to the API at the same time.
+        retries (int): Number of extra attempts for chunks that failed.
+        streaming (bool): Let FFmpeg cut the input into compressed chunks and start
+            transcribing while it is still running. Otherwise the input must be a WAV
+            file, which is split into WAV chunks first.
+        chunk_seconds (int): Length of each chunk in seconds.
+        chunk_format (str): Chunk encoding used when streaming.
+        chunks: Chunk paths (or a generator of them) produced by another splitter, used
+            instead of splitting `audio_path` here (optional).
+        journal (JobJournal): Checkpoint journal used to resume an interrupted job (optional).
+        ffmpeg_threads (int): Number of threads FFmpeg may use when streaming without `ffmpeg`.
+        backend (TranscriptionBackend): The engine to transcribe with (optional); the
+            OpenAI Whisper API by default.
+        ffmpeg (FFmpegPool): Pool that streaming extraction runs in, sharing its limit on
+            concurrent FFmpeg processes (optional).
+        chunk_count (int): Number of chunks in the plan the audio is cut by, reserved as
+            requests with the quota (optional; estimated from `chunk_seconds` otherwise).
+        chunk_durations (list): The length in seconds of each chunk, for chunks that are
+            not `chunk_seconds` long (optional).
+        max_bytes (int): Upload size limit streamed chunks are re-encoded to fit under
+            when they come out larger (optional; 0 does not check chunk sizes).
 
     Returns:
         str: The full transcription of the audio file.
 
     Raises:
-        ValueError: If the OpenAI API key is not set.
+        ValueError: If no backend is given and the OpenAI API key is not set.
+        QuotaExceededError: If the audio does not fit in the remaining daily Whisper allowance.
         Exception: If there's an error during transcription.
     """
-    from .audio_processing import split_audio  # Move this import here to avoid circular import
+    from .audio_processing import split_audio, extract_audio_chunks, audio_duration  # Move this import here to avoid circular import
+
+    if backend is None:
+        backend = OpenAIBackend()
+    produced = []
+    chunk_dir = None
+
+    def track(chunks):
+        # Remember every chunk handed out so the finally block can clean up after failures
+        for chunk in chunks:
+            produced.append(chunk)
+            yield chunk
 
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    client = OpenAI(api_key=api_key)
     try:
         logging.info(f"Transcribing audio: {os.path.basename(audio_path)}")
-        chunks = split_audio(audio_path)
-        transcripts = []
-        total_tokens = 0
-        
-        for i, chunk in enumerate(chunks):
-            logging.info(f"Transcribing chunk {i+1} of {len(chunks)}")
-            transcript = transcribe_audio_chunk(client, chunk)
-            
-            chunk_tokens = count_tokens(transcript)
-            total_tokens += chunk_tokens
-            logging.info(f"Chunk {i+1} tokens: {chunk_tokens}")
-            
-            transcripts.append(transcript)
-            os.remove(chunk)  # Remove the chunk after transcription
-        
+        total_seconds = audio_duration(audio_path)
+        backend = backend.select(total_seconds)
+        reservation = get_quota().reserve(
+            backend.provider, requests=chunk_count or math.ceil(total_seconds / chunk_seconds), audio_seconds=total_seconds,
+        )
+        with reservation:
+            if chunks is None and streaming:
+                chunk_dir = tempfile.TemporaryDirectory(prefix='transcriber_')
+                chunks = extract_audio_chunks(
+                    Path(audio_path), Path(chunk_dir.name), chunk_seconds, chunk_format, ffmpeg_threads, ffmpeg, max_bytes,
+                )
+            elif chunks is None:
+                chunks = split_audio(audio_path, chunk_seconds * 1000)
+            logging.info(f"Transcribing {total_seconds:.0f}s of audio with {backend.model}, {concurrency} chunks at a time")
+            if chunk_durations is None:
+                # Fixed-length chunks: only the last one is shorter
+                chunk_durations = [
+                    min(chunk_seconds, total_seconds - i * chunk_seconds) for i in range(math.ceil(total_seconds / chunk_seconds))
+                ]
+            transcripts = transcribe_chunks(
+                backend, track(chunks), concurrency, retries, reservation, journal, chunk_durations,
+            )
+
+        chunk_tokens = count_tokens_batch(transcripts)
+        for i, tokens in enumerate(chunk_tokens):
+            logging.info(f"Chunk {i+1} tokens: {tokens}")
+        total_tokens = sum(chunk_tokens)
+
         full_transcript = " ".join(transcripts)
         logging.info(f"Transcription completed successfully. Total tokens: {total_tokens}")
         return full_transcript
@@ -68,6 +449,7 @@ def transcribe_audio(audio_path):
         logging.error(f"Error transcribing audio: {str(e)}")
         raise
     finally:
-        for chunk in chunks:
-            if os.path.exists(chunk):
-                os.remove(chunk)
\ No newline at end of file
+        for chunk in produced:
+            _remove_chunk(chunk)
+        if chunk_dir is not None:
+            chunk_dir.cleanup()
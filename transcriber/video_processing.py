@@ -1,19 +1,23 @@
 import logging
 from pathlib import Path
 from .file_handler import FileHandler
-from .audio_processing import convert_video_to_audio
-from .transcription import transcribe_audio
-from .exceptions import VideoProcessingError
-from .token_utils import count_tokens
+from .audio_processing import transcribe_media, save_timestamp_map
+from .exceptions import VideoProcessingError, QuotaExceededError
 from .refinement_processing import process_with_refinement  # Update this import
 
-def process_file(video_path: Path, output_dir: Path) -> Path:
+def process_file(video_path: Path, output_dir: Path, config: 'Config', audio_path: Path = None, ffmpeg=None) -> Path:
     """
     Process a single video file: convert to audio, transcribe, and save the transcript.
 
+    How the audio is extracted and split is set by `config.audio_extraction`; see
+    `transcribe_media`.
+
     Args:
         video_path (Path): Path to the input video file.
         output_dir (Path): Directory to save the output files.
+        config (Config): Configuration object containing transcription settings.
+        audio_path (Path): WAV file already produced by `extract_media_audio` (optional).
+        ffmpeg (FFmpegPool): Pool that 'segment' extraction runs in (optional).
 
     Returns:
         Path: Path to the saved transcript file.
@@ -23,27 +27,25 @@ def process_file(video_path: Path, output_dir: Path) -> Path:
     """
     logging.info(f"Processing file: {video_path.name}")
     safe_base_name = FileHandler.safe_filename(video_path.stem)
-    audio_path = output_dir / f"{safe_base_name}_audio.wav"
     transcript_path = output_dir / f"{safe_base_name}.md"
 
     try:
-        convert_video_to_audio(video_path, audio_path)
-        transcript = transcribe_audio(audio_path)
+        transcript, timestamp_map, journal = transcribe_media(video_path, output_dir, config, audio_path, ffmpeg)
         
-        total_tokens = count_tokens(transcript)
+        # The token total was already logged by transcribe_audio; counting again would re-encode the transcript
         logging.info(f"Saving transcription to: {transcript_path}")
-        logging.info(f"Total tokens in transcription: {total_tokens}")
         
         FileHandler.write_file(transcript_path, f"# Transcription: {video_path.name}\n\n{transcript}")
+        if timestamp_map is not None:
+            save_timestamp_map(transcript_path, timestamp_map)
+        journal.discard()
         
         logging.info("Transcription saved successfully")
         return transcript_path
+    except QuotaExceededError:
+        raise
     except Exception as e:
         raise VideoProcessingError(f"Error processing {video_path}: {str(e)}")
-    finally:
-        if audio_path.exists():
-            logging.info(f"Removing temporary audio file: {audio_path}")
-            audio_path.unlink()
 
 def process_directory(input_dir: Path, output_dir: Path, config: 'Config'):
     """
@@ -66,7 +68,7 @@ def process_directory(input_dir: Path, output_dir: Path, config: 'Config'):
     logging.info(f"Found {len(video_files)} video files")
 
     for video_path in video_files:
-        transcript_path = process_file(video_path, output_dir)
+        transcript_path = process_file(video_path, output_dir, config)
         if transcript_path and config.instructions_path:
             refined_path = output_dir / f"{video_path.stem}_refined.md"
             logging.info(f"Refining transcript with AI")
@@ -0,0 +1,289 @@
+import asyncio
+import ctypes
+import logging
+import os
+import select
+import signal
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+from .config import Config
+from .manifest import Manifest, is_media, scan_media
+
+# inotify(7) event flags
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ATTRIB | IN_MOVED_FROM | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+class Inotify:
+    """
+    A minimal binding of Linux inotify through ctypes, so watching needs no extra package.
+
+    Every directory of a tree gets its own watch, as inotify does not recurse.
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)  # The C library the interpreter is linked against
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}  # Watch descriptor -> directory
+
+    def add_tree(self, root: Path) -> None:
+        """Watch a directory and every directory below it, except hidden ones."""
+        for directory, subdirectories, _ in os.walk(root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {directory} (see fs.inotify.max_user_watches)")
+            self._directories[wd] = Path(directory)
+
+    def read(self, timeout: float) -> list[tuple[Path, int]]:
+        """
+        Wait up to `timeout` seconds for events.
+
+        Returns:
+            list[tuple[Path, int]]: The path and mask of each event; the path is None for
+            a queue overflow, after which events were lost.
+        """
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif mask & IN_IGNORED:
+                self._directories.pop(wd, None)  # The directory was deleted, or moved off the file system
+            elif wd in self._directories:
+                events.append((self._directories[wd] / os.fsdecode(name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class DirectoryWatcher:
+    """
+    Watch directory trees and yield each media file once it has been completely written.
+
+    On Linux, inotify reports new and finished files right away; elsewhere, or with
+    `poll`, the trees are rescanned every `poll_seconds`. Either way a file is only
+    handed out once its size and modification time have not changed for
+    `settle_seconds`, so recordings that are still being copied or written are not
+    picked up half-finished. Files already in the directories are handed out too, and
+    with a manifest, files whose processing finished earlier are skipped.
+    """
+
+    def __init__(self, roots: list[Path], include: list[str] = None, exclude: list[str] = None, manifest: Manifest = None,
+                 settle_seconds: float = 2.0, poll_seconds: float = 2.0, poll: bool = False, ignore: list[Path] = None,
+                 clock=time.monotonic):
+        self.roots = [Path(root).resolve() for root in roots]
+        self.include = include or []
+        self.exclude = exclude or []
+        self.manifest = manifest
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.ignore = [Path(path).resolve() for path in ignore or []]
+        self._clock = clock
+        self._stop = threading.Event()
+        self._candidates = {}  # Path -> (size, mtime_ns, unchanged since)
+        self._handed_out = {}  # Path -> (size, mtime_ns) when it was handed out
+        self._inotify = None
+        if not poll:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                logging.info(f"Falling back to polling: {str(e)}")
+
+    def stop(self) -> None:
+        """Make `files` return; it notices within a second. Safe to call from any thread or signal handler."""
+        self._stop.set()
+
+    def _wanted(self, path: Path) -> bool:
+        for root in self.roots:
+            if path.is_relative_to(root):
+                if any(path.is_relative_to(ignored) for ignored in self.ignore):
+                    return False
+                return is_media(path.relative_to(root).as_posix(), self.include, self.exclude)
+        return False
+
+    def _consider(self, path: Path, stat: os.stat_result) -> None:
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._handed_out.get(path) == signature:
+            return
+        candidate = self._candidates.get(path)
+        if candidate is None or candidate[:2] != signature:
+            self._candidates[path] = (*signature, self._clock())
+
+    def _forget(self, path: Path) -> None:
+        """Drop a deleted or moved file, or everything below a deleted or moved directory."""
+        for known in (self._candidates, self._handed_out):
+            for other in [other for other in known if other.is_relative_to(path)]:
+                del known[other]
+
+    def _scan(self) -> None:
+        seen = set()
+        for root in self.roots:
+            for path, stat in scan_media(root, self.include, self.exclude, ignore=self.ignore):
+                if self._wanted(path):
+                    seen.add(path)
+                    self._consider(path, stat)
+        for path in self._handed_out.keys() - seen:
+            del self._handed_out[path]  # Deleted or moved away, so a long-running watcher does not accumulate them
+
+    def _settled(self) -> list[Path]:
+        ready = []
+        now = self._clock()
+        for path, (size, mtime_ns, since) in list(self._candidates.items()):
+            if now - since < self.settle_seconds:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self._candidates[path]  # Removed or renamed before it settled
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._candidates[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            del self._candidates[path]
+            self._handed_out[path] = (size, mtime_ns)
+            if stat.st_size and (self.manifest is None or self.manifest.needs_work(path)):
+                ready.append(path)
+        return sorted(ready)
+
+    def _timeout(self) -> float:
+        if self._inotify is None:
+            return self.poll_seconds
+        if not self._candidates:
+            return 1.0  # Wake up regularly to notice `stop`
+        earliest = min(since for _, _, since in self._candidates.values())
+        return min(1.0, max(0.05, earliest + self.settle_seconds - self._clock()))
+
+    def _wait(self) -> bool:
+        """Wait for changes; return whether the trees need a full rescan."""
+        if self._inotify is None:
+            self._stop.wait(self._timeout())
+            return True
+        rescan = False
+        for path, mask in self._inotify.read(self._timeout()):
+            if path is None:
+                logging.warning("Missed file system events; rescanning the watched directories")
+                rescan = True
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget(path)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not path.name.startswith('.'):
+                    self._inotify.add_tree(path)
+                    rescan = True  # Files may have arrived before the new directory was watched
+            elif self._wanted(path):
+                try:
+                    self._consider(path, path.stat())
+                except FileNotFoundError:
+                    self._candidates.pop(path, None)
+        return rescan
+
+    def files(self) -> Iterator[Path]:
+        """
+        Yield settled media files until `stop` is called.
+
+        Yields:
+            Path: Each new or changed file, once it is completely written.
+        """
+        try:
+            if self._inotify is not None:
+                for root in self.roots:
+                    self._inotify.add_tree(root)  # Before the first scan, so no file slips between the two
+            rescan = True
+            while not self._stop.is_set():
+                if rescan:
+                    self._scan()
+                yield from self._settled()
+                rescan = self._wait()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+async def watch_directories(directories: list[Path], output_dir: Path, instructions_path: Path, config: Config,
+                            poll: bool = False, on_queued=None, on_file_done=None, watcher: DirectoryWatcher = None) -> None:
+    """
+    Process every recording dropped into the directories until interrupted.
+
+    Settled files from a DirectoryWatcher feed a single long-running pipeline (see
+    `pipeline.run_pipeline`), so API clients, their open connections, the tokenizer
+    and, for local transcription, the Whisper model are loaded once and stay warm
+    between files. SIGINT and SIGTERM stop the watcher; files already queued are
+    finished before the function returns, unless a second signal interrupts them.
+
+    Args:
+        directories (list[Path]): The directories to watch.
+        output_dir (Path): Directory to save all output files.
+        instructions_path (Path): Path to the instructions file for refinement.
+        config (Config): Configuration object.
+        poll (bool): Rescan the directories instead of using inotify, e.g. on network shares.
+        on_queued: Called with each file as it enters the pipeline (optional).
+        on_file_done: Called with each file as it leaves the pipeline (optional).
+        watcher (DirectoryWatcher): The watcher to take files from (optional); one is
+            created from the configuration by default.
+    """
+    from .pipeline import run_pipeline
+    from .token_utils import count_tokens
+
+    count_tokens("")  # Load the tokenizer before the first file arrives
+    manifest = Manifest(config.cache_dir / 'manifest.sqlite')
+    if watcher is None:
+        watcher = DirectoryWatcher(
+            directories, config.scan_include, config.scan_exclude, manifest,
+            config.watch_settle_seconds, config.watch_poll_seconds, poll, ignore=[output_dir],
+        )
+    loop = asyncio.get_running_loop()
+    handled = []
+
+    def shut_down():
+        logging.warning("Stopping: finishing the files already queued (interrupt again to abort)")
+        watcher.stop()
+        for signum in handled:
+            loop.remove_signal_handler(signum)  # A second signal gets the default behaviour
+        handled.clear()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, shut_down)
+            handled.append(signum)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # Not in the main thread, or not supported on this platform
+
+    def queued():
+        for path in watcher.files():
+            logging.info(f"Queued {path}")
+            if on_queued:
+                on_queued(path)
+            yield path
+
+    try:
+        await run_pipeline(queued(), output_dir, instructions_path, config, manifest=manifest, on_file_done=on_file_done)
+    finally:
+        for signum in handled:
+            loop.remove_signal_handler(signum)